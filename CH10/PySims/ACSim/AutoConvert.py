@@ -6,6 +6,8 @@
 # by J. M. Hughes, published by O'Reilly Media, December 2010,
 # ISBN 978-0-596-80956-0.
 #-------------------------------------------------------------------------------
+from __future__ import print_function
+
 def AutoConvert(input):
     """ Attempts to identify and convert any type of input to a standard
         Python type.
@@ -74,18 +76,18 @@ def AutoConvert(input):
 
 
 if __name__ == "__main__":
-    print "%s  %s" % AutoConvert("T")
-    print "%s  %s" % AutoConvert("F")
-    print "%s  %s" % AutoConvert("t")
-    print "%s  %s" % AutoConvert("f")
-    print "%s  %s" % AutoConvert("[0, 4, 1, 8]")
-    print "%s  %s" % AutoConvert("5.5")
-    print "%s  %s" % AutoConvert("-2")
-    print "%s  %s" % AutoConvert("42")
-    print "%s  %s" % AutoConvert("Spam, spam, spam")
-    print "%s  %s" % AutoConvert("(1, 2, 3)")
-    print "%s  %s" % AutoConvert("{1: 'fee', 2: 'fie', 3: 'foe'}")
-    print "%s  %s" % AutoConvert(1)
-    print "%s  %s" % AutoConvert(99.98)
-    print "%s  %s" % AutoConvert([1, 2,])
-    print "%s  %s" % AutoConvert((9, 8, 7))
\ No newline at end of file
+    print("%s  %s" % AutoConvert("T"))
+    print("%s  %s" % AutoConvert("F"))
+    print("%s  %s" % AutoConvert("t"))
+    print("%s  %s" % AutoConvert("f"))
+    print("%s  %s" % AutoConvert("[0, 4, 1, 8]"))
+    print("%s  %s" % AutoConvert("5.5"))
+    print("%s  %s" % AutoConvert("-2"))
+    print("%s  %s" % AutoConvert("42"))
+    print("%s  %s" % AutoConvert("Spam, spam, spam"))
+    print("%s  %s" % AutoConvert("(1, 2, 3)"))
+    print("%s  %s" % AutoConvert("{1: 'fee', 2: 'fie', 3: 'foe'}"))
+    print("%s  %s" % AutoConvert(1))
+    print("%s  %s" % AutoConvert(99.98))
+    print("%s  %s" % AutoConvert([1, 2,]))
+    print("%s  %s" % AutoConvert((9, 8, 7)))
\ No newline at end of file
@@ -0,0 +1,175 @@
+#! /usr/bin/python
+#-------------------------------------------------------------------------------
+# LoadModel.py
+#-------------------------------------------------------------------------------
+# A simple model of the current drawn by the loads on a set of AC channels,
+# and of the inverse-time trip behaviour of their electronic circuit breakers
+# (ECBs).
+#
+# When a channel is switched on its load draws an inrush current, several
+# times its steady-state current, which dies away exponentially. A little
+# random noise is added to the current on every tick.
+#
+# Each ECB follows the IEC "standard inverse" curve: at a current I above the
+# limit Is it trips after
+#
+#     t = TMS * K / ((I / Is)**ALPHA - 1)
+#
+# seconds. A short inrush is tolerated, while a sustained overload trips the
+# ECB in a second or so. The time spent over the limit is accumulated as a
+# fraction of the trip time, up to 1 (the trip point), and decays again (the
+# breaker "cools") whenever the current is below the limit or the channel is
+# off.
+#
+# The state of every channel is held in NumPy arrays, and each tick is
+# computed for all the channels at once, so hundreds of channels can be
+# modelled with no Python loop over the channels.
+#
+# NumPy is required.
+#-------------------------------------------------------------------------------
+# Example source code for the book "Real-World Instrumentation with Python"
+# by J. M. Hughes, published by O'Reilly Media, December 2010,
+# ISBN 978-0-596-80956-0.
+#-------------------------------------------------------------------------------
+from __future__ import print_function
+
+import binascii
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+TICK        = 0.01      # model time step in seconds
+STEADY_AMPS = 1.0       # default steady-state load current
+INRUSH      = 6.0       # inrush peak as a multiple of the steady-state current
+INRUSH_TIME = 0.05      # inrush decay time constant in seconds
+NOISE       = 0.02      # current noise, as a fraction of the current
+
+# trip curve constants (IEC 60255 standard inverse)
+K           = 0.14
+ALPHA       = 0.02
+TMS         = 0.1       # time multiplier setting
+COOL_TIME   = 5.0       # decay time constant of the trip accumulator
+
+
+def maskToArray(mask, nchan):
+    """ Converts a channel bit mask (channel 1 in bit 0) to a boolean array
+        of nchan elements.
+    """
+    nbytes = (nchan + 7) // 8
+    raw = binascii.unhexlify("%0*x" % (nbytes * 2, mask))
+    bits = np.unpackbits(np.frombuffer(raw, dtype=np.uint8))
+    return bits[::-1][:nchan].astype(bool)
+
+
+def arrayToMask(flags):
+    """ Converts a boolean array to a channel bit mask (element 0 in bit 0).
+    """
+    nbytes = (len(flags) + 7) // 8
+    bits = np.zeros(nbytes * 8, dtype=np.uint8)
+    bits[:len(flags)] = flags
+    return int(binascii.hexlify(np.packbits(bits[::-1]).tobytes()), 16)
+
+
+class LoadModel:
+    """ The load currents and ECB trip state of nchan channels.
+
+        Channels are numbered from 0 here. Call step() once per tick with
+        the channels that are powered and their current limits.
+    """
+    def __init__(self, nchan, tick=TICK, steady=STEADY_AMPS, inrush=INRUSH,
+                 noise=NOISE, seed=None):
+        self.nchan    = nchan
+        self.tick     = tick
+        self.inrush   = inrush
+        self.noise    = noise
+        self.steady   = np.full(nchan, steady, dtype=np.float64)
+        self.on_time  = np.zeros(nchan)     # seconds since powered on
+        self.current  = np.zeros(nchan)     # load current in amps
+        self.trip_acc = np.zeros(nchan)     # fraction of the trip time used
+        self.rng      = np.random.RandomState(seed)
+
+        self.cool_decay = np.exp(-tick / COOL_TIME)
+
+
+    def setLoad(self, chan, amps):
+        """ Sets the steady-state current of channel chan, or of all the
+            channels if chan is None.
+        """
+        if chan is None:
+            self.steady[:] = amps
+        else:
+            self.steady[chan] = amps
+
+
+    def step(self, powered, limits):
+        """ Advances the model by one tick.
+
+            powered is a boolean array of the channels that are switched on
+            with their ECBs OK, and limits is an array (or any buffer of
+            doubles) of their current limits. A limit of zero trips the ECB
+            as soon as the channel draws any current.
+
+            Returns a boolean array of the channels whose ECBs trip.
+        """
+        limits = np.frombuffer(limits, dtype=np.float64)
+
+        # the inrush part of the current starts at (inrush - 1) times the
+        # steady current when the channel is switched on, and dies away
+        self.on_time = np.where(powered, self.on_time + self.tick, 0.0)
+        surge = (self.inrush - 1.0) * np.exp(-self.on_time / INRUSH_TIME)
+        current = self.steady * (1.0 + surge)
+        if self.noise > 0:
+            current *= 1.0 + self.noise * self.rng.standard_normal(self.nchan)
+        current = np.where(powered, np.abs(current), 0.0)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = current / limits
+            over = ratio > 1.0
+            rate = (ratio ** ALPHA - 1.0) / (TMS * K)
+            self.trip_acc = np.where(over, self.trip_acc + rate * self.tick,
+                                     self.trip_acc * self.cool_decay)
+        # stop at the trip point, so that a breaker tripped by a large (or,
+        # with a zero limit, infinite) overload still cools and can be reset
+        np.minimum(self.trip_acc, 1.0, out=self.trip_acc)
+
+        self.current = current
+        tripped = powered & (self.trip_acc >= 1.0)
+        # a tripped ECB stops the current
+        self.current[tripped] = 0.0
+        return tripped
+
+
+if __name__ == "__main__":
+    import time
+
+    nchan = 512
+    model = LoadModel(nchan, seed=1)
+    limits = np.full(nchan, 2.0)
+    # channels 0-255 normal load, 256-383 1.5x overload, 384-511 3x overload
+    model.steady[256:384] = 3.0
+    model.steady[384:] = 6.0
+
+    powered = np.ones(nchan, dtype=bool)
+    trip_tick = np.zeros(nchan, dtype=int)
+    ticks = int(5.0 / model.tick)
+
+    tstart = time.time()
+    for n in range(1, ticks + 1):
+        tripped = model.step(powered, limits)
+        trip_tick[tripped] = n
+        powered &= ~tripped
+    elapsed = time.time() - tstart
+
+    print("%d channels, %d ticks in %.3f s, %.1f us per tick" %
+          (nchan, ticks, elapsed, elapsed / ticks * 1e6))
+    for name, lo, hi in (("1.0 A", 0, 256), ("3.0 A", 256, 384),
+                         ("6.0 A", 384, 512)):
+        trips = trip_tick[lo:hi]
+        if trips.max() == 0:
+            print("  %s on 2.0 A limit: no trips" % name)
+        else:
+            print("  %s on 2.0 A limit: %d tripped, after %.2f s to %.2f s" %
+                  (name, (trips > 0).sum(), trips[trips > 0].min() * model.tick,
+                   trips.max() * model.tick))
@@ -0,0 +1,105 @@
+#! /usr/bin/python
+#-------------------------------------------------------------------------------
+# PTYLink.py
+#-------------------------------------------------------------------------------
+# A pseudo-terminal "null modem" cable.
+#
+# PTYLink creates two pseudo-terminals and copies everything written to one
+# of them to the other, just like the com0com or tty0tty virtual null modem
+# drivers. Each end has an ordinary device path (/dev/pts/N), so a serial
+# program such as SPCSim can open one end with pySerial, and a terminal
+# emulator or test program can open the other, without any serial hardware
+# or extra drivers.
+#
+# Only available on systems that support pseudo-terminals (Linux, the BSDs,
+# Mac OS X and so on).
+#-------------------------------------------------------------------------------
+# Example source code for the book "Real-World Instrumentation with Python"
+# by J. M. Hughes, published by O'Reilly Media, December 2010,
+# ISBN 978-0-596-80956-0.
+#-------------------------------------------------------------------------------
+from __future__ import print_function
+
+import os
+import select
+import threading
+
+try:
+    import tty
+except ImportError:
+    tty = None
+
+BUF_SIZE = 4096
+
+
+def PTYAvailable():
+    """ Returns True if pseudo-terminals are supported.
+    """
+    return tty != None and hasattr(os, "openpty")
+
+
+class PTYLink(threading.Thread):
+    """ Connects two pseudo-terminals back to back.
+
+        The device paths of the two ends are sim_path and client_path. By
+        convention the simulator opens sim_path, but the two ends are
+        identical.
+    """
+    def __init__(self):
+        threading.Thread.__init__(self)
+        self.daemon = True
+
+        self.masters = []
+        self.slaves  = []
+        for i in range(0, 2):
+            mfd, sfd = os.openpty()
+            # no echo or line editing until a program sets up the port
+            tty.setraw(sfd)
+            self.masters.append(mfd)
+            # The slave side is kept open, otherwise reading the master
+            # fails whenever neither program has the port open.
+            self.slaves.append(sfd)
+
+        self.sim_path    = os.ttyname(self.slaves[0])
+        self.client_path = os.ttyname(self.slaves[1])
+
+        # written to by stop() to wake up the copy loop
+        self.wake_r, self.wake_w = os.pipe()
+        self.stop_link = False
+
+
+    def run(self):
+        """ Copies data between the two pseudo-terminals until stop() is
+            called.
+        """
+        peer = {self.masters[0]: self.masters[1],
+                self.masters[1]: self.masters[0]}
+
+        while not self.stop_link:
+            ready, w, x = select.select(self.masters + [self.wake_r], [], [])
+            for fd in ready:
+                if fd == self.wake_r:
+                    continue
+                try:
+                    data = os.read(fd, BUF_SIZE)
+                except OSError:
+                    continue
+                if len(data) > 0:
+                    os.write(peer[fd], data)
+
+
+    def stop(self):
+        """ Stops copying data and closes the pseudo-terminals.
+        """
+        self.stop_link = True
+        os.write(self.wake_w, b"x")
+        if self.is_alive():
+            self.join()
+
+        for fd in self.masters + self.slaves + [self.wake_r, self.wake_w]:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self.masters = []
+        self.slaves  = []
@@ -0,0 +1,159 @@
+#! /usr/bin/python
+#-------------------------------------------------------------------------------
+# SPCBench.py
+#-------------------------------------------------------------------------------
+# Command round-trip latency benchmark for SPCSim.
+#
+# Sends a command to SPCSim over a serial port, waits for the response and
+# the next prompt, and repeats. The round-trip times are reported as
+# percentiles, along with the number of commands per second.
+#
+# By default a simulator is started in a separate process in PTY mode, so
+# the benchmark runs through the full serial I/O code path on any Linux
+# machine without serial hardware. Use -p to test a simulator that's already
+# running on a serial port, or a SPCFleet device with a pySerial URL such as
+# socket://localhost:5000.
+#-------------------------------------------------------------------------------
+# Example source code for the book "Real-World Instrumentation with Python"
+# by J. M. Hughes, published by O'Reilly Media, December 2010,
+# ISBN 978-0-596-80956-0.
+#-------------------------------------------------------------------------------
+from __future__ import print_function
+
+import sys
+import time
+import getopt
+import multiprocessing
+
+import serial
+
+import SPCSim
+
+PROMPT   = b"> "
+TIMEOUT  = 5.0      # seconds to wait for a response
+PCTS     = (50, 90, 99, 99.9)
+
+
+def runPTYSim(conn):
+    """ Runs a simulator in PTY mode, first sending the device path of the
+        client end of the link back through conn.
+    """
+    sim = SPCSim.SPCSim(iomode=SPCSim.PTY)
+    if sim.pty_link == None:
+        conn.send(None)
+        return
+    conn.send(sim.pty_link.client_path)
+    conn.close()
+    sim.RunSim()
+
+
+def readPrompt(sport):
+    """ Reads from the serial port until a prompt is seen.
+
+        Returns the data read, or None on a timeout.
+    """
+    data = b""
+    tend = time.time() + TIMEOUT
+    while not data.endswith(PROMPT):
+        if time.time() > tend:
+            return None
+        waiting = sport.in_waiting
+        data += sport.read(max(1, waiting))
+    return data
+
+
+def percentile(sorted_vals, pct):
+    """ Returns a percentile of a sorted list of values.
+    """
+    idx = int(round(pct / 100.0 * (len(sorted_vals) - 1)))
+    return sorted_vals[idx]
+
+
+def runBench(port, count, command, warmup=100):
+    """ Sends a command count times and measures the round-trip times.
+
+        Returns a sorted list of the round-trip times in seconds, and the
+        total elapsed time.
+    """
+    sport = serial.serial_for_url(port, baudrate=115200, timeout=TIMEOUT)
+    try:
+        # get a fresh prompt, skipping any start-up messages
+        sport.write(b"\r")
+        readPrompt(sport)
+
+        cmd = command.encode("ascii") + b"\r"
+        for i in range(0, warmup):
+            sport.write(cmd)
+            readPrompt(sport)
+
+        times = []
+        tstart = time.time()
+        for i in range(0, count):
+            t0 = time.time()
+            sport.write(cmd)
+            if readPrompt(sport) == None:
+                print("No response to command %d" % i)
+                break
+            times.append(time.time() - t0)
+        elapsed = time.time() - tstart
+    finally:
+        sport.close()
+
+    times.sort()
+    return times, elapsed
+
+
+def usage():
+    print("Usage: SPCBench [options]")
+    print("       Options:")
+    print("         -p  Serial port or pySerial URL of a running simulator")
+    print("             (default is to start one in PTY mode)")
+    print("         -n  Number of commands (default is 10000)")
+    print("         -c  Command to send (default is 'CHK 0')")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    port = None
+    count = 10000
+    command = "CHK 0"
+
+    try:
+        clopts, clargs = getopt.getopt(sys.argv[1:], 'p:n:c:')
+    except getopt.GetoptError as err:
+        print(str(err))
+        usage()
+
+    for opt, arg in clopts:
+        if opt == "-p":
+            port = arg
+        elif opt == "-n":
+            count = int(arg)
+        elif opt == "-c":
+            command = arg
+
+    simproc = None
+    if port == None:
+        parent_conn, child_conn = multiprocessing.Pipe()
+        simproc = multiprocessing.Process(target=runPTYSim, args=(child_conn,))
+        simproc.start()
+        port = parent_conn.recv()
+        if port == None:
+            print("Could not start the simulator in PTY mode")
+            simproc.join()
+            sys.exit(1)
+
+    times, elapsed = runBench(port, count, command)
+
+    if simproc != None:
+        sport = serial.Serial(port=port, timeout=TIMEOUT)
+        sport.write(b"QUIT\r")
+        sport.close()
+        simproc.join(TIMEOUT)
+
+    if len(times) > 0:
+        print("%d x '%s' in %.3f s, %.0f commands/s" %
+              (len(times), command, elapsed, len(times) / elapsed))
+        for pct in PCTS:
+            print("  p%-5s %8.1f us" % (pct, percentile(times, pct) * 1e6))
+        print("  max    %8.1f us" % (times[-1] * 1e6))
@@ -0,0 +1,281 @@
+#! /usr/bin/python
+#-------------------------------------------------------------------------------
+# SPCFleet.py
+#-------------------------------------------------------------------------------
+# Simulates a rack of SPC power controllers in a single process.
+#
+# Each device is an ordinary SPCSim object with its own channel state, but
+# instead of running its own blocking command loop it is driven by a TCP
+# server on a shared asyncio event loop. The devices can be reached in one of
+# two ways:
+#
+#   One port per device (-P)
+#       Device n listens on port + n - 1, and behaves like the serial
+#       interface: the responses to each command are sent as CR-LF
+#       terminated lines followed by a "> " prompt.
+#
+#   Multiplexed (the default)
+#       All the devices share one port. Each command line starts with a
+#       device ID, for example "17 CHK 0". Each response line is sent as
+#       "17: <response>", and the end of the responses to a command is
+#       marked by the line "17> ". Commands for different devices can be
+#       sent without waiting for the earlier ones to be answered.
+#
+# Commands may end with CR, LF or CR-LF. A QUIT command closes the client's
+# connection, rather than stopping the simulator.
+#
+# Power sequences and the load model run on timers on the event loop, so a
+# device only uses CPU time when it receives a command or a sequence step or
+# model tick is due. Requires
+# Python 3.7 or later.
+#-------------------------------------------------------------------------------
+# Example source code for the book "Real-World Instrumentation with Python"
+# by J. M. Hughes, published by O'Reilly Media, December 2010,
+# ISBN 978-0-596-80956-0.
+#-------------------------------------------------------------------------------
+import gc
+import re
+import sys
+import time
+import getopt
+import asyncio
+import functools
+import tracemalloc
+
+import SPCSim
+
+READ_SIZE = 4096
+EOL       = re.compile(b"[\r\n]")
+
+
+class FleetDevice(SPCSim.SPCSim):
+    """ An SPCSim device state for use in a fleet.
+
+        The responses to each command are collected in resp_buf, instead of
+        being written to the console or a serial port. Error messages are
+        collected in msg_buf and dropped, since a client of the serial
+        interface wouldn't see them either, and printing them on the
+        event loop would hold up every device. Batches still return them
+        in their "msg" lists.
+    """
+    def __init__(self, dev_id):
+        self.dev_id = dev_id
+        SPCSim.SPCSim.__init__(self, iomode=SPCSim.CONSOLE, banner=False)
+
+
+class SPCFleet:
+    """ A set of simulated devices sharing one asyncio event loop.
+
+        Devices are numbered from 1 to count.
+    """
+    def __init__(self, count):
+        self.devices = {}
+        for n in range(1, count + 1):
+            self.devices[n] = FleetDevice(n)
+
+        # power sequence timers, {device ID: asyncio.TimerHandle}
+        self.timers  = {}
+        self.servers = []
+        self.loop    = None
+
+
+    def runCommand(self, dev, instr):
+        """ Dispatches one command, or a batch of commands separated by
+            semicolons, to a device.
+
+            Returns a list of the response strings.
+        """
+        dev.resp_buf = []
+        dev.msg_buf  = []
+        try:
+            if ';' in instr:
+                dev.SendBatch(dev.RunBatch(instr))
+            else:
+                dev.Dispatch(instr)
+        finally:
+            resp = dev.resp_buf
+            dev.resp_buf = None
+            dev.msg_buf  = None
+        self.schedule(dev)
+        return resp
+
+
+    def schedule(self, dev):
+        """ Runs any power sequence steps or load model ticks that are due
+            for a device, and sets a timer for the next one.
+        """
+        handle = self.timers.pop(dev.dev_id, None)
+        if handle != None:
+            handle.cancel()
+
+        timeout = dev.timerPoll()
+        if timeout != None:
+            self.timers[dev.dev_id] = self.loop.call_later(timeout,
+                                                           self.schedule, dev)
+
+
+    async def readLines(self, reader):
+        """ Generator that returns each non-empty line received from a
+            client, as a string.
+        """
+        buf = b""
+        while True:
+            data = await reader.read(READ_SIZE)
+            if len(data) == 0:
+                return
+            lines = EOL.split(buf + data)
+            buf = lines.pop()
+            for line in lines:
+                if len(line) > 0:
+                    yield line.decode("ascii", "replace")
+
+
+    async def servePort(self, dev, reader, writer):
+        """ Handles a client connection to a device's own port.
+        """
+        try:
+            writer.write(b"> ")
+            async for instr in self.readLines(reader):
+                resp = self.runCommand(dev, instr)
+                if dev.stop_main:
+                    dev.stop_main = False
+                    break
+                writer.write(("".join([r + "\r\n" for r in resp]) +
+                              "> ").encode("ascii"))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+    async def serveMux(self, reader, writer):
+        """ Handles a client connection to the multiplexed port.
+        """
+        try:
+            async for line in self.readLines(reader):
+                fields = line.split(None, 1)
+                if len(fields) == 0:
+                    continue
+
+                dev = None
+                try:
+                    dev = self.devices.get(int(fields[0]))
+                except ValueError:
+                    pass
+
+                if dev == None:
+                    # no such device, so just the error response
+                    resp = ["%d" % SPCSim.ERR]
+                elif len(fields) < 2:
+                    resp = self.runCommand(dev, "")
+                else:
+                    resp = self.runCommand(dev, fields[1])
+                    if dev.stop_main:
+                        dev.stop_main = False
+                        break
+
+                writer.write(("".join(["%s: %s\r\n" % (fields[0], r) for r in resp]) +
+                              "%s> \r\n" % fields[0]).encode("ascii"))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+    async def start(self, host, port, per_port=False):
+        """ Starts listening for connections, on one port per device or on
+            a single multiplexed port.
+        """
+        self.loop = asyncio.get_running_loop()
+        if per_port:
+            for n, dev in sorted(self.devices.items()):
+                server = await asyncio.start_server(
+                                functools.partial(self.servePort, dev),
+                                host, port + n - 1)
+                self.servers.append(server)
+        else:
+            server = await asyncio.start_server(self.serveMux, host, port)
+            self.servers.append(server)
+
+
+    async def serve(self, host, port, per_port=False):
+        """ Runs the fleet until it is cancelled.
+        """
+        await self.start(host, port, per_port)
+        try:
+            await asyncio.gather(*[s.serve_forever() for s in self.servers])
+        finally:
+            self.stop()
+
+
+    def stop(self):
+        """ Closes the servers and cancels any power sequence timers.
+        """
+        for server in self.servers:
+            server.close()
+        self.servers = []
+        for handle in self.timers.values():
+            handle.cancel()
+        self.timers = {}
+
+
+def usage():
+    print("Usage: SPCFleet [options]")
+    print("       Options:")
+    print("         -n  Number of devices (default is 500)")
+    print("         -H  Host address to listen on (default is 127.0.0.1)")
+    print("         -p  TCP port, or first port with -P (default is 5000)")
+    print("         -P  Use one port per device")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    count = 500
+    host = "127.0.0.1"
+    port = 5000
+    per_port = False
+
+    try:
+        clopts, clargs = getopt.getopt(sys.argv[1:], 'n:H:p:P')
+    except getopt.GetoptError as err:
+        print(str(err))
+        usage()
+
+    for opt, arg in clopts:
+        if opt == "-n":
+            count = int(arg)
+        elif opt == "-H":
+            host = arg
+        elif opt == "-p":
+            port = int(arg)
+        elif opt == "-P":
+            per_port = True
+
+    # Build one device first, so that the one-time allocations made for the
+    # first device (module and config parser caches) aren't counted. Each
+    # device's ConfigParser is left as cyclic garbage, so collect it before
+    # taking each reading to count only the memory the devices hold on to.
+    tracemalloc.start()
+    SPCFleet(1)
+    gc.collect()
+    mem_base = tracemalloc.get_traced_memory()[0]
+    tstart = time.time()
+    fleet = SPCFleet(count)
+    elapsed = time.time() - tstart
+    gc.collect()
+    mem_used = tracemalloc.get_traced_memory()[0] - mem_base
+    tracemalloc.stop()
+
+    print("%d devices created in %.3f s, %.1f KB per device" %
+          (count, elapsed, mem_used / 1024.0 / max(count, 1)))
+    if per_port:
+        print("Listening on %s ports %d to %d" % (host, port, port + count - 1))
+    else:
+        print("Listening on %s port %d" % (host, port))
+
+    try:
+        asyncio.run(fleet.serve(host, port, per_port))
+    except KeyboardInterrupt:
+        pass
@@ -2,20 +2,40 @@
 #-------------------------------------------------------------------------------
 # Simple Power Controller (SPC) Simulator
 #-------------------------------------------------------------------------------
-# A simulation of an 8-channel AC power controller.
+# A simulation of an AC power controller with 8 channels (or up to 1024,
+# see NCHAN in the configuration file notes below).
 #-------------------------------------------------------------------------------
 # Example source code for the book "Real-World Instrumentation with Python"
 # by J. M. Hughes, published by O'Reilly Media, December 2010,
 # ISBN 978-0-596-80956-0.
 #-------------------------------------------------------------------------------
+from __future__ import print_function
 
-import serial
 import time
+import json
+import array
+import select
 import getopt
 import sys
-import ConfigParser
+
+try:
+    import ConfigParser as configparser
+except ImportError:
+    import configparser
+
+try:
+    import serial
+except ImportError:
+    serial = None
+
+try:
+    getInput = raw_input
+except NameError:
+    getInput = input
 
 import AutoConvert as cvt
+import PTYLink
+import LoadModel
 
 # internal psuedo-constants
 OK   = 1
@@ -27,54 +47,145 @@ NORM = 0
 HOLD = 1
 CONT = 2
 
-# index values for channel status dictionary
+# index values for channel status lists (see chanStatus())
 PWR  = 0
 ECB  = 1
 LIM  = 2
 
+# number of channels, which may be set with NCHAN in spc.ini
+NUM_CHANNELS = 8
+MIN_CHANNELS = 8
+MAX_CHANNELS = 1024
+
+DEF_LIMIT = 2.0     # default ECB trip limit in amps
+
 # operation control pseudo-constants
 
 CONSOLE = 0         # use console for all I/O
 SERIAL = 1          # use serial port for command/response I/O
+PTY = 2             # use serial I/O on a local pseudo-terminal link
 
 CHAN_DELAY = 0.5    # operation delay for realism, this can be zero
+MAX_TICKS  = 100    # most load model ticks run at once to catch up
+
+
+class Command:
+    """ The definition of a command.
+
+        name is the command mnemonic, and handler is the name of the SPCSim
+        method that executes it. params is a sequence of the types of the
+        parameters (int or float), which are converted before the handler is
+        called, so each handler receives its parameters as ordinary
+        arguments. If var_params is True the last parameter may be repeated
+        any number of times. If resp is False the command doesn't send the
+        usual 1 or 0 response.
+    """
+    def __init__(self, name, handler, params=(), var_params=False, resp=True):
+        self.name       = name
+        self.handler    = handler
+        self.params     = tuple(params)
+        self.var_params = var_params
+        self.resp       = resp
+
+
+    def parse(self, paramstrs, report=print):
+        """ Converts a list of parameter strings to the declared types.
+
+            Any parameters beyond those declared are ignored. Errors are
+            passed to report (print by default) as message strings.
+
+            Returns a list of the parameter values, or None if there are too
+            few parameters or a parameter could not be converted.
+        """
+        nparams = len(self.params)
+        if len(paramstrs) < nparams:
+            report("Invalid number of parameters")
+            return None
+
+        if self.var_params and len(paramstrs) > nparams:
+            convs = self.params + (self.params[-1],) * (len(paramstrs) - nparams)
+        else:
+            convs = self.params
+
+        try:
+            return [conv(pstr) for conv, pstr in zip(convs, paramstrs)]
+        except ValueError as e:
+            report("Parameter Error: %s" % str(e))
+            return None
+
+
+# The command set. Dispatch() looks each command up by its mnemonic.
+COMMANDS = (Command("ALL",  "SetAll",   (int,)),
+            Command("POW",  "SetPower", (int, int)),
+            Command("SEQ",  "SetSeq",   (int,)),
+            Command("STM",  "SetSTM",   (float,)),
+            Command("SOR",  "SetOrder", (int,), var_params=True),
+            Command("SEM",  "SetSEM",   (int,)),
+            Command("CHK",  "ChkChan",  (int,)),
+            Command("ECB",  "ChkECB",   (int,)),
+            Command("CHM",  "ChkMask"),
+            Command("ECM",  "ECBMask"),
+            Command("LDM",  "SetLoadModel", (int,)),
+            Command("LOD",  "SetLoad",  (int, float)),
+            Command("CUR",  "ChkCurrent", (int,)),
+            Command("LIM",  "SetLimit", (int, float)),
+            Command("RST",  "RstChan",  (int,)),
+            Command("DMP",  "dumpCFG",  resp=False),
+            Command("QUIT", "Quit",     resp=False))
 
 
 class SPCSim:
 
-    def __init__(self, iomode=CONSOLE, sioport=None, monitor=False):
+    # command table, {mnemonic: Command}, shared by all instances
+    cmd_table = dict([(cmd.name, cmd) for cmd in COMMANDS])
+
+    def __init__(self, iomode=CONSOLE, sioport=None, monitor=False,
+                 banner=True):
         """ SPCSim initialization.
 
             In serial I/O mode the port MUST be specified.
 
+            In PTY mode a PTYLink is created, and the simulator uses serial
+            I/O on one end of it. The device path of the other end, which
+            a terminal emulator or test program can open, is printed on the
+            console and is available as pty_link.client_path.
+
             If the parameter monitor is True, then SPC will write messages
             to the console at each step in its execution. This can get very
             noisy, so it should not be used unless necessary.
+
+            If banner is False the start-up message is not sent.
         """
         # initialize internal model variables
-        self.seq_order = [1, 2, 3, 4, 5, 6, 7, 8]
         self.seq_dwell = CHAN_DELAY
         self.seq_sem   = NORM
 
+        # power sequence in progress (see seqStep())
+        self.seq_chans = []     # channels still to be switched
+        self.seq_hist  = []     # channels switched so far
+        self.seq_state = OFF    # state the channels are being switched to
+        self.seq_error = False  # an ECB fault occurred (CONT mode)
+        self.seq_next  = None   # time of the next step, None if no sequence
+
+        # load current model (see loadStep()), None if not in use
+        self.load      = None
+        self.load_tick = LoadModel.TICK
+        self.tick_next = None   # time of the next load model tick
+
         # initialize all control channels
-        # Format:
-        # {channel: [state, ECB, limit]}
-        self.channel   = {1: [OFF, OK, 2.0],
-                          2: [OFF, OK, 2.0],
-                          3: [OFF, OK, 2.0],
-                          4: [OFF, OK, 2.0],
-                          5: [OFF, OK, 2.0],
-                          6: [OFF, OK, 2.0],
-                          7: [OFF, OK, 2.0],
-                          8: [OFF, OK, 2.0]
-                          }
+        self.initChannels(NUM_CHANNELS)
 
         self.sport   = None     # SIO object
+        self.pty_link = None    # PTYLink object (PTY mode)
         self.sioname = sioport  # SPORT parameter
         self.siobaud = 9600     # SBAUD
         self.siodata = 8        # SDATA
         self.siospar = 'N'      # SPAR
         self.siostop = 1        # SSTOP
+        self.sio_buf = ""       # serial input not yet returned as a command
+        self.sio_echo = 0       # number of characters in sio_buf echoed
+        self.resp_buf = None    # if not None, responses are collected here
+        self.msg_buf  = None    # if not None, error messages are collected here
 
         self.monitor = monitor
         self.iomode = iomode
@@ -84,6 +195,18 @@ class SPCSim:
         # attempt to load config file parameters
         self.LoadCFG()
 
+        # create the pseudo-terminal link (if used), and use serial I/O on it
+        if self.iomode == PTY:
+            self.iomode = SERIAL
+            if PTYLink.PTYAvailable():
+                self.pty_link = PTYLink.PTYLink()
+                self.pty_link.start()
+                self.sioname = self.pty_link.sim_path
+                print("SPCSim PTY port: %s" % self.pty_link.client_path)
+            else:
+                print("Pseudo-terminals are not available")
+                self.sioname = None
+
         # open the serial interface (if used)
         if self.iomode == SERIAL:
             self.sport = self.InitSIO()
@@ -98,115 +221,189 @@ class SPCSim:
             if self.sport == None:
                 self.iomode = CONSOLE
                 if self.monitor == True:
-                    print "SIO port access error, using CONSOLE mode"
+                    print("SIO port access error, using CONSOLE mode")
 
-        self.initMsg()
+        if banner:
+            self.initMsg()
 
 
     #===========================================================================
     # Command methods
     #===========================================================================
 
-    def chanSet(self, chan, state, delay=False):
+    def initChannels(self, nchan):
+        """ Sets the number of channels, and resets them all to off with
+            the default ECB limit, and the sequence order to 1 to nchan.
+
+            The channel state is held in three bit masks, where bit n-1 is
+            for channel n, and an array of current limits:
+
+                pwr_mask    channels switched on
+                ecb_mask    channels whose ECB is OK (not tripped)
+                lim_zero    channels with a current limit of zero
+
+            A channel is powered if it is switched on and its ECB is OK.
+            Using masks means operations on all the channels at once, such
+            as the ALL command, take the same time however many channels
+            there are. If the load model is in use it is restarted for the
+            new number of channels.
+
+            Returns OK, or ERR if nchan is out of range.
+        """
+        if nchan < MIN_CHANNELS or nchan > MAX_CHANNELS:
+            return ERR
+
+        self.nchan     = nchan
+        self.all_mask  = (1 << nchan) - 1
+        self.pwr_mask  = 0
+        self.ecb_mask  = self.all_mask
+        self.lim_zero  = 0
+        self.ch_limit  = array.array('d', [DEF_LIMIT]) * nchan
+        self.seq_order = list(range(1, nchan + 1))
+
+        if self.load != None:
+            self.load = LoadModel.LoadModel(nchan, self.load_tick)
+
+        return OK
+
+
+    def validChan(self, chan):
+        """ Returns True if chan is a valid channel number.
+        """
+        return 1 <= chan <= self.nchan
+
+
+    def chanStatus(self, chan):
+        """ Returns the state of a channel as a list [state, ECB, limit],
+            indexed by PWR, ECB and LIM.
+        """
+        bit = 1 << (chan - 1)
+        return [ON if self.pwr_mask & bit else OFF,
+                OK if self.ecb_mask & bit else ERR,
+                self.ch_limit[chan - 1]]
+
+
+    def chanSet(self, chan, state):
         """ Common channel power control method.
 
-            Used by SetPower() and SetSeq().
+            Used by SetPower() and seqStep().
 
             Returns ERR if any channel is in over-current state (ECB tripped).
             Otherwise returns OK.
         """
         ret_val = ERR
+        bit = 1 << (chan - 1)
 
-        if (state == ON) and (self.channel[chan][LIM] == 0):
-            self.channel[chan][PWR] = OFF
-            self.channel[chan][ECB] = ERR
-        elif (state == ON) and (self.channel[chan][ECB] == ERR):
-            self.channel[chan][PWR] = OFF
+        if (state == ON) and (self.lim_zero & bit):
+            self.pwr_mask &= ~bit
+            self.ecb_mask &= ~bit
+        elif (state == ON) and not (self.ecb_mask & bit):
+            self.pwr_mask &= ~bit
         else:
-            self.channel[chan][PWR] = state
-            if delay:
-                time.sleep(self.seq_dwell)
+            if state == ON:
+                self.pwr_mask |= bit
+            else:
+                self.pwr_mask &= ~bit
             ret_val = OK
 
         if self.monitor:
-            if self.channel[chan][ECB] == ERR:
-                print chan, self.channel[chan], "ECB FAULT"
+            if not (self.ecb_mask & bit):
+                print(chan, self.chanStatus(chan), "ECB FAULT")
             else:
-                print chan, self.channel[chan]
+                print(chan, self.chanStatus(chan))
+
+        return ret_val
+
+
+    def maskSet(self, mask, state):
+        """ Switches all the channels in a bit mask on or off at once.
+
+            Channels being switched on that have a current limit of zero
+            trip their ECBs, and channels with a tripped ECB are left off.
+
+            Returns ERR if the ECB is tripped for any channel being switched
+            on. Otherwise returns OK.
+        """
+        ret_val = OK
+
+        if state == ON:
+            self.ecb_mask &= ~(mask & self.lim_zero)
+            tripped = mask & ~self.ecb_mask
+            self.pwr_mask = (self.pwr_mask | mask) & ~tripped
+            if tripped:
+                ret_val = ERR
+        else:
+            self.pwr_mask &= ~mask
+
+        if self.monitor:
+            print("PWR %X ECB %X" % (self.pwr_mask, self.ecb_mask))
 
         return ret_val
 
 
-    def SetAll(self, cmdstrs):
+    def SetAll(self, state):
         """ ALL state
 
-            Enables or disables all eight AC channels in sequence order, and
-            does not observe channels marked as inactive.
+            Enables or disables all AC channels at once, and does not observe
+            channels marked as inactive.
 
             The state parameter may be 1 (On) or 0 (Off).
 
-            This is basically just a fast version of the SEQ command. In a
-            real device setting all the channels ON or OFF would probably
-            be done by writing either 0xFF or 0x00 to the control lines
-            connected to the internal relay modules, not by stepping through
-            each channel.
+            This is basically just a fast version of the SEQ command. As in
+            a real device, where setting all the channels ON or OFF would
+            probably be done by writing either 0xFF or 0x00 to the control
+            lines connected to the internal relay modules, all the channels
+            are switched at once rather than by stepping through each one.
+            A power sequence in progress is aborted first.
 
-            When commanding all channels off, the reverse sequence order
-            will be used.
+            Responds with 1 if successful, or 0 if the ECB is tripped for any
+            channel at powerup.
         """
         ret_val = ERR        # preset the return value
-        got_err = False
-
-        chan_seq = [1,2,3,4,5,6,7,8]
-
-        state = self.getParamValInt(cmdstrs, 1)
 
         if self.monitor:
-            print "ALL", state
-
-        if state in (ON, OFF):
-            if state == OFF:
-                chan_seq.reverse()
+            print("ALL", state)
 
-            for n in chan_seq:
-                ret_val = self.chanSet(n, state)
-                if ret_val == ERR:
-                    got_err = False
+        self.seqAbort()
 
-        if got_err:
-            ret_val = ERR
+        if state in (ON, OFF):
+            ret_val = self.maskSet(self.all_mask, state)
 
         return ret_val
 
 
-    def SetPower(self, cmdstrs):
+    def SetPower(self, chan, state):
         """ POW ch, state
 
             Sets the power state of a channel to either On or Off.
 
             ch is a channel number, and state may be 1 (On) or 0 (Off).
             Responds with 1 if successful, or 0 if the ECB is tripped at
-            power-up or some other error occurred. Waits for command
-            completion before returning.
+            power-up or some other error occurred.
+
+            The channel is switched at once, and the STM pause after it is
+            kept by the sequence timers rather than by waiting here: if a
+            power sequence is running, its next step is held back until the
+            pause has passed, just as if the channel had been switched by
+            the sequence itself.
         """
         ret_val = ERR
 
-        chan = self.getParamValInt(cmdstrs, 1)
-        if chan != -1:
-            state = self.getParamValInt(cmdstrs, 2)
-            if state != -1:
-                if chan in range(1,9):
-                    if self.monitor:
-                        print "POW", chan, state
-                    if state in (ON, OFF):
-                        ret_val = self.chanSet(chan, state, delay=True)
-                else:
-                    if self.monitor:
-                        print "POW invalid channel: ", chan
+        if self.validChan(chan):
+            if self.monitor:
+                print("POW", chan, state)
+            if state in (ON, OFF):
+                ret_val = self.chanSet(chan, state)
+                if (ret_val == OK) and (self.seq_next != None):
+                    self.seq_next = max(self.seq_next,
+                                        time.time() + self.seq_dwell)
+        else:
+            if self.monitor:
+                print("POW invalid channel: ", chan)
         return ret_val
 
 
-    def SetSeq(self, cmdstrs):
+    def SetSeq(self, state):
         """ SEQ state
 
             Commands the controller to start either a power-up or power-down
@@ -214,52 +411,247 @@ class SPCSim:
             command, the startup order will be from lowest to highest and the
             shutdown order will be the inverse.
 
-            The parameter state may be 1 (startup) or 0 (shutdown). Responds
-            with 1 if successful, or 0 if the ECB is tripped for any channel
-            at powerup.
-        """
-        ret_val = ERR
+            The parameter state may be 1 (startup) or 0 (shutdown).
 
-        set_seq = []
-        set_seq = self.seq_order[:]
-        seq_hist = []
-        got_err = False
+            The first channel is switched immediately, and the rest are
+            switched one at a time by seqStep() as each STM pause expires,
+            so other commands can be used while the sequence runs. A SEQ or
+            ALL command issued during a sequence aborts it, leaving the
+            channels already switched as they are, and then carries on as
+            usual. Use CHK and ECB to follow the progress of the sequence.
 
-        state = self.getParamValInt(cmdstrs, 1)
+            Responds with 1 if the sequence was started, or 0 if the state is
+            invalid or the ECB is tripped for the first channel at powerup
+            (unless the sequence error mode is CONT).
+        """
+        ret_val = ERR
 
         if self.monitor:
-            print "SEQ", state
+            print("SEQ", state)
+
+        self.seqAbort()
 
-        if state != -1:
+        if state in (ON, OFF):
+            self.seq_chans = [n for n in self.seq_order if n > 0]
             if state == OFF:
-                set_seq.reverse()
-
-            for n in set_seq:
-                if n > 0:
-                    seq_hist.append(n)
-                    ret_val = self.chanSet(n, state, delay=True)
-                    if (ret_val != OK) and (state == ON):
-                        # if ECB fault detected only exit seq loop if SEM is
-                        # set to NORM (0) or HOLD (1), otherwise carry on.
-                        if self.seq_sem in (NORM, HOLD):
-                            break
-                        if self.seq_sem == CONT:
-                            got_err = True  # catch error in CONT mode
-
-            if (ret_val != OK) and (state == ON):
+                self.seq_chans.reverse()
+            self.seq_hist  = []
+            self.seq_state = state
+            self.seq_error = False
+            self.seq_next  = time.time()
+
+            ret_val = self.seqStep()
+
+        return ret_val
+
+
+    def seqStep(self):
+        """ Switches the next channel in the current power sequence, and
+            schedules the step after it.
+
+            If an ECB fault is detected at powerup the sequence either stops
+            and shuts down the channels already switched on in reverse order
+            (NORM), stops and leaves them on (HOLD), or carries on with the
+            next channel (CONT).
+
+            Returns the result of switching the channel.
+        """
+        if len(self.seq_chans) == 0:
+            self.seq_next = None
+            return OK
+
+        n = self.seq_chans.pop(0)
+        self.seq_hist.append(n)
+        ret_val = self.chanSet(n, self.seq_state)
+        switched = (ret_val == OK)
+
+        if (ret_val != OK) and (self.seq_state == ON):
+            self.seq_error = True
+            if self.seq_sem == NORM:
                 # do a reverse shutdown
-                if self.seq_sem == NORM:
-                    seq_hist.reverse()
-                    for n in seq_hist:
-                        self.chanSet(n, OFF)
+                for h in reversed(self.seq_hist):
+                    self.chanSet(h, OFF)
+                self.seq_chans = []
+            elif self.seq_sem == HOLD:
+                self.seq_chans = []
+            else:
+                ret_val = OK    # CONT, carry on with the next channel
 
-            if got_err:
-                ret_val = ERR
+        if len(self.seq_chans) == 0:
+            self.seq_next = None
+            if self.monitor:
+                print("SEQ done, ECB fault" if self.seq_error else "SEQ done")
+        elif switched:
+            # pause before the next channel
+            self.seq_next = time.time() + self.seq_dwell
+        else:
+            # no pause after a channel that failed to switch (CONT mode)
+            self.seq_next = time.time()
 
         return ret_val
 
 
-    def SetSTM(self, cmdstrs):
+    def seqAbort(self):
+        """ Stops the power sequence in progress, if there is one.
+        """
+        if self.seq_next != None:
+            if self.monitor:
+                print("SEQ aborted")
+            self.seq_chans = []
+            self.seq_next  = None
+
+
+    def seqPoll(self):
+        """ Runs any power sequence steps that are due.
+
+            Returns the time in seconds until the next step is due, or None
+            if no sequence is in progress.
+        """
+        while self.seq_next != None and time.time() >= self.seq_next:
+            self.seqStep()
+
+        if self.seq_next == None:
+            return None
+        return max(0.0, self.seq_next - time.time())
+
+
+    def SetLoadModel(self, state):
+        """ LDM state
+
+            Turns the load current model on (1) or off (0). While it is on,
+            the load current of every channel is modelled, including the
+            inrush when a channel is switched on, and the ECBs trip on an
+            inverse-time curve (see LoadModel.py). The model is stepped at a
+            fixed tick, TICK seconds (0.01 by default), while the simulator
+            waits for commands.
+
+            Turning the model on resets the load currents set with LOD.
+
+            Responds with 1 if successful, or 0 if the state is invalid or
+            NumPy is not available.
+        """
+        ret_val = ERR
+
+        if state == ON:
+            if LoadModel.np == None:
+                self.errMsg("NumPy is required for the load model")
+            else:
+                self.load = LoadModel.LoadModel(self.nchan, self.load_tick)
+                self.tick_next = time.time() + self.load_tick
+                ret_val = OK
+        elif state == OFF:
+            self.load = None
+            self.tick_next = None
+            ret_val = OK
+
+        if self.monitor and ret_val == OK:
+            print("LDM", state)
+
+        return ret_val
+
+
+    def SetLoad(self, chan, amps):
+        """ LOD ch|0, amps
+
+            Sets the steady-state load current of channel ch, or of all the
+            channels if ch is 0, for the load model.
+
+            Responds with 1 if successful, or 0 if the channel ID or current
+            is invalid, or the load model is off.
+        """
+        ret_val = ERR
+
+        if self.load != None and amps >= 0:
+            if chan == 0:
+                self.load.setLoad(None, amps)
+                ret_val = OK
+            elif self.validChan(chan):
+                self.load.setLoad(chan - 1, amps)
+                ret_val = OK
+
+            if self.monitor and ret_val == OK:
+                print("LOD", chan, amps)
+
+        return ret_val
+
+
+    def ChkCurrent(self, chan):
+        """ CUR ch|0
+
+            Returns the load current of channel ch in amps. If ch is set to
+            0, the currents of the channels in the sequence list are returned
+            as a comma-separated list.
+
+            Responds with 0 if the load model is off.
+        """
+        ret_val = ERR
+
+        if self.load != None:
+            # bring the model up to date first
+            self.timerPoll()
+            current = self.load.current
+            if chan == 0:
+                return [round(float(current[n - 1]), 3) for n in self.seq_order if n > 0]
+            elif self.validChan(chan):
+                ret_val = round(float(current[chan - 1]), 3)
+
+        return ret_val
+
+
+    def loadStep(self):
+        """ Advances the load model by one tick, and trips the ECBs of any
+            channels it reports as overloaded.
+        """
+        powered = LoadModel.maskToArray(self.pwr_mask & self.ecb_mask, self.nchan)
+        tripped = self.load.step(powered, self.ch_limit)
+        if tripped.any():
+            trip_mask = LoadModel.arrayToMask(tripped)
+            self.ecb_mask &= ~trip_mask
+            if self.monitor:
+                print("ECB TRIP %X" % trip_mask)
+
+
+    def loadPoll(self):
+        """ Runs any load model ticks that are due.
+
+            If more than MAX_TICKS ticks are due (because the simulator was
+            busy, or the platform can't wait for console input with a
+            timeout) only MAX_TICKS are run, and the rest are skipped.
+
+            Returns the time in seconds until the next tick is due, or None
+            if the load model is off.
+        """
+        if self.load == None:
+            return None
+
+        now = time.time()
+        if now >= self.tick_next:
+            ticks = int((now - self.tick_next) / self.load.tick) + 1
+            for i in range(0, min(ticks, MAX_TICKS)):
+                self.loadStep()
+            self.tick_next += ticks * self.load.tick
+
+        return max(0.0, self.tick_next - time.time())
+
+
+    def timerPoll(self):
+        """ Runs any power sequence steps and load model ticks that are
+            due.
+
+            Returns the time in seconds until the next one is due, or None
+            if there is nothing to wait for.
+        """
+        seq_timeout  = self.seqPoll()
+        load_timeout = self.loadPoll()
+
+        if seq_timeout == None:
+            return load_timeout
+        if load_timeout == None:
+            return seq_timeout
+        return min(seq_timeout, load_timeout)
+
+
+    def SetSTM(self, tmval):
         """ STM time
 
             Sets the amount of time to pause between each step in a power-up
@@ -272,49 +664,47 @@ class SPCSim:
         """
         ret_val = ERR
 
-        tmval = self.getParamValFloat(cmdstrs, 1)
-        if tmval != -1:
+        if tmval >= 0:
             self.seq_dwell = tmval
             ret_val = OK
 
             if self.monitor:
-                print "STM", tmval
+                print("STM", tmval)
 
         return ret_val
 
 
-    def SetOrder(self, cmdstrs):
+    def SetOrder(self, *chans):
         """ SOR ch, ch, ch, ch, ch, ch, ch, ch
 
             Defines the startup and shutdown sequence order. Shutdown is the
-            inverse of startup. The list may contain from one to eight channel
-            ID entries. Any channel not in the list will be excluded from
-            sequencing.
+            inverse of startup. The list may contain from one entry up to one
+            for each channel. Any channel not in the list will be excluded
+            from sequencing.
 
-            Expects cmdstrs to be a list containing the commnd and up to eight
-            channel ID numbers. If called from the LoadCFG() method the command
-            will be ''.
+            Expects from one channel ID number up to the number of channels.
+            A channel ID of 0 is a placeholder, and is skipped when
+            sequencing.
 
             Responds with 1 if successful, or 0 if a sequence parameter is
             invalid.
         """
         ret_val = ERR
-        chanset = []
 
-        if len(cmdstrs) > 1:
-            chans = cmdstrs[1:]
+        if 1 <= len(chans) <= self.nchan:
             for c in chans:
-                chanset.append(int(c))
-            self.seq_order = chanset
+                if c != 0 and not self.validChan(c):
+                    return ret_val
+            self.seq_order = list(chans)
             ret_val = OK
 
             if self.monitor:
-                print "SOR", chans
+                print("SOR", list(chans))
 
         return ret_val
 
 
-    def SetSEM(self, cmdstrs):
+    def SetSEM(self, semval):
         """ SEM mode
 
             Sets the error handling for power-up sequencing (sequence error
@@ -336,69 +726,73 @@ class SPCSim:
         """
         ret_val = ERR
 
-        semval = self.getParamValInt(cmdstrs, 1)
-        if semval != -1:
+        if semval in (NORM, HOLD, CONT):
             self.seq_sem = semval
             ret_val = OK
 
             if self.monitor:
-                print "SEM", semval
+                print("SEM", semval)
 
         return ret_val
 
 
-    def ChkChan(self, cmdstrs):
+    def ChkChan(self, chan):
         """ CHK ch|0
 
             Returns the on/off/error status of channel ch as either 1 or 0.
-            If ch is set to 0, the statuses of all eight channels are returned
-            as a comma-separated list of channel states. Also returns a 0
-            character for a channel if that channel's ECB is tripped. Use the
-            ERR command to check the ECB state.
+            If ch is set to 0, the statuses of the channels in the sequence
+            list are returned as a comma-separated list of channel states.
+            Also returns a 0 character for a channel if that channel's ECB
+            is tripped. Use the ECB command to check the ECB state.
         """
         ret_val = ERR
 
-        chan = self.getParamValInt(cmdstrs, 1)
-        if chan != -1:
-            if chan == 0:
-                retlist = []
-                for n in self.seq_order:
-                    if self.channel[n][PWR] == OFF or self.channel[n][ECB] == ERR:
-                        retlist.append(OFF)
-                    else:
-                        retlist.append(ON)
-                return retlist
-            else:
-                if self.channel[chan][PWR] == OFF or self.channel[chan][ECB] == ERR:
-                    ret_val = OFF
-                else:
-                    ret_val = ON
+        powered = self.pwr_mask & self.ecb_mask
+        if chan == 0:
+            return [(powered >> (n - 1)) & 1 for n in self.seq_order if n > 0]
+        elif self.validChan(chan):
+            ret_val = (powered >> (chan - 1)) & 1
         return ret_val
 
 
-    def ChkECB(self, cmdstrs):
+    def ChkECB(self, chan):
         """ ECB ch|0
 
             Returns the ECB status of channel ch as either 1 (OK) or 0 (error).
-            If n is set to 0, the ECB statuses of all eight channels are
-            returned as a comma-separated list of states.
+            If n is set to 0, the ECB statuses of the channels in the sequence
+            list are returned as a comma-separated list of states.
         """
         ret_val = ERR
 
-        chan = self.getParamValInt(cmdstrs, 1)
-        if chan != -1:
-            if chan == 0:
-                retlist = []
-                for n in self.seq_order:
-                    retlist.append(self.channel[n][ECB])
-                return retlist
-            else:
-                ret_val = self.channel[chan][ECB]
+        if chan == 0:
+            return [(self.ecb_mask >> (n - 1)) & 1 for n in self.seq_order if n > 0]
+        elif self.validChan(chan):
+            ret_val = (self.ecb_mask >> (chan - 1)) & 1
 
         return ret_val
 
 
-    def SetLimit(self, cmdstrs):
+    def ChkMask(self):
+        """ CHM
+
+            Returns the on/off/error status of all the channels as a
+            hexadecimal bit mask, with channel 1 in the lowest bit. A bit is
+            1 if the channel is on and its ECB is OK.
+        """
+        return "%X" % (self.pwr_mask & self.ecb_mask)
+
+
+    def ECBMask(self):
+        """ ECM
+
+            Returns the ECB status of all the channels as a hexadecimal bit
+            mask, with channel 1 in the lowest bit. A bit is 1 if the ECB
+            is OK, and 0 if it is tripped.
+        """
+        return "%X" % self.ecb_mask
+
+
+    def SetLimit(self, chan, limit):
         """ LIM ch|0, amps
 
             Sets the current limit of the ECB for channel ch. If 0 is given
@@ -415,26 +809,31 @@ class SPCSim:
         """
         ret_val = ERR
 
-        chan = self.getParamValInt(cmdstrs, 1)
-        if chan != -1:
-            limit = self.getParamValFloat(cmdstrs, 2)
-            if limit != -1:
-                if chan == 0:
-                    for n in range(1,9):
-                        self.channel[n][LIM] = limit
-                    ret_val = OK
-                    if self.monitor:
-                        print "LIM", "ALL", limit
-                elif chan in range(1,9):
-                    self.channel[chan][LIM] = limit
-                    ret_val = OK
-                    if self.monitor:
-                        print "LIM", chan, limit
+        if limit >= 0:
+            if chan == 0:
+                self.ch_limit = array.array('d', [limit]) * self.nchan
+                if limit == 0:
+                    self.lim_zero = self.all_mask
+                else:
+                    self.lim_zero = 0
+                ret_val = OK
+                if self.monitor:
+                    print("LIM", "ALL", limit)
+            elif self.validChan(chan):
+                bit = 1 << (chan - 1)
+                self.ch_limit[chan - 1] = limit
+                if limit == 0:
+                    self.lim_zero |= bit
+                else:
+                    self.lim_zero &= ~bit
+                ret_val = OK
+                if self.monitor:
+                    print("LIM", chan, limit)
 
         return ret_val
 
 
-    def RstChan(self, cmdstrs):
+    def RstChan(self, chan):
         """ RST ch
 
             Attempts to reset the ECB for channel ch.
@@ -443,91 +842,40 @@ class SPCSim:
             then it cannot be reset. The limit must first be set to some
             value > 0 first.
 
+            With the load model on, an ECB that has only just tripped is
+            still "hot", and if the channel is powered it may trip again as
+            soon as it is reset. It cools within a second or so.
+
             Responds with 1 if successful, or 0 if the ECB could not be reset.
         """
         ret_val = ERR
 
-        chan = self.getParamValInt(cmdstrs, 1)
-        if chan != -1:
-            if self.channel[chan][LIM] != 0:
-                self.channel[chan][ECB] = OK
+        if self.validChan(chan):
+            if self.ch_limit[chan - 1] != 0:
+                self.ecb_mask |= 1 << (chan - 1)
                 ret_val = OK
 
                 if self.monitor:
-                    print "RST", chan
-
-        return ret_val
-
-
-    #===========================================================================
-    # command parser and helper methods
-    #===========================================================================
-    # The only command in the set that doesn't use either 1 or 2 integers as
-    # parameters is the SOR command. This feature is used to simplify the code
-    # by defining a set of utility methods for converting the items in the
-    # command string list passed to each command method by Dispatch(). Only
-    # the SOR command requires a special case, which is handled by the
-    # getParamList() method below.
-
-    def getParamValInt(self, cmdstrs, pidx):
-        """ Convert a member element in a list of strings to an integer.
-
-            The parameter pdix specifies which element to extract and convert.
-
-            If the conversion fails the method will return -1 (since zero is a
-            valid parameter valid).
-        """
-        try:
-            ret_val = int(cmdstrs[pidx])
-        except Exception, e:
-            print "Parameter %d Error: %s" % (pidx, str(e))
-            ret_val = -1
+                    print("RST", chan)
 
         return ret_val
 
 
-    def getParamValFloat(self, cmdstrs, pidx):
-        """ Convert a member element in a list of strings to a float.
+    def Quit(self):
+        """ QUIT
 
-            The parameter pdix specifies which element to extract and convert.
-
-            If the conversion fails the method will return -1 (since zero is a
-            valid parameter valid).
+            Stops the simulator.
         """
-        try:
-            ret_val = float(cmdstrs[pidx])
-        except Exception, e:
-            print "Parameter %d Error: %s" % (pidx, str(e))
-            ret_val = -1
+        self.stop_main = True
 
-        return ret_val
-
-
-    def getParamList(self, cmdstrs, pcnt):
-        """ Convert a list of parameter strings into a list of integers.
-        """
-        retlist = []
-        if (pcnt > 0) and (pcnt < 9):
-            if len(cmdstrs) == pcnt + 1:
-                for i in range(1,pcnt+1):
-                    try:
-                        listval = int(cmdstrs[i])
-                    except Exception, e:
-                        print "Parameter %d Error: %s" % (i, str(e))
-                        ret_val = -1
-                        break
-                    else:
-                        retlist.append(listval)
-                        return relist
-            else:
-                print "Invalid number of parameters"
-                ret_val = -1
-        else:
-            print "Parameter count out of range"
-            ret_val = -1
-
-        return ret_val
 
+    #===========================================================================
+    # command parser
+    #===========================================================================
+    # Each command is looked up in the command table built from COMMANDS, and
+    # its parameters are converted to the types given in its definition before
+    # the handler method is called. So the handlers never see the command
+    # strings, and parameter errors are caught in one place.
 
     def Dispatch(self, instr):
         """ Command parser and function dispatcher.
@@ -545,65 +893,102 @@ class SPCSim:
             is the same as:
                 POW 2 1
 
-            Lastly, this method differs from what is shown in the text in how
-            the command input string is converted to upper case. Rather than
-            do the conversion for each IF test, it is done only once when the
-            command string is processed into individual strings.
-.        """
-        ret_val = OK
+            Returns the value returned by the command handler, or ERR if the
+            command or its parameters are invalid.
+        """
+        ret_val = ERR
 
         if self.monitor:
-            print "Dispatch"
-
-        # replace all commas with a space character
-        strtmp = instr.replace(',',' ')
-        # convert to upper case
-        newinstr = strtmp.upper()
-        # split input into separate strings
-        cmdstrs = newinstr.split()
-
-        # check for the quit command and immediately return if found, else
-        # do the usual parse and dispatch.
-        if cmdstrs[0] == "QUIT":
-            self.stop_main = True
-        else:
-            if len(cmdstrs) >= 1:
-                if cmdstrs[0] == "DMP":
-                    self.dumpCFG()
-                elif len(cmdstrs) >= 2:
-                    if len(cmdstrs[0]) == 3:
-                        if cmdstrs[0] == "ALL":
-                            ret_val = self.SetAll(cmdstrs)
-                        elif cmdstrs[0] == "POW":
-                            ret_val = self.SetPower(cmdstrs)
-                        elif cmdstrs[0] == "SEQ":
-                            ret_val = self.SetSeq(cmdstrs)
-                        elif cmdstrs[0] == "STM":
-                            ret_val = self.SetSTM(cmdstrs)
-                        elif cmdstrs[0] == "SOR":
-                            ret_val = self.SetOrder(cmdstrs)
-                        elif cmdstrs[0] == "SEM":
-                            ret_val = self.SetSEM(cmdstrs)
-                        elif cmdstrs[0] == "CHK":
-                            ret_val = self.ChkChan(cmdstrs)
-                        elif cmdstrs[0] == "ECB":
-                            ret_val = self.ChkECB(cmdstrs)
-                        elif cmdstrs[0] == "LIM":
-                            ret_val = self.SetLimit(cmdstrs)
-                        elif cmdstrs[0] == "RST":
-                            ret_val = self.RstChan(cmdstrs)
-                        else:
-                            print "Invalid command code"
-                            ret_val = ERR
-                        self.SendResp(ret_val)
-                    else:
-                        print "Invalid command string"
-                        ret_val = ERR
-                        self.SendResp(ret_val)
-            else:
-                print "Invalid command input"
-                ret_val = ERR
-                self.SendResp(ret_val)
+            print("Dispatch")
+
+        # bring any power sequence and the load model up to date before the
+        # command sees them
+        self.timerPoll()
+
+        # replace all commas with a space character, and split the input into
+        # separate strings
+        cmdstrs = instr.replace(',',' ').split()
+
+        if len(cmdstrs) == 0:
+            self.errMsg("Invalid command input")
+            self.SendResp(ret_val)
+            return ret_val
+
+        cmd = self.cmd_table.get(cmdstrs[0].upper())
+        if cmd == None:
+            self.errMsg("Invalid command code")
+            self.SendResp(ret_val)
+            return ret_val
+
+        params = cmd.parse(cmdstrs[1:], self.errMsg)
+        if params != None:
+            ret_val = getattr(self, cmd.handler)(*params)
+
+        if cmd.resp:
+            self.SendResp(ret_val)
+
+        return ret_val
+
+
+    #===========================================================================
+    # Batch commands
+    #===========================================================================
+    # A command line holding several commands separated by semicolons, or a
+    # script file given with the -s option, is run as a batch. The commands
+    # are executed back to back with no prompts or echo, and the results are
+    # returned as a single JSON object. For example, "pow 1 1; chk 1" gives:
+    #
+    #   {"count": 2, "results": [{"cmd": "pow 1 1", "resp": ["1"]},
+    #                            {"cmd": "chk 1", "resp": ["1"]}]}
+    #
+    # (all on one line). Any error messages caused by a command, such as
+    # "Invalid command code", are returned in a "msg" list with its results.
+
+    def RunBatch(self, script):
+        """ Runs a script of commands.
+
+            Commands are separated by semicolons or line breaks. Empty
+            commands, and lines starting with '#', are skipped. The script
+            stops after a QUIT command.
+
+            Returns a list with a dictionary for each command, holding the
+            command string, the list of response strings, and the list of
+            error messages (only if there were any).
+        """
+        cmds = []
+        for line in script.splitlines():
+            if not line.lstrip().startswith('#'):
+                cmds.extend([c.strip() for c in line.split(';')])
+
+        results = []
+        saved_resp = self.resp_buf
+        saved_msg  = self.msg_buf
+        try:
+            for instr in cmds:
+                if len(instr) == 0:
+                    continue
+
+                self.resp_buf = []
+                self.msg_buf  = []
+                self.Dispatch(instr)
+                result = {"cmd": instr, "resp": self.resp_buf}
+                if len(self.msg_buf) > 0:
+                    result["msg"] = self.msg_buf
+                results.append(result)
+
+                if self.stop_main:
+                    break
+        finally:
+            self.resp_buf = saved_resp
+            self.msg_buf  = saved_msg
+
+        return results
+
+
+    def SendBatch(self, results):
+        """ Sends the results returned by RunBatch() as one JSON object.
+        """
+        self.SendResp(json.dumps({"count": len(results), "results": results}))
 
 
     #===========================================================================
@@ -623,6 +1008,10 @@ class SPCSim:
         if self.sioname == None:
             return None
 
+        if serial == None:
+            print("SIO error: pySerial is not installed")
+            return None
+
         # Note that the parameter value definitions in pySerial equate directly
         # to what one would expect to see. In other words, serial.PARITY_NONE
         # is just 'N', serial.EIGHTBITS is 8, and serial.STOPBITS_ONE is 1.
@@ -635,12 +1024,12 @@ class SPCSim:
                                   bytesize=self.siodata,
                                   parity=self.siospar.upper(),
                                   stopbits=self.siostop)
-        except Exception, e:
-            print "SIO error: %s" % str(e)
+        except Exception as e:
+            print("SIO error: %s" % str(e))
             return None
 
         if self.monitor:
-            print "SIO initialized"
+            print("SIO initialized")
 
         return sport
 
@@ -655,33 +1044,123 @@ class SPCSim:
             In serial mode the command input will be echoed back. Only a
             CR character is considered to be a valid EOF. An LF character
             is simply ignored.
+
+            While a power sequence or the load model is running the input is
+            polled, so that the sequence steps and model ticks happen on time
+            while waiting for a command.
         """
         instr = ""
         while len(instr) < 1:
             if self.iomode == CONSOLE:
-                print ">",
-                instr = raw_input()
+                print("> ", end="")
+                sys.stdout.flush()
+                self.consoleWait()
+                instr = getInput()
             else:
-                self.sport.write("> ")
-                inch = ''
-                while inch != '\r':
-                    inch = self.sport.read()
-                    if inch not in ('\n', '\r'):
-                        self.sport.write(inch)
-                        instr += inch
-                self.sport.write("\r\n")
+                self.sioWrite("> ")
+                instr = self.sioReadLine()
         return instr
 
 
+    def consoleWait(self):
+        """ Runs the power sequence in progress and the load model (if
+            any) until console input is available.
+
+            This relies on select() working with the console, which it does
+            on Unix-like systems. Where it doesn't (Windows), it returns at
+            once, and the sequence steps happen as each command arrives.
+        """
+        timeout = self.timerPoll()
+        while timeout != None:
+            try:
+                ready, w, x = select.select([sys.stdin], [], [], timeout)
+            except (select.error, OSError, ValueError):
+                return
+            if len(ready) > 0:
+                return
+            timeout = self.timerPoll()
+
+
+    def sioReadLine(self):
+        """ Reads one CR terminated line from the serial port.
+
+            Everything waiting in the serial input is read at once, and
+            echoed back with a single write, rather than one character at a
+            time. Input following the CR is kept for the next call, so a
+            host can send several commands at once. They are still echoed
+            one line at a time, after the prompt for each one, so what the
+            host sees is the same as if they had been typed.
+
+            Returns the line without the CR, and with any LF characters
+            removed.
+        """
+        while True:
+            eol = self.sio_buf.find('\r')
+            if eol >= 0:
+                instr = self.sio_buf[:eol].replace('\n', '')
+                echo = self.sio_buf[self.sio_echo:eol].replace('\n', '')
+                self.sioWrite(echo + "\r\n")
+                self.sio_buf = self.sio_buf[eol+1:]
+                self.sio_echo = 0
+                return instr
+
+            # no complete line yet, echo the partial line and wait for more
+            echo = self.sio_buf[self.sio_echo:].replace('\n', '')
+            if len(echo) > 0:
+                self.sioWrite(echo)
+            self.sio_echo = len(self.sio_buf)
+            self.sio_buf += self.sioRead()
+
+
+    def sioRead(self):
+        """ Reads everything waiting in the serial input, waiting for at
+            least one character if nothing is available yet.
+
+            While a power sequence or the load model is running the read times
+            out when the next step or tick is due, and an empty string is
+            returned. The step or tick is run at the start of the next call.
+        """
+        timeout = self.timerPoll()
+        if timeout != self.sport.timeout:
+            self.sport.timeout = timeout
+
+        if hasattr(self.sport, "in_waiting"):
+            waiting = self.sport.in_waiting
+        else:
+            waiting = self.sport.inWaiting()
+
+        return self.sport.read(max(1, waiting)).decode("ascii", "replace")
+
+
     def SendResp(self, respval):
         """ Send a response to the host.
 
             Appends a CR-LF pair to the end of the output string.
         """
-        if self.iomode == CONSOLE:
-            print respval
+        if self.resp_buf != None:
+            self.resp_buf.append("%s" % respval)
+        elif self.iomode == CONSOLE:
+            print(respval)
+        else:
+            self.sioWrite("%s\r\n" % respval)
+
+
+    def errMsg(self, msgstr):
+        """ Reports a command error.
+
+            The message is printed on the console, or collected in msg_buf
+            while a batch is being run.
+        """
+        if self.msg_buf != None:
+            self.msg_buf.append(msgstr)
         else:
-            self.sport.write("%s\r\n" % respval)
+            print(msgstr)
+
+
+    def sioWrite(self, outstr):
+        """ Writes a string to the serial port.
+        """
+        self.sport.write(outstr.encode("ascii"))
 
 
     #===========================================================================
@@ -702,11 +1181,17 @@ class SPCSim:
     # SDATA     Specifies the data bits (default is 8)
     # SPAR      Specifies the data parity (default is none, 'N')
     # SSTOP     Specifies the number of stop bits (default is 1)
-    # ECBn      Sets the ECB trip limit for channel n (n can be 1 through 8)
+    # NCHAN     Sets the number of channels, from 8 (the default) to 1024
+    # ECBn      Sets the ECB trip limit for channel n (n can be 1 through
+    #           the number of channels)
     #           The default ECB trip limit is 2.0 amps
     # SOR       Defines the start sequence order as a list of channel numbers
     # STM       Sets the STM pause time
     # SEM       Set the sequence error mode
+    # LOAD      Turns the load current model on (1) or off (0, the default)
+    # TICK      Sets the load model time step in seconds (default is 0.01)
+    # LOADn     Sets the steady-state load current of channel n for the load
+    #           model (the default is 1.0 amps)
 
     def getOpt(self, cfgobj, section, option):
         """ Utility method to fetch data from a parameter file.
@@ -728,33 +1213,26 @@ class SPCSim:
         """ Read parameter entries in the spi.ini file if it exists.
 
             With the exception of the serial port parameters, this method
-            takes advantage of the command input functions that already exist
-            to handle the data type conversions and set the appropriate
-            internal parameters.
-
-            There is no type or range checking done here. For the operational
-            parameters that's handled in the command processor methods. If
-            bogus values are provided for the serial port, then they will be
-            caught when the port is opened.
-
-            The command input functions expect to get a list containing at
-            least two elements: the command and a parameter. In the code of
-            the SOR function it expects a list with up to nine elements. So,
-            a dummpy element ('') is placed at the start of a list containing
-            the data from the INI file, and then passed to the appropriate
-            function.
-        """
-        cfg = ConfigParser.ConfigParser()
+            converts each value to the type its command expects, and then
+            passes it to the command method to set the appropriate internal
+            parameters.
+
+            There is no range checking done here. For the operational
+            parameters that's handled in the command methods. If bogus values
+            are provided for the serial port, then they will be caught when
+            the port is opened.
+        """
+        cfg = configparser.ConfigParser()
         cfg.read('spc.ini')
 
         # see if a config file was read, don't bother looking for data if it
         # isn't available
-        if len(cfg.items('SPC')) == 0:
+        if not cfg.has_section('SPC') or len(cfg.items('SPC')) == 0:
             if self.monitor == True:
-                print "Configuration file data not loaded"
+                print("Configuration file data not loaded")
         else:
             if self.monitor == True:
-                print "Loading parameters from spi.ini"
+                print("Loading parameters from spi.ini")
 
             # don't override the SIO port name if it was passed in via a
             # command line parameter
@@ -775,75 +1253,45 @@ class SPCSim:
             optret = self.getOpt(cfg, 'SPC', 'SSTOP')
             if optret[0] == OK:
                 self.siostop = int(optret[1])
-    
-            optret = self.getOpt(cfg, 'SPC', 'ECB1')
-            if optret[0] == OK:
-                cmdlist = ['', '1']
-                cmdlist.append("%2.1f" % float(optret[1]))
-                self.SetLimit(cmdlist)
 
-            optret = self.getOpt(cfg, 'SPC', 'ECB2')
+            optret = self.getOpt(cfg, 'SPC', 'NCHAN')
             if optret[0] == OK:
-                cmdlist = ['', '2']
-                cmdlist.append("%2.1f" % float(optret[1]))
-                self.SetLimit(cmdlist)
+                if self.initChannels(int(optret[1])) != OK:
+                    print("NCHAN must be from %d to %d" %
+                          (MIN_CHANNELS, MAX_CHANNELS))
 
-            optret = self.getOpt(cfg, 'SPC', 'ECB3')
-            if optret[0] == OK:
-                cmdlist = ['', '3']
-                cmdlist.append("%2.1f" % float(optret[1]))
-                self.SetLimit(cmdlist)
-
-            optret = self.getOpt(cfg, 'SPC', 'ECB4')
-            if optret[0] == OK:
-                cmdlist = ['', '4']
-                cmdlist.append("%2.1f" % float(optret[1]))
-                self.SetLimit(cmdlist)
-
-            optret = self.getOpt(cfg, 'SPC', 'ECB5')
-            if optret[0] == OK:
-                cmdlist = ['', '5']
-                cmdlist.append("%2.1f" % float(optret[1]))
-                self.SetLimit(cmdlist)
-
-            optret = self.getOpt(cfg, 'SPC', 'ECB6')
-            if optret[0] == OK:
-                cmdlist = ['', '6']
-                cmdlist.append("%2.1f" % float(optret[1]))
-                self.SetLimit(cmdlist)
-
-            optret = self.getOpt(cfg, 'SPC', 'ECB7')
-            if optret[0] == OK:
-                cmdlist = ['', '7']
-                cmdlist.append("%2.1f" % float(optret[1]))
-                self.SetLimit(cmdlist)
+            for n in range(1, self.nchan + 1):
+                optret = self.getOpt(cfg, 'SPC', 'ECB%d' % n)
+                if optret[0] == OK:
+                    self.SetLimit(n, float(optret[1]))
 
-            optret = self.getOpt(cfg, 'SPC', 'ECB8')
-            if optret[0] == OK:
-                cmdlist = ['', '8']
-                cmdlist.append("%2.1f" % float(optret[1]))
-                self.SetLimit(cmdlist)
-    
             optret = self.getOpt(cfg, 'SPC', 'SOR')
             if optret[0] == OK:
-                cmdlist = ['']
                 # use AutoConvert to translate string list into a real list
                 seqlist, rtype = cvt.AutoConvert(optret[1])
-                for c in seqlist:
-                    cmdlist.append(c)
-                self.SetOrder(cmdlist)
-    
+                self.SetOrder(*[int(c) for c in seqlist])
+
             optret = self.getOpt(cfg, 'SPC', 'STM')
             if optret[0] == OK:
-                cmdlist = ['']
-                cmdlist.append(optret[1])
-                self.SetSTM(cmdlist)
-    
+                self.SetSTM(float(optret[1]))
+
             optret = self.getOpt(cfg, 'SPC', 'SEM')
             if optret[0] == OK:
-                cmdlist = ['']
-                cmdlist.append(optret[1])
-                self.SetSEM(cmdlist)
+                self.SetSEM(int(optret[1]))
+
+            optret = self.getOpt(cfg, 'SPC', 'TICK')
+            if optret[0] == OK and float(optret[1]) > 0:
+                self.load_tick = float(optret[1])
+
+            optret = self.getOpt(cfg, 'SPC', 'LOAD')
+            if optret[0] == OK:
+                self.SetLoadModel(int(optret[1]))
+
+            if self.load != None:
+                for n in range(1, self.nchan + 1):
+                    optret = self.getOpt(cfg, 'SPC', 'LOAD%d' % n)
+                    if optret[0] == OK:
+                        self.SetLoad(n, float(optret[1]))
 
 
     def dumpCFG(self):
@@ -857,15 +1305,14 @@ class SPCSim:
         self.SendResp("Seq Order     : %s" % str(self.seq_order))
         self.SendResp("Seq Delay     : %3.2f" % self.seq_dwell)
         self.SendResp("Seq Mode      : %d" % self.seq_sem)
+        self.SendResp("Channels      : %d" % self.nchan)
+        if self.load != None:
+            self.SendResp("Load Model    : on, tick %.3f s" % self.load.tick)
+        else:
+            self.SendResp("Load Model    : off")
         self.SendResp("")
-        self.SendResp("Channel 1     : %s" % str(self.channel[1]))
-        self.SendResp("Channel 2     : %s" % str(self.channel[2]))
-        self.SendResp("Channel 3     : %s" % str(self.channel[3]))
-        self.SendResp("Channel 4     : %s" % str(self.channel[4]))
-        self.SendResp("Channel 5     : %s" % str(self.channel[5]))
-        self.SendResp("Channel 6     : %s" % str(self.channel[6]))
-        self.SendResp("Channel 7     : %s" % str(self.channel[7]))
-        self.SendResp("Channel 8     : %s" % str(self.channel[8]))
+        for n in range(1, self.nchan + 1):
+            self.SendResp("Channel %-6d: %s" % (n, str(self.chanStatus(n))))
 
 
     #===========================================================================
@@ -878,15 +1325,20 @@ class SPCSim:
             the interpreter is aborted.
         """
         if self.monitor:
-            print "Main loop start"
+            print("Main loop start")
 
         while not self.stop_main:
             instr = self.GetCommand()
-            self.Dispatch(instr)
+            if ';' in instr:
+                self.SendBatch(self.RunBatch(instr))
+            else:
+                self.Dispatch(instr)
         self.SendResp("SPCSim terminated\r\n")
 
         if self.sport != None:
             self.sport.close()
+        if self.pty_link != None:
+            self.pty_link.stop()
 
 
 def SPC(mode, port, mon):
@@ -894,6 +1346,57 @@ def SPC(mode, port, mon):
     sim.RunSim()
 
 
+def SPCScript(script_path, mon):
+    """ Runs a command script file as a batch, and prints the results.
+
+        If script_path is "-" the script is read from stdin.
+    """
+    if script_path == "-":
+        script = sys.stdin.read()
+    else:
+        try:
+            fin = open(script_path, "r")
+            script = fin.read()
+            fin.close()
+        except Exception as e:
+            print("%s" % str(e))
+            return
+
+    sim = SPCSim(iomode=CONSOLE, monitor=mon, banner=False)
+    sim.SendBatch(sim.RunBatch(script))
+
+
+# command mix used by BenchDispatch()
+BENCH_CMDS = ("CHK 0", "ECB 1", "pow 2, 1", "LIM 3 2.5", "RST 3", "SEM 0",
+              "STM 0", "SOR 1 2 3 4 5 6 7 8", "ALL 0", "XYZ 1", "CHK x")
+
+
+def BenchDispatch(count):
+    """ Measures how many commands per second Dispatch() can handle.
+
+        No command waits for the STM pause (sequence steps and the pause
+        after POW run on the sequence timers), so the STM setting doesn't
+        affect the rate. The responses and error messages are collected in
+        resp_buf and msg_buf, as they are for a batch or a fleet device,
+        and then discarded.
+    """
+    sim = SPCSim(iomode=CONSOLE)
+
+    cmds = [BENCH_CMDS[i % len(BENCH_CMDS)] for i in range(0, count)]
+
+    sim.resp_buf = []
+    sim.msg_buf  = []
+    tstart = time.time()
+    for cmd in cmds:
+        sim.Dispatch(cmd)
+    elapsed = time.time() - tstart
+    sim.resp_buf = None
+    sim.msg_buf  = None
+
+    print("%d commands in %.3f s, %.0f commands/s" %
+          (count, elapsed, count / max(elapsed, 1e-9)))
+
+
 #===============================================================================
 # this will launch SPCSim from a command line start. It accepts up to three
 # parameters.
@@ -901,8 +1404,10 @@ if __name__ == '__main__':
     mode = CONSOLE
     port = None
     mon  = False
+    bench = 0
+    script = None
 
-    opt_codes   = "i:p:m:"
+    opt_codes   = "i:p:m:b:s:"
     opts, args  = getopt.getopt(sys.argv[1:], opt_codes)
 
     for opt in opts:
@@ -938,4 +1443,19 @@ if __name__ == '__main__':
             #endif
         #endif
 
-    SPC(mode, port, mon)
+        # get benchmark command count
+        if opt_char == '-b':
+            bench = int(opt_val)
+        #endif
+
+        # get command script file name
+        if opt_char == '-s':
+            script = opt_val
+        #endif
+
+    if bench > 0:
+        BenchDispatch(bench)
+    elif script != None:
+        SPCScript(script, mon)
+    else:
+        SPC(mode, port, mon)
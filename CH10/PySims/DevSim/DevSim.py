@@ -16,6 +16,7 @@ import  math
 
 import  SimLib.RetCodes as RC
 import  SimLib.FileUtils
+import  SimLib.TimeUtils as TimeUtils
 import  DevSimDefs as DS
 from    SimLib.FileUtils import ASCIIDataRead   # class import
 
@@ -975,6 +976,8 @@ class DevSim():
 
             Returns nothing.
         """
+        ticker = TimeUtils.PeriodicTicker(self.cyclicrate[inchan])
+
         while self.stopSim != True:
             # In NO_TRIG mode all cyclic source run continuously at
             # the clock rate set by the setCyclicClock() method.
@@ -997,7 +1000,9 @@ class DevSim():
                     self.__genCyclic(inchan)
                     self.trigevt[inchan] = False
 
-            time.sleep(self.cyclicrate[inchan])
+            # the rate may be changed at any time by setCyclicClock()
+            ticker.SetPeriod(self.cyclicrate[inchan])
+            ticker.Wait()
 
 
     def __fileRead(self, inchan):
@@ -1063,7 +1068,11 @@ class DevSim():
             else:
                 time.sleep(0.1)     # wait 100 ms
 
-        # and we're off, run until stopSim is set to True
+        # and we're off, run until stopSim is set to True. The loop is paced
+        # by a PeriodicTicker so the cycle time doesn't drift by the amount
+        # of time spent doing the work in each pass.
+        ticker = TimeUtils.PeriodicTicker(self.simtime)
+
         while self.stopSim != True:
             # scan through all four input channels, get available data and
             # write it into the input data buffers (databuffer). File input
@@ -1103,7 +1112,9 @@ class DevSim():
                 self.outbuffer[ochan] = oscaled + rscaled
                 self.outavail[ochan] = True
 
-            time.sleep(self.simtime)
+            # the cycle time may be changed at any time by setSimTime()
+            ticker.SetPeriod(self.simtime)
+            ticker.Wait()
 
 
     #-----------------------------------------------------------------
@@ -3,35 +3,233 @@
 #-------------------------------------------------------------------------------
 # Contains a timestamp function and an execution timer class.
 # 
-# The function getTS() returns a timestamp as an ASCII string. The class Timer
-# defines a timer object that is suitable for capturing things like code
-# execution times or I/O latency times.
+# The function getTS() returns a timestamp as an ASCII string, and getEpochNS()
+# returns the epoch time in nanoseconds. The class Timer defines a timer object
+# that is suitable for capturing things like code execution times or I/O
+# latency times. Named timers also collect running statistics (count, min, max,
+# mean and a latency histogram) in a shared registry, see TimerStats.
+#
+# The class PeriodicTicker paces a loop at a fixed rate without drift.
 #-------------------------------------------------------------------------------
 # Example source code for the book "Real-World Instrumentation with Python"
 # by J. M. Hughes, published by O'Reilly Media, December 2010,
 # ISBN 978-0-596-80956-0.
 #-------------------------------------------------------------------------------
-import  datetime
 import  time
+import  threading
+import  functools
 
-def getTS():
+# Epoch time in integer nanoseconds. time.time_ns() first appeared in
+# Python 3.7, so fall back to time.time() if it isn't available.
+if hasattr(time, "time_ns"):
+    getEpochNS = time.time_ns
+else:
+    def getEpochNS():
+        """ Returns the current epoch time in integer nanoseconds.
+        """
+        return int(time.time() * 1000000000)
+
+# High resolution wall clock time in integer nanoseconds, used by Timer and
+# PeriodicTicker. time.perf_counter_ns() first appeared in Python 3.7, and
+# time.perf_counter() in Python 3.3. time.clock() is no use as a fallback,
+# since on Unix it measures CPU time rather than elapsed time, so Python 2
+# uses time.time(). That has a good resolution, but it is not monotonic: it
+# can jump if the system clock is set.
+if hasattr(time, "perf_counter_ns"):
+    getPerfNS = time.perf_counter_ns
+else:
+    if hasattr(time, "perf_counter"):
+        perf_clock = time.perf_counter
+    else:
+        perf_clock = time.time
+    def getPerfNS():
+        """ Returns a high resolution elapsed time in nanoseconds.
+        """
+        return int(perf_clock() * 1000000000)
+
+# The formatted date and time for the most recent second seen by getTS(), as
+# a (second, string) tuple. It is replaced as a whole so that two threads can
+# never see the second and the string out of step.
+ts_cache = (None, "")
+
+
+def getTS(digits=0):
     """ Get current date and time from the system.
 
         Format the data and time into a string and return it to the caller. The
         data is in YYMMDD format, and the time is in HHMMSS format.
+
+        If digits is between 1 and 9 then that many digits of the fractional
+        seconds are appended to the time (3 for milliseconds, 6 for
+        microseconds, 9 for nanoseconds).
+
+        The date and time string only changes once a second, so it is cached
+        and only formatted again when the second changes. Use getEpochNS() if
+        you need the raw time as an integer number of nanoseconds.
+    """
+    global ts_cache
+
+    now = getEpochNS()
+    sec = now // 1000000000
+
+    cache_sec, ts = ts_cache
+    if sec != cache_sec:
+        ts = time.strftime("%y%m%d %H:%M:%S", time.localtime(sec))
+        ts_cache = (sec, ts)
+
+    if digits > 0:
+        frac = (now % 1000000000) // (10 ** (9 - digits))
+        ts = "%s.%0*d" % (ts, digits, frac)
+
+    return ts
+
+
+class TimerStats:
+    """ Running statistics for a named timer.
+
+        Collects the count, total, minimum and maximum of the recorded
+        times, along with a histogram for estimating percentiles. All times
+        are in integer nanoseconds.
+
+        The histogram uses the same idea as an HDR histogram: times are
+        bucketed by their top HIST_BITS bits, so each power of two is split
+        into 64 linear buckets. A percentile can always be recovered to
+        within about 1.6% of its value, no matter how large it is, and the
+        histogram never needs more than a few thousand buckets.
+    """
+    HIST_BITS = 7
+    HIST_SUB  = 1 << HIST_BITS      # times below this are recorded exactly
+
+    def __init__(self, name):
+        self.name  = name
+        self.lock  = threading.Lock()
+        self.Reset()
+
+
+    def Reset(self):
+        """ Discards all recorded times.
+        """
+        self.count = 0
+        self.total = 0
+        self.tmin  = None
+        self.tmax  = None
+        self.hist  = {}     # {bucket index: count}
+
+
+    def Record(self, tns):
+        """ Records one time value, in nanoseconds.
+        """
+        if tns < self.HIST_SUB:
+            idx = tns
+        else:
+            shift = tns.bit_length() - self.HIST_BITS
+            idx = (shift << self.HIST_BITS) + (tns >> shift)
+
+        with self.lock:
+            self.count += 1
+            self.total += tns
+            if self.tmin == None or tns < self.tmin:
+                self.tmin = tns
+            if self.tmax == None or tns > self.tmax:
+                self.tmax = tns
+            self.hist[idx] = self.hist.get(idx, 0) + 1
+
+
+    def GetMean(self):
+        """ Returns the mean of the recorded times, or None if there are none.
+        """
+        if self.count == 0:
+            return None
+        return self.total / float(self.count)
+
+
+    def GetPercentile(self, pct):
+        """ Returns an estimate of the given percentile (0 to 100) of the
+            recorded times, or None if there are none.
+
+            The value returned is the middle of the histogram bucket that
+            holds the percentile, limited to the actual min and max times.
+        """
+        if self.count == 0:
+            return None
+
+        with self.lock:
+            buckets = sorted(self.hist.items())
+            target  = pct / 100.0 * self.count
+            tmin, tmax = self.tmin, self.tmax
+
+        seen = 0
+        for idx, cnt in buckets:
+            seen += cnt
+            if seen >= target:
+                break
+
+        if idx < self.HIST_SUB:
+            val = idx
+        else:
+            # undo the encoding done by Record()
+            shift = idx >> self.HIST_BITS
+            low   = (idx & (self.HIST_SUB - 1)) << shift
+            val   = low + (1 << (shift - 1))
+
+        return min(max(val, tmin), tmax)
+
+
+    def Summary(self):
+        """ Returns a dictionary of the statistics, in nanoseconds.
+        """
+        return {"name":  self.name,
+                "count": self.count,
+                "min":   self.tmin,
+                "max":   self.tmax,
+                "mean":  self.GetMean(),
+                "p50":   self.GetPercentile(50),
+                "p90":   self.GetPercentile(90),
+                "p99":   self.GetPercentile(99),
+                "p999":  self.GetPercentile(99.9)}
+
+
+# The registry of named timer statistics, {name: TimerStats}
+timer_stats = {}
+timer_lock  = threading.Lock()
+
+
+def getTimerStats(name):
+    """ Returns the TimerStats object for a name, creating it if need be.
+    """
+    stats = timer_stats.get(name)
+    if stats == None:
+        with timer_lock:
+            stats = timer_stats.get(name)
+            if stats == None:
+                stats = TimerStats(name)
+                timer_stats[name] = stats
+    return stats
+
+
+def timerReport():
+    """ Returns the statistics for all named timers as a printable string.
+
+        Times are shown in microseconds.
     """
-    # fetch the current data and time from the system. Note that currutime
-    # is not used, but it's there if you need it.
-    t = datetime.datetime.now()
-    currdatetime = t.timetuple()
-    currutime = time.mktime(t.timetuple())
+    lines = ["%-20s %9s %10s %10s %10s %10s %10s %10s" %
+             ("Timer", "Count", "Min", "Mean", "P50", "P99", "P99.9", "Max")]
+    for name in sorted(timer_stats):
+        smry = timer_stats[name].Summary()
+        if smry["count"] == 0:
+            continue
+        usec = [smry[k] / 1000.0 for k in ("min", "mean", "p50", "p99",
+                                           "p999", "max")]
+        lines.append("%-20s %9d %10.1f %10.1f %10.1f %10.1f %10.1f %10.1f" %
+                     tuple([name, smry["count"]] + usec))
+    return "\n".join(lines)
 
-    # extract the values of interest from the string generated by time.mktime()
-    yr = str(currdatetime[0])
-    curr_date = "%02d"%int(yr[2:]) + "%02d"%currdatetime[1] + "%02d"%currdatetime[2]
-    curr_time = "%02d:"%currdatetime[3] + "%02d:"%currdatetime[4] + "%02d"%currdatetime[5]
 
-    return (curr_date + " " + curr_time)
+def resetTimerStats():
+    """ Discards the recorded times for all named timers.
+    """
+    for stats in list(timer_stats.values()):
+        stats.Reset()
 
 
 class Timer:
@@ -43,31 +241,79 @@ class Timer:
 
         All time values are returned in fractional seconds as floating point
         values.
+
+        If a name is given, a Timer may also be used to time a block of code
+        with a "with" statement, or to time every call to a function when used
+        as a decorator. Each elapsed time is recorded in the TimerStats object
+        for that name (an unnamed Timer records nothing this way), so timing
+        an I/O call takes just one line:
+
+            with TimeUtils.Timer("sio_read"):
+                data = port.read(64)
+
+            @TimeUtils.Timer("parse")
+            def parseRecord(recstr):
+                ...
+
+        Use timerReport() to print the results.
     """
-    def __init__(self):
+    def __init__(self, name=None):
         self.tstart = 0
         self.tlast  = 0
         self.tcurr  = 0
 
+        self.stats  = None
+        if name != None:
+            self.stats = getTimerStats(name)
+
         self.Reset()
 
 
+    def __enter__(self):
+        self.tenter = getPerfNS()
+        return self
+
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.stats != None:
+            self.stats.Record(getPerfNS() - self.tenter)
+        return False
+
+
+    def __call__(self, func):
+        # as with "with", an unnamed timer has nowhere to record the times,
+        # so the function is left as it is
+        stats = self.stats
+        if stats == None:
+            return func
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            tenter = getPerfNS()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stats.Record(getPerfNS() - tenter)
+
+        return timed
+
+
     def GetDelta(self):
         """ Returns time since last call to GetDelta().
 
             Essentially just a "lap" timer. Does not modify or clear the
             running time. Updates the local attributes tcurr and tlast.
         """
-        self.tcurr = time.clock()
+        self.tcurr = getPerfNS()
         delta = self.tcurr - self.tlast
         self.tlast = self.tcurr
-        return delta
+        return delta / 1e9
 
 
     def GetTotal(self):
         """ Returms time since timer object created.
         """
-        return time.clock() - self.tstart
+        return (getPerfNS() - self.tstart) / 1e9
 
 
     def Reset(self):
@@ -76,5 +322,122 @@ class Timer:
             Sets local data atributes tstart and tlast to the current
             system time.
         """
-        self.tstart = time.clock()
-        self.tlast = self.tstart
\ No newline at end of file
+        self.tstart = getPerfNS()
+        self.tlast = self.tstart
+
+
+class PeriodicTicker:
+    """ Drift-free pacing for periodic loops.
+
+        A loop that does its work and then calls time.sleep(period) actually
+        runs with a period of the work time plus the sleep time, and the
+        error builds up with every pass. A PeriodicTicker instead waits for
+        a series of absolute deadlines, period seconds apart, measured from
+        getPerfNS(), so the work time is absorbed into the wait:
+
+            ticker = TimeUtils.PeriodicTicker(0.001)
+            while not stop:
+                doWork()
+                ticker.Wait()
+
+        If the work overruns a deadline, Wait() returns at once. If one or
+        more whole periods were missed they are skipped and counted, so the
+        loop stays on its original schedule rather than trying to catch up
+        with a burst of back-to-back passes.
+
+        A period of zero (or less) means no wait at all, just as with
+        time.sleep(0), so the loop runs as fast as it can.
+
+        On Python 2 getPerfNS() is based on time.time(), which jumps if the
+        system clock is set. If it jumps back by more than a period, the
+        schedule is restarted from the current time, rather than waiting
+        out the jump.
+
+        time.sleep() will often wake up a little late. If spin is greater
+        than zero, Wait() sleeps until spin seconds before the deadline and
+        then polls the clock for the rest of the time. This uses more CPU,
+        but a spin of a few hundred microseconds will usually keep the
+        jitter at a 1 kHz loop rate down to a few microseconds.
+
+        If a name is given, the lateness of each wake-up (in nanoseconds) is
+        recorded in the TimerStats object with that name.
+    """
+    def __init__(self, period, spin=0.0, name=None):
+        self.period_ns = int(period * 1e9)
+        self.spin_ns   = int(spin * 1e9)
+
+        self.stats = None
+        if name != None:
+            self.stats = getTimerStats(name)
+
+        self.Reset()
+
+
+    def Reset(self):
+        """ Restarts the schedule from now and clears the counters.
+        """
+        self.tick_cnt = 0       # number of calls to Wait()
+        self.overruns = 0       # number of deadlines already passed
+        self.missed   = 0       # number of whole periods skipped
+        self.max_late = 0       # worst wake-up lateness in nanoseconds
+        self.next_ns  = getPerfNS() + self.period_ns
+
+
+    def SetPeriod(self, period):
+        """ Changes the period, starting from the next deadline.
+        """
+        period_ns = int(period * 1e9)
+        if period_ns != self.period_ns:
+            self.next_ns  += period_ns - self.period_ns
+            self.period_ns = period_ns
+
+
+    def GetPeriod(self):
+        """ Returns the period in fractional seconds.
+        """
+        return self.period_ns / 1e9
+
+
+    def Wait(self):
+        """ Waits for the next deadline.
+
+            Returns the number of whole periods that were missed because the
+            loop overran, which is zero if the deadline was met.
+        """
+        self.tick_cnt += 1
+        deadline = self.next_ns
+
+        now = getPerfNS()
+        if self.period_ns <= 0:
+            # free running, start the schedule from now if a period is set
+            self.next_ns = now
+            return 0
+
+        if now >= deadline:
+            # overrun, skip any whole periods and carry on right away
+            missed = (now - deadline) // self.period_ns
+            self.overruns += 1
+            self.missed   += missed
+            self.next_ns   = deadline + (missed + 1) * self.period_ns
+            return missed
+
+        if deadline - now > self.period_ns:
+            # the clock has been set back, restart the schedule from now
+            deadline = now + self.period_ns
+
+        wake = deadline - self.spin_ns
+        if wake > now:
+            time.sleep((wake - now) / 1e9)
+
+        now = getPerfNS()
+        while now < deadline:
+            now = getPerfNS()
+
+        late = now - deadline
+        if late > self.max_late:
+            self.max_late = late
+        if self.stats != None:
+            self.stats.Record(late)
+
+        self.next_ns = deadline + self.period_ns
+        return 0
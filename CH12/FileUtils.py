@@ -35,13 +35,76 @@ contain the data field, and all fields are written as strings.
 The [data] field is always written to a file as the string
 representation of a floating point value. In other words,
 integers will be written with the fractional part set to zero.
+
+An output file may optionally be rotated when it reaches a given
+size, or at the end of a fixed wall-clock period (see the method
+ASCIIDataWrite.setRotation()). The active file always keeps the
+name it was opened with. Each time it is rotated the closed file
+is renamed with a four digit segment number appended, like this:
+
+futest.dat          active file
+futest.dat.0001     oldest closed segment
+futest.dat.0002.gz  closed segment, compressed with gzip
+
+Closed segments may be compressed with gzip or lzma (xz) by a
+background thread, so the code calling writeData() never has to
+wait for the compression to finish. An ASCIIDataRead object
+opened with segments=True will read all of the segments, oldest
+first, followed by the active file, as if they were one file.
+
+By default a record is only as durable as the operating system's
+file buffers make it. A group commit mode (see the method
+ASCIIDataWrite.setCommit()) will flush and fsync the file after a
+given number of records or milliseconds, so that a crash can lose
+at most the records written since the last commit. The time limit is
+checked as each record is written, so while the data pauses the caller
+should call ASCIIDataWrite.pollCommit() from time to time (from its
+main loop, or a timer) to keep the bound. A crash may
+still leave a partial record at the end of the file. The reader
+ignores a trailing record with no line terminator, and the writer
+removes one when the file is re-opened in append mode.
+
+An ASCIIDataRead object may also follow a file while another
+process is writing it, in the same way as "tail -f" (see the
+method ASCIIDataRead.openFollow()). Only complete records are
+returned, and the reader copes with the file being rotated or
+truncated underneath it.
 """
+from __future__ import print_function
 
 import  os
+import  re
+import  time
+import  gzip
+import  shutil
+import  threading
+import  collections
+
+try:
+    import  queue
+except ImportError:
+    import  Queue as queue  # Python 2.x name
+
+try:
+    import  lzma            # not available prior to Python 3.3
+except ImportError:
+    lzma = None
 
 import  TimeUtils           # time and data utilities
 import  RetCodes    as RC   # shared return code definitions
 
+# file name extensions for the supported segment compression methods
+COMP_EXT = {"gz": ".gz", "xz": ".xz"}
+
+# follow mode polling limits, in seconds (see ASCIIDataRead.followRecords())
+FOLLOW_MIN_WAIT = 0.001
+FOLLOW_MAX_WAIT = 0.25
+
+# number of bytes before the read offset of a followed file that are checked
+# on each read, to spot a file that was truncated and then written past that
+# offset again (see ASCIIDataRead.followTruncated())
+FOLLOW_CHECK = 64
+
 
 class ASCIIDataWrite:
     """ Methods for writing ASCII data records to a file.
@@ -53,6 +116,22 @@ class ASCIIDataWrite:
     def __init__(self):
         self.seq_num  = 0
         self.file_ref = None
+        self.file_path = ""
+        self.file_size = 0
+
+        # file rotation control (see setRotation())
+        self.rot_size   = 0         # max file size in bytes, 0 = no limit
+        self.rot_period = 0         # rotation period in seconds, 0 = none
+        self.rot_time   = 0         # time of the next periodic rotation
+        self.rot_comp   = None      # compression method for closed segments
+        self.seg_num    = 0         # number of the last closed segment
+        self.compressor = None      # SegmentCompressor thread object
+
+        # group commit control (see setCommit())
+        self.commit_ms   = 0        # max time between commits, 0 = none
+        self.commit_recs = 0        # max records between commits, 0 = none
+        self.commit_cnt  = 0        # records written since the last commit
+        self.commit_time = 0        # time of the last commit
 
     
     def openOutput(self, path, file_name, reset_file=False):
@@ -66,6 +145,9 @@ class ASCIIDataWrite:
             opened in append mode. If True then file will be opened
             in write mode and any existing data will be deleted if
             the file already exists.
+
+            When a file is opened in append mode, a partial record
+            left at the end of the file by a crash is removed first.
         """
         rc = RC.NO_ERR
 
@@ -77,18 +159,230 @@ class ASCIIDataWrite:
                 fmode = "w"
             else:
                 fmode = "a"
+                trimPartial(file_path)
     
             try:
                 self.file_ref = open(file_path, fmode)
-            except Exception, e:
+            except Exception as e:
                 rc = RC.OPEN_ERR
-                print "%s" % str(e)
+                print("%s" % str(e))
+            else:
+                self.file_path = file_path
+                self.file_size = os.path.getsize(file_path)
+
+                # continue the segment numbering from the last segment
+                # left behind by a previous run, if any
+                self.seg_num = 0
+                seglist = listSegments(path, file_name)
+                if len(seglist) > 0:
+                    self.seg_num = segmentNumber(seglist[-1])
+                self.setRotTime()
+                self.commit_cnt  = 0
+                self.commit_time = time.time()
         else:
             rc = RC.NO_NAME
 
         return rc
+
+
+    def setRotation(self, max_size=0, period=0, compress=None):
+        """ Enables rotation of the output file.
+
+            If max_size is greater than zero then the output file will
+            be rotated before a write that would make it larger than
+            max_size bytes. If period is greater than zero then the
+            file will be rotated at the first write after the end of
+            each period (in seconds). Periods are aligned to the system
+            clock, so a period of 3600 rotates at the top of each hour.
+            Both may be used at the same time.
+
+            The compress parameter may be None, "gz" or "xz". If it is
+            not None then each closed segment will be compressed by a
+            background thread.
+
+            Setting both max_size and period to zero disables rotation.
+            Rotated segments from earlier runs are never removed, even
+            when a file is opened with reset_file set to True.
+        """
+        rc = RC.NO_ERR
+
+        if compress not in (None, "gz", "xz"):
+            rc = RC.BAD_PARAM
+        elif compress == "xz" and lzma == None:
+            print("lzma compression is not available")
+            rc = RC.BAD_PARAM
+        elif max_size < 0 or period < 0:
+            rc = RC.BAD_PARAM
+        else:
+            self.rot_size   = max_size
+            self.rot_period = period
+            self.rot_comp   = compress
+            self.setRotTime()
+
+        return rc
+
+
+    def setRotTime(self):
+        """ Computes the time of the next periodic rotation.
+        """
+        if self.rot_period > 0:
+            now = time.time()
+            self.rot_time = (int(now / self.rot_period) + 1) * self.rot_period
+        else:
+            self.rot_time = 0
+
+
+    def rotateOutput(self):
+        """ Closes the active output file and starts a new one.
+
+            The closed file is renamed as the next segment, and if
+            compression is enabled it is handed off to the background
+            compressor thread. A new empty file is then opened with the
+            original name.
+
+            This is called by writeData() when a rotation limit is
+            reached, but it may also be called directly.
+
+            If the file can't be renamed it is reopened for appending, so
+            nothing already written is lost, the segment number is not
+            advanced, and WRITE_ERR is returned.
+        """
+        rc = RC.NO_ERR
+
+        if self.file_ref == None:
+            return RC.NO_FILE
+
+        # make sure the closed segment is complete on the disk
+        if self.commitEnabled():
+            self.commitOutput()
+
+        rc = closeFile(self.file_ref)
+        self.file_ref = None
+
+        if rc == RC.NO_ERR:
+            seg_path = segmentName(self.file_path, self.seg_num + 1)
+            try:
+                os.rename(self.file_path, seg_path)
+            except Exception as e:
+                rc = RC.WRITE_ERR
+                print("%s" % str(e))
+            else:
+                self.seg_num += 1
+                self.file_size = 0
+                if self.rot_comp != None:
+                    if self.compressor == None:
+                        self.compressor = SegmentCompressor(self.rot_comp)
+                    self.compressor.submit(seg_path)
+
+            if rc == RC.NO_ERR:
+                mode = "w"
+            else:
+                mode = "a"
+            try:
+                self.file_ref = open(self.file_path, mode)
+            except Exception as e:
+                rc = RC.OPEN_ERR
+                print("%s" % str(e))
+
+        self.setRotTime()
+
+        return rc
     
     
+    def setCommit(self, max_ms=0, max_recs=0):
+        """ Enables group commit mode.
+
+            In group commit mode the output file is flushed and synced
+            to the disk (with os.fsync()) once max_recs records have
+            been written, or max_ms milliseconds after the last commit
+            (so no record waits longer than that), whichever comes
+            first.
+            Each commit covers all of the records written since the
+            previous one, so the cost of the fsync is shared by the
+            whole group. Either limit may be zero to disable it.
+
+            The max_ms limit is checked by writeData() and by
+            pollCommit(). writeData() alone only enforces it when the
+            next record arrives, so if the data may pause the caller
+            must call pollCommit() at least every max_ms milliseconds
+            or so for the limit to hold.
+
+            Setting both parameters to zero disables group commit mode.
+            The file is always committed when it is closed or rotated
+            while group commit mode is enabled. Use commitOutput() to
+            force a commit at any time.
+        """
+        rc = RC.NO_ERR
+
+        if max_ms < 0 or max_recs < 0:
+            rc = RC.BAD_PARAM
+        else:
+            self.commit_ms   = max_ms
+            self.commit_recs = max_recs
+
+        return rc
+
+
+    def commitEnabled(self):
+        """ Returns True if group commit mode is enabled.
+        """
+        return (self.commit_ms > 0) or (self.commit_recs > 0)
+
+
+    def commitDue(self):
+        """ Returns True if the records written since the last commit
+            should be committed now.
+        """
+        if self.commit_cnt == 0:
+            return False
+        if (self.commit_recs > 0) and (self.commit_cnt >= self.commit_recs):
+            return True
+        if self.commit_ms > 0:
+            if (time.time() - self.commit_time) * 1000.0 >= self.commit_ms:
+                return True
+        return False
+
+
+    def pollCommit(self):
+        """ Commits the records written since the last commit if the
+            max_ms limit set with setCommit() has been reached.
+
+            Intended to be called periodically, for example from the
+            caller's main loop, so that the limit is kept while no
+            records are being written. Does nothing if there is nothing
+            to commit.
+        """
+        if self.file_ref == None:
+            return RC.NO_FILE
+        if self.commitDue():
+            return self.commitOutput()
+        return RC.NO_ERR
+
+
+    def commitOutput(self):
+        """ Flush the output file and sync it to the disk.
+
+            All records written before the call will be on the disk
+            when it returns.
+        """
+        rc = RC.NO_ERR
+
+        if self.file_ref == None:
+            return RC.NO_FILE
+
+        try:
+            self.file_ref.flush()
+            os.fsync(self.file_ref.fileno())
+        except Exception as e:
+            rc = RC.WRITE_ERR
+            print("%s" % str(e))
+
+        self.commit_cnt  = 0
+        self.commit_time = time.time()
+
+        return rc
+
+
     def closeOutput(self):
         """ Close an already opened output file.
 
@@ -97,9 +391,17 @@ class ASCIIDataWrite:
         rc = RC.NO_ERR
   
         if self.file_ref and self.file_ref != None:
+            if self.commitEnabled() and self.commit_cnt > 0:
+                self.commitOutput()
             rc = closeFile(self.file_ref)
+            self.file_ref = None
         else:
             rc = RC.NO_FILE
+
+        # wait for any pending segment compression to finish
+        if self.compressor != None:
+            self.compressor.stop()
+            self.compressor = None
     
         return rc
     
@@ -138,22 +440,50 @@ class ASCIIDataWrite:
         if rc == RC.NO_ERR:
             try:
                 dstr = " %f" % float(dataval)
-            except Exception, e:
+            except Exception as e:
                 rc = RC.INV_DATA
-                print "%s" % str(e)
+                print("%s" % str(e))
 
             if rc == RC.NO_ERR:
                 outstr = hdr + dstr + "\n"
-    
+
+                if self.rotateDue(len(outstr)):
+                    rc = self.rotateOutput()
+
+            if rc == RC.NO_ERR:
                 try:
                     self.file_ref.write(outstr)
-                except Exception, e:
+                except Exception as e:
                     rc = RC.WRITE_ERR
-                    print "%s" % str(e)
+                    print("%s" % str(e))
+                else:
+                    self.file_size += len(outstr)
+                    self.commit_cnt += 1
+                    if self.commitDue():
+                        rc = self.commitOutput()
     
         return rc
 
 
+    def rotateDue(self, rec_len):
+        """ Returns True if the output file should be rotated before
+            writing a record of rec_len bytes.
+
+            A file is never rotated while it is still empty, so a single
+            record larger than the size limit will still be written.
+        """
+        if (self.rot_size > 0) and (self.file_size > 0):
+            if self.file_size + rec_len > self.rot_size:
+                return True
+        if (self.rot_period > 0) and (time.time() >= self.rot_time):
+            if self.file_size > 0:
+                return True
+            # nothing was written during the last period, so just move
+            # on to the next one rather than leave an empty segment
+            self.setRotTime()
+        return False
+
+
 class ASCIIDataRead:
     """ Defines an object for reading ASCII data records from a
         standard text file. Each object is unique, and more than
@@ -161,14 +491,29 @@ class ASCIIDataRead:
     """
     def __init__(self):
         self.file_ref  = None
+        self.seg_list  = []     # segments remaining to be read
+
+        # follow mode state (see openFollow())
+        self.follow_path = ""   # name of the file being followed
+        self.follow_ino  = 0    # inode of the file currently open
+        self.follow_pos  = 0    # offset of the next byte to read
+        self.follow_buf  = b""  # partial record at the end of the file
+        self.follow_tail = b""  # last bytes read, up to FOLLOW_CHECK
+        self.follow_recs = collections.deque()  # records not yet returned
+        self.stop_follow = False
     
 
-    def openInput(self, path, file_name):
+    def openInput(self, path, file_name, segments=False):
         """ Opens a file for ASCII data input.
         
             If path is not specified (an empty string is given as
             the path) then the function will attempt to open the
             named file in the current execution directory.
+
+            If segments is True then any rotated segments of the file
+            (see ASCIIDataWrite.setRotation()) will be read in order,
+            oldest first, followed by the file itself. Compressed
+            segments are decompressed as they are read.
         """
         rc = RC.NO_ERR
 
@@ -179,15 +524,204 @@ class ASCIIDataRead:
         # create the fully qualified path name
         file_path = os.path.join(path, file_name)
 
+        if segments:
+            self.seg_list = listSegments(path, file_name)
+            if os.path.exists(file_path):
+                self.seg_list.append(file_path)
+            if len(self.seg_list) > 0:
+                file_path = self.seg_list.pop(0)
+
+        try:
+            self.file_ref = openSegment(file_path)
+        except Exception as e:
+            rc = RC.OPEN_ERR
+            self.file_ref = None
+            self.seg_list = []
+
+        return rc
+
+
+    def nextSegment(self):
+        """ Closes the current input file and opens the next segment.
+
+            Returns True if another segment was opened, or False if
+            there are no more segments to read.
+        """
+        while len(self.seg_list) > 0:
+            closeFile(self.file_ref)
+            self.file_ref = None
+            try:
+                self.file_ref = openSegment(self.seg_list.pop(0))
+            except Exception as e:
+                # the segment may have been removed since the list was
+                # built, so just move on to the next one
+                print("%s" % str(e))
+            else:
+                return True
+        return False
+
+
+    def openFollow(self, path, file_name, from_end=False):
+        """ Opens a file to be followed while it is being written.
+
+            Once a file is opened for following, readNewRecords()
+            returns the complete records appended since the last call,
+            and followRecords() waits for new records as they arrive.
+            readDataRecord(), readDataFields() and getData() also work
+            with a followed file, and report an EOF when there is
+            nothing new to read.
+
+            If from_end is True then any data already in the file is
+            skipped, otherwise the whole file is read first.
+        """
+        rc = RC.NO_ERR
+
+        if path == None:
+            path = './'
+
+        file_path = os.path.join(path, file_name)
+
         try:
-            self.file_ref = open(file_path, "r")
-        except Exception, e:
+            self.file_ref = open(file_path, "rb")
+        except Exception as e:
             rc = RC.OPEN_ERR
             self.file_ref = None
+        else:
+            self.follow_path = file_path
+            self.follow_ino  = os.fstat(self.file_ref.fileno()).st_ino
+            self.follow_pos  = 0
+            self.follow_buf  = b""
+            self.follow_tail = b""
+            self.follow_recs.clear()
+            self.stop_follow = False
+            if from_end:
+                self.file_ref.seek(0, os.SEEK_END)
+                self.follow_pos = self.file_ref.tell()
 
         return rc
 
 
+    def readNewRecords(self):
+        """ Returns a list of the complete records appended to a
+            followed file since the last read.
+
+            Everything that is available is read in one operation, and
+            any partial record at the end is held until the rest of it
+            has been written. Returns an empty list if there is nothing
+            new. Does not wait for data.
+
+            If the file has been truncated, reading starts again from
+            the beginning. If it has been renamed or removed (rotated),
+            the rest of the old file is read and then the new file with
+            the original name is opened once it appears. Like "tail -F",
+            if the file is rotated more than once between two reads then
+            the segments in between are not read.
+        """
+        if self.file_ref == None or len(self.follow_path) == 0:
+            return []
+
+        if self.followTruncated():
+            # truncated, start over at the beginning
+            self.file_ref.seek(0)
+            self.follow_pos  = 0
+            self.follow_buf  = b""
+            self.follow_tail = b""
+
+        data = self.file_ref.read()
+        if len(data) == 0:
+            try:
+                fstat = os.stat(self.follow_path)
+            except OSError:
+                # rotated, and the new file doesn't exist yet
+                return []
+
+            if fstat.st_ino != self.follow_ino:
+                # rotated, pick up anything written to the old file just
+                # before it was closed, then switch to the new file
+                data = self.file_ref.read()
+                if len(data) == 0:
+                    closeFile(self.file_ref)
+                    try:
+                        self.file_ref = open(self.follow_path, "rb")
+                    except Exception as e:
+                        self.file_ref = None
+                        return []
+                    self.follow_ino = os.fstat(self.file_ref.fileno()).st_ino
+                    self.follow_pos  = 0
+                    self.follow_buf  = b""
+                    self.follow_tail = b""
+                    data = self.file_ref.read()
+
+        self.follow_pos += len(data)
+        if len(data) >= FOLLOW_CHECK:
+            self.follow_tail = data[-FOLLOW_CHECK:]
+        elif len(data) > 0:
+            self.follow_tail = (self.follow_tail + data)[-FOLLOW_CHECK:]
+
+        buf = self.follow_buf + data
+        eol = buf.rfind(b"\n")
+        if eol < 0:
+            self.follow_buf = buf
+            return []
+
+        self.follow_buf = buf[eol+1:]
+        return buf[:eol+1].decode("ascii", "replace").splitlines(True)
+
+
+    def followTruncated(self):
+        """ Returns True if a followed file has been truncated since the
+            last read.
+
+            The size of the open file is compared with the read offset,
+            and the last bytes read are compared with what is now in the
+            file just before the offset. So a file that was truncated and
+            then written past the old offset before this check is still
+            caught (unless the new data happens to match the old). The
+            file is left positioned at the read offset.
+        """
+        if os.fstat(self.file_ref.fileno()).st_size < self.follow_pos:
+            return True
+
+        ntail = len(self.follow_tail)
+        if ntail > 0:
+            self.file_ref.seek(self.follow_pos - ntail)
+            if self.file_ref.read(ntail) != self.follow_tail:
+                return True
+        return False
+
+
+    def followRecords(self, min_wait=FOLLOW_MIN_WAIT, max_wait=FOLLOW_MAX_WAIT):
+        """ Generator that returns records from a followed file as they
+            are written.
+
+            Each time no new data is found the wait before the next
+            check is doubled, from min_wait up to max_wait seconds, so
+            an idle file costs very little to follow. As soon as new
+            data is found the wait drops back to min_wait.
+
+            The generator finishes when stopFollow() is called (from
+            another thread, for example) or the file is closed.
+        """
+        wait = min_wait
+        while not self.stop_follow and self.file_ref != None:
+            if len(self.follow_recs) == 0:
+                self.follow_recs.extend(self.readNewRecords())
+
+            if len(self.follow_recs) > 0:
+                wait = min_wait
+                while len(self.follow_recs) > 0:
+                    yield self.follow_recs.popleft()
+            else:
+                time.sleep(wait)
+                wait = min(wait * 2, max_wait)
+
+
+    def stopFollow(self):
+        """ Terminates a followRecords() generator.
+        """
+        self.stop_follow = True
+
+
     def closeInput(self):
         """ Close an already opened input file.
 
@@ -200,8 +734,13 @@ class ASCIIDataRead:
   
         if self.file_ref and self.file_ref != None:
             rc = closeFile(self.file_ref)
+            self.file_ref = None
         else:
             rc = RC.NO_FILE
+
+        self.seg_list = []
+        self.follow_path = ""
+        self.follow_recs.clear()
     
         return rc
 
@@ -211,7 +750,9 @@ class ASCIIDataRead:
 
             Reads one record at a time and returns the entire record
             string as-is from the file. An EOF returns an empty
-            record string.
+            record string. A partial record at the end of the last
+            file (one without a line terminator, such as might be left
+            by a crash during a write) is treated as an EOF.
 
             Return is a 2-tuple consisting of a return code and the
             record string.
@@ -219,11 +760,27 @@ class ASCIIDataRead:
         rc = RC.NO_ERR
 
         # verify that there is a valid file to read from
-        if self.file_ref != None:
-            # fetch a line from the file
+        if self.file_ref != None and len(self.follow_path) > 0:
+            # following a file, return the next new record (if any)
+            if len(self.follow_recs) == 0:
+                try:
+                    self.follow_recs.extend(self.readNewRecords())
+                except Exception as e:
+                    rc = RC.READ_ERR
+            if len(self.follow_recs) > 0:
+                record = self.follow_recs.popleft()
+            else:
+                record = ""
+        elif self.file_ref != None:
+            # fetch a line from the file, moving on to the next segment
+            # (if there is one) at the end of the current one
             try:
                 record = self.file_ref.readline()
-            except Exception, e:
+                while not record.endswith("\n") and self.nextSegment():
+                    record = self.file_ref.readline()
+                if not record.endswith("\n"):
+                    record = ""
+            except Exception as e:
                 record = ""
                 rc = RC.READ_ERR
         else:
@@ -278,8 +835,8 @@ class ASCIIDataRead:
                         retflds.append(float(readflds[0]))
                     else:
                         rc = RC.INV_FORMAT
-                except Exception, e:
-                    print str(e)
+                except Exception as e:
+                    print(str(e))
                     retflds = []
                     rc = RC.INV_DATA
             else:
@@ -319,6 +876,183 @@ class ASCIIDataRead:
 
 # Module functions
 
+def segmentName(file_path, seg_num):
+    """ Returns the file name for segment number seg_num of file_path.
+    """
+    return "%s.%04d" % (file_path, seg_num)
+
+
+def segmentNumber(seg_path):
+    """ Returns the segment number from a segment file name.
+    """
+    return int(re.search(r"\.(\d+)(\.gz|\.xz)?$", seg_path).group(1))
+
+
+def listSegments(path, file_name):
+    """ Returns a list of the rotated segments of a file, oldest first.
+
+        The list contains the full path names of the closed segments
+        (compressed or not), but not the active file itself. If a
+        segment exists both compressed and uncompressed (compression
+        is still in progress), only the uncompressed name is listed.
+    """
+    if path == None or len(path) == 0:
+        path = './'
+
+    segpat = re.compile(r"^%s\.(\d+)(\.gz|\.xz)?$" % re.escape(file_name))
+
+    segs = {}
+    try:
+        names = os.listdir(path)
+    except Exception as e:
+        return []
+
+    for name in names:
+        match = segpat.match(name)
+        if match:
+            seg_num = int(match.group(1))
+            if match.group(2) == None or seg_num not in segs:
+                segs[seg_num] = os.path.join(path, name)
+
+    return [segs[n] for n in sorted(segs)]
+
+
+def openSegment(file_path):
+    """ Opens a file or file segment for reading as text.
+
+        Files ending in .gz or .xz are decompressed as they are read.
+        If an uncompressed segment has been compressed since its name
+        was obtained, the compressed version will be opened instead.
+    """
+    if not os.path.exists(file_path):
+        for ext in COMP_EXT.values():
+            if os.path.exists(file_path + ext):
+                file_path = file_path + ext
+                break
+
+    if file_path.endswith(COMP_EXT["gz"]):
+        return gzip.open(file_path, "rt")
+    elif file_path.endswith(COMP_EXT["xz"]) and lzma != None:
+        return lzma.open(file_path, "rt")
+    return open(file_path, "r")
+
+
+def compressSegment(seg_path, method):
+    """ Compresses a closed file segment and removes the original.
+
+        The compressed data is written to a temporary file which is
+        renamed when it is complete, so a reader will never see a
+        partially written compressed segment.
+    """
+    rc = RC.NO_ERR
+
+    comp_path = seg_path + COMP_EXT[method]
+    tmp_path  = comp_path + ".tmp"
+
+    if method == "xz":
+        copen = lzma.open
+    else:
+        copen = gzip.open
+
+    try:
+        fin = open(seg_path, "rb")
+        try:
+            fout = copen(tmp_path, "wb")
+            try:
+                shutil.copyfileobj(fin, fout)
+            finally:
+                fout.close()
+        finally:
+            fin.close()
+        os.rename(tmp_path, comp_path)
+        os.remove(seg_path)
+    except Exception as e:
+        rc = RC.WRITE_ERR
+        print("%s" % str(e))
+
+    return rc
+
+
+class SegmentCompressor(threading.Thread):
+    """ Compresses closed file segments in the background.
+
+        Segment file names are placed on a queue by submit(), and are
+        compressed one at a time by the thread. Calling stop() waits
+        for the queue to empty and then terminates the thread.
+    """
+    def __init__(self, method="gz"):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.method = method
+        self.segq   = queue.Queue()
+        self.start()
+
+
+    def submit(self, seg_path):
+        """ Queue a closed segment for compression.
+        """
+        self.segq.put(seg_path)
+
+
+    def stop(self):
+        """ Finish any queued work and terminate the thread.
+        """
+        self.segq.put(None)
+        self.join()
+
+
+    def run(self):
+        while True:
+            seg_path = self.segq.get()
+            if seg_path == None:
+                break
+            compressSegment(seg_path, self.method)
+
+
+def trimPartial(file_path):
+    """ Removes a partial record from the end of a file.
+
+        If the last byte in the file is not a line terminator, the file
+        is truncated just after the last one that is found. Files that
+        don't exist, are empty, or end with a complete record are left
+        unchanged.
+    """
+    rc = RC.NO_ERR
+    blksize = 4096
+
+    try:
+        fio = open(file_path, "rb+")
+    except Exception as e:
+        # nothing to trim if the file doesn't exist yet
+        return rc
+
+    try:
+        fio.seek(0, os.SEEK_END)
+        end = fio.tell()
+        pos = end
+        while pos > 0:
+            start = max(0, pos - blksize)
+            fio.seek(start)
+            blk = fio.read(pos - start)
+            if pos == end and blk.endswith(b"\n"):
+                break
+            eol = blk.rfind(b"\n")
+            if eol >= 0:
+                fio.truncate(start + eol + 1)
+                break
+            pos = start
+        else:
+            # no complete records in the file at all
+            fio.truncate(0)
+    except Exception as e:
+        rc = RC.WRITE_ERR
+        print("%s" % str(e))
+    finally:
+        fio.close()
+
+    return rc
+
+
 def closeFile(file_id):
     """ Close an already opened input or output file.
 
@@ -328,9 +1062,9 @@ def closeFile(file_id):
 
     try:
         file_id.close()
-    except Exception, e:
+    except Exception as e:
         rc = RC.INV_FILE
-        print "%s" % str(e)
+        print("%s" % str(e))
 
     return rc
 
@@ -353,24 +1087,24 @@ if __name__ == "__main__":
 
     fin.openInput("./","futest.dat")
 
-    print "Read Records"
-    print "%d %s" % fin.readDataRecord(),
-    print "%d %s" % fin.readDataRecord(),
-    print "%d %s" % fin.readDataRecord(),
-    print "%d %s" % fin.readDataRecord(),
-    print "%d %s" % fin.readDataRecord(),
-    print "%d %s" % fin.readDataRecord(),
+    print("Read Records")
+    print("%d %s" % fin.readDataRecord(), end="")
+    print("%d %s" % fin.readDataRecord(), end="")
+    print("%d %s" % fin.readDataRecord(), end="")
+    print("%d %s" % fin.readDataRecord(), end="")
+    print("%d %s" % fin.readDataRecord(), end="")
+    print("%d %s" % fin.readDataRecord(), end="")
 
     fin.closeInput()
 
     fin.openInput("./","futest.dat")
 
-    print "Read Fields"
-    print "%d %s" % fin.readDataFields()
-    print "%d %s" % fin.readDataFields()
-    print "%d %s" % fin.readDataFields()
-    print "%d %s" % fin.readDataFields()
-    print "%d %s" % fin.readDataFields()
-    print "%d %s" % fin.readDataFields()
+    print("Read Fields")
+    print("%d %s" % fin.readDataFields())
+    print("%d %s" % fin.readDataFields())
+    print("%d %s" % fin.readDataFields())
+    print("%d %s" % fin.readDataFields())
+    print("%d %s" % fin.readDataFields())
+    print("%d %s" % fin.readDataFields())
 
-    fin.closeInput()
\ No newline at end of file
+    fin.closeInput()
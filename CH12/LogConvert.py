@@ -0,0 +1,497 @@
+#! /usr/bin/python
+#-------------------------------------------------------------------------------
+# LogConvert.py
+#-------------------------------------------------------------------------------
+# Converts ASCII data files (as written by FileUtils.ASCIIDataWrite) to
+# binary record files and back, in parallel across files.
+#
+# Each ASCII record is stored as a binary record in a PACKED binary record
+# file (see RecordFormat.py). The time of day is stored as integers rather
+# than text (seconds since midnight, the fraction of a second in nanoseconds,
+# and the number of fraction digits the ASCII time had).
+#
+# The record layout is chosen from the fields the log holds, so a log of
+# bare data values is stored as 8 byte records, one with sequence numbers
+# as 12 byte records, and so on up to the full 25 byte LOG_SCHEMA record.
+# The first chunk of a file picks the layout, and if a later chunk has a
+# field the layout is missing the file is converted again with that field
+# added (so a file is read at most three times). In a log that mixes record
+# forms, the fields a record doesn't have are stored as -1, so a binary file
+# converts back into exactly the ASCII records it came from. Such a log pays
+# for the widest record it holds, so a data-only log with a few timestamped
+# records may come out larger than the ASCII file. Records with a
+# sequence number or date that doesn't fit in 32 bits are skipped and
+# counted as invalid, like other bad records.
+#
+# Files are streamed a chunk at a time, so memory use doesn't depend on the
+# size of the files. Each file is converted by a worker process, and the
+# number of records and bytes processed are reported along with the rates.
+#
+# The benchmark mode converts a set of ASCII files to binary, and then times
+# loading the same data from each format.
+#-------------------------------------------------------------------------------
+# Example source code for the book "Real-World Instrumentation with Python"
+# by J. M. Hughes, published by O'Reilly Media, December 2010,
+# ISBN 978-0-596-80956-0.
+#-------------------------------------------------------------------------------
+from __future__ import print_function
+
+import  os
+import  sys
+import  time
+import  getopt
+import  concurrent.futures
+
+import  RetCodes    as RC   # shared return code definitions
+import  RecordCodec
+import  RecordFormat
+import  ParallelRead
+
+# Binary record fields for one ASCII data record, in groups that are only
+# stored if the log uses them. An ASCII time of HH:MM:SS with up to 9
+# fraction digits is held in time_s, time_ns and time_digits.
+SEQ_FIELDS  = (("seq_num",     "i"),)
+TS_FIELDS   = (("date",        "i"),
+               ("time_s",      "i"),
+               ("time_ns",     "i"),
+               ("time_digits", "b"))
+DATA_FIELDS = (("data_val",    "d"),)
+
+# the record with every field
+LOG_SCHEMA = SEQ_FIELDS + TS_FIELDS + DATA_FIELDS
+
+# range of the 32 bit seq_num and date fields
+INT32_MIN  = -2**31
+INT32_MAX  = 2**31 - 1
+
+BIN_EXT    = ".bin"             # appended to ASCII file names
+ASCII_EXT  = ".txt"             # used for binary files without BIN_EXT
+CHUNK_RECS = 65536              # records per write when converting to ASCII
+
+
+def logSchema(has_seq=True, has_ts=True):
+    """ Returns the record schema for a log with or without sequence
+        numbers and timestamps.
+    """
+    schema = ()
+    if has_seq:
+        schema += SEQ_FIELDS
+    if has_ts:
+        schema += TS_FIELDS
+    return schema + DATA_FIELDS
+
+
+def logCodec(has_seq=True, has_ts=True):
+    """ Returns the RecordCodec for a log record layout (LOG_SCHEMA by
+        default).
+    """
+    return RecordCodec.getCodec(logSchema(has_seq, has_ts), "<")
+
+
+def logLayout(names):
+    """ Returns the layout of a log record file from its field names, as a
+        2-tuple (has_seq, has_ts), or None if the names aren't those of a
+        log record.
+    """
+    for has_seq in (True, False):
+        for has_ts in (True, False):
+            if tuple(names) == logCodec(has_seq, has_ts).names:
+                return has_seq, has_ts
+    return None
+
+
+def binaryName(file_path):
+    """ Returns the name of the binary file for an ASCII file.
+    """
+    return file_path + BIN_EXT
+
+
+def asciiName(file_path):
+    """ Returns the name of the ASCII file for a binary file.
+    """
+    if file_path.endswith(BIN_EXT):
+        return file_path[:-len(BIN_EXT)]
+    return file_path + ASCII_EXT
+
+
+def parseTime(tstr):
+    """ Converts an ASCII time (HH:MM:SS, with up to 9 digits of fractional
+        seconds) to the LOG_SCHEMA time fields.
+
+        Returns a 3-tuple of the seconds since midnight, the fraction in
+        nanoseconds, and the number of fraction digits. An empty string
+        gives (-1, 0, 0). Raises ValueError if the time is invalid.
+    """
+    if len(tstr) == 0:
+        return -1, 0, 0
+
+    hms, dot, frac = tstr.partition(".")
+    hh, mm, ss = hms.split(":")
+    if len(hh) != 2 or len(mm) != 2 or len(ss) != 2 or len(frac) > 9 or \
+       (dot and not frac.isdigit()):
+        raise ValueError("invalid time: %s" % tstr)
+
+    ns = 0
+    if len(frac) > 0:
+        ns = int(frac) * 10 ** (9 - len(frac))
+    return int(hh) * 3600 + int(mm) * 60 + int(ss), ns, len(frac)
+
+
+def formatTime(time_s, time_ns, time_digits):
+    """ Converts the LOG_SCHEMA time fields back to an ASCII time, the
+        inverse of parseTime().
+    """
+    if time_s == -1:
+        return ""
+
+    mins, ss = divmod(time_s, 60)
+    hh, mm = divmod(mins, 60)
+    tstr = "%02d:%02d:%02d" % (hh, mm, ss)
+    if time_digits > 0:
+        tstr = "%s.%0*d" % (tstr, time_digits,
+                            time_ns // 10 ** (9 - time_digits))
+    return tstr
+
+
+def formatRecord(seq_num, date, time_s, time_ns, time_digits, data_val):
+    """ Returns the ASCII record string for one LOG_SCHEMA record, in the
+        same form as ASCIIDataWrite.writeData() writes it.
+    """
+    if seq_num != -1:
+        sn = "%02d " % seq_num
+    else:
+        sn = ""
+
+    if date != -1:
+        ts = "%06d %s " % (date, formatTime(time_s, time_ns, time_digits))
+    else:
+        ts = ""
+
+    return "%s%s %f\n" % (sn, ts, data_val)
+
+
+def chunkRecords(cols):
+    """ Converts the columns returned by ParallelRead.parseChunk() to
+        LOG_SCHEMA record tuples.
+
+        Returns a 2-tuple consisting of the number of records that could
+        not be converted (an invalid time, or a sequence number or date out
+        of range), and the list of records.
+    """
+    bad = 0
+    recs = []
+    for sn, date, tstr, val in zip(cols["seq"], cols["date"], cols["time"],
+                                   cols["data"]):
+        if not (INT32_MIN <= sn <= INT32_MAX and
+                INT32_MIN <= date <= INT32_MAX):
+            bad += 1
+            continue
+        try:
+            recs.append((sn, date) + parseTime(tstr) + (val,))
+        except ValueError:
+            bad += 1
+    return bad, recs
+
+
+def writeLog(src_path, dst_path, chunk_size, layout):
+    """ Converts an ASCII data file to a binary record file with a given
+        record layout, (has_seq, has_ts), or with the layout of the first
+        chunk if layout is None.
+
+        Returns a 3-tuple consisting of a return code, the number of
+        records converted, and None, or a wider layout if a record was
+        found that doesn't fit the one used. In that case the output file
+        is incomplete, and has to be written again with the new layout.
+    """
+    rc = RC.NO_ERR
+    nrecs = 0
+    fout = None
+    try:
+        for start, end in ParallelRead.splitChunks(src_path, chunk_size):
+            bad, cols = ParallelRead.parseChunk(0, src_path, start, end)
+            cbad, recs = chunkRecords(cols)
+            if bad + cbad > 0:
+                rc = RC.INV_DATA
+
+            has_seq = any([r[0] != -1 for r in recs])
+            has_ts  = any([r[1] != -1 for r in recs])
+            if layout == None:
+                layout = (has_seq, has_ts)
+            elif (has_seq and not layout[0]) or (has_ts and not layout[1]):
+                return rc, nrecs, (has_seq or layout[0], has_ts or layout[1])
+
+            if fout == None:
+                fout = RecordFormat.BinDataWrite()
+                orc = fout.openOutput(os.path.dirname(dst_path),
+                                      os.path.basename(dst_path),
+                                      reset_file=True, codec=logCodec(*layout))
+                if orc != RC.NO_ERR:
+                    fout = None
+                    return orc, nrecs, None
+
+            # keep only the fields in the layout
+            if layout == (False, False):
+                recs = [(r[5],) for r in recs]
+            elif layout == (True, False):
+                recs = [(r[0], r[5]) for r in recs]
+            elif layout == (False, True):
+                recs = [r[1:] for r in recs]
+
+            wrc = fout.writeRecords(recs)
+            if wrc != RC.NO_ERR:
+                rc = wrc
+                break
+            nrecs += len(recs)
+
+        if fout == None:
+            # an empty file, or one with no valid records
+            fout = RecordFormat.BinDataWrite()
+            orc = fout.openOutput(os.path.dirname(dst_path),
+                                  os.path.basename(dst_path),
+                                  reset_file=True, codec=logCodec(False, False))
+            if orc != RC.NO_ERR:
+                fout = None
+                return orc, nrecs, None
+    except Exception as e:
+        print("%s" % str(e))
+        rc = RC.READ_ERR
+    finally:
+        if fout != None:
+            fout.closeOutput()
+
+    return rc, nrecs, None
+
+
+def asciiToBinary(src_path, dst_path, chunk_size=ParallelRead.CHUNK_SIZE):
+    """ Converts an ASCII data file to a binary record file.
+
+        The ASCII file is read chunk_size bytes at a time, and each chunk
+        is written with a single write. Invalid records are skipped. The
+        record layout only includes the fields that the file uses.
+
+        Returns a 4-tuple consisting of a return code, the number of
+        records converted, and the number of bytes read and written.
+    """
+    layout = None
+    while True:
+        rc, nrecs, layout = writeLog(src_path, dst_path, chunk_size, layout)
+        if layout == None:
+            break
+
+    if not os.path.exists(dst_path):
+        return rc, nrecs, 0, 0
+    return rc, nrecs, os.path.getsize(src_path), os.path.getsize(dst_path)
+
+
+def binaryToAscii(src_path, dst_path, chunk_recs=CHUNK_RECS):
+    """ Converts a binary record file back to an ASCII data file.
+
+        Returns a 4-tuple consisting of a return code, the number of
+        records converted, and the number of bytes read and written.
+    """
+    fin = RecordFormat.BinDataRead()
+    rc = fin.openInput(os.path.dirname(src_path), os.path.basename(src_path))
+    if rc != RC.NO_ERR:
+        return rc, 0, 0, 0
+
+    layout = logLayout(fin.codec.names)
+    if layout == None:
+        print("%s does not contain ASCII log records" % src_path)
+        fin.closeInput()
+        return RC.INV_FORMAT, 0, 0, 0
+    has_seq, has_ts = layout
+
+    nrecs = 0
+    try:
+        fout = open(dst_path, "w")
+    except Exception as e:
+        print("%s" % str(e))
+        fin.closeInput()
+        return RC.OPEN_ERR, 0, 0, 0
+
+    try:
+        while True:
+            rrc, recs = fin.readRecords(chunk_recs)
+            if rrc != RC.NO_ERR:
+                if rrc != RC.NO_DATA:
+                    rc = rrc
+                break
+            if not has_seq:
+                recs = [(-1,) + r for r in recs]
+            if not has_ts:
+                recs = [r[:-1] + (-1, -1, 0, 0, r[-1]) for r in recs]
+            fout.write("".join([formatRecord(*rec) for rec in recs]))
+            nrecs += len(recs)
+    except Exception as e:
+        print("%s" % str(e))
+        rc = RC.WRITE_ERR
+    finally:
+        fout.close()
+        fin.closeInput()
+
+    return rc, nrecs, os.path.getsize(src_path), os.path.getsize(dst_path)
+
+
+def convertFiles(func, jobs, workers=None):
+    """ Applies a conversion function to a list of (src_path, dst_path)
+        tuples, one file per worker process.
+
+        If workers is 1 the files are converted in the calling process,
+        otherwise a ProcessPoolExecutor with the given number of worker
+        processes is used (None uses one per CPU).
+
+        Returns a list with the result from func for each job, in order.
+    """
+    if workers == 1:
+        return [func(src, dst) for src, dst in jobs]
+
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = [pool.submit(func, src, dst) for src, dst in jobs]
+        return [f.result() for f in futures]
+    finally:
+        pool.shutdown()
+
+
+def loadBinary(file_path):
+    """ Loads a whole binary record file with a single read.
+
+        Returns a 2-tuple consisting of a return code and the list of
+        records.
+    """
+    fin = RecordFormat.BinDataRead()
+    rc = fin.openInput(os.path.dirname(file_path), os.path.basename(file_path))
+    if rc != RC.NO_ERR:
+        return rc, []
+
+    count = os.path.getsize(file_path) // fin.codec.size
+    rc, recs = fin.readRecords(count)
+    fin.closeInput()
+
+    return rc, recs
+
+
+def rateStr(nrecs, nbytes, elapsed):
+    """ Returns a string with the records/s and MB/s rates.
+    """
+    if elapsed <= 0.0:
+        elapsed = 1e-9
+    return "%10.0f rec/s %8.2f MB/s" % (nrecs / elapsed,
+                                        nbytes / elapsed / 1000000.0)
+
+
+def reportResults(jobs, results, elapsed):
+    """ Prints the results of convertFiles() and the overall rates.
+
+        Returns the first error return code, or NO_ERR.
+    """
+    rc = RC.NO_ERR
+    tot_recs = 0
+    tot_bytes = 0
+
+    for (src, dst), (frc, nrecs, nin, nout) in zip(jobs, results):
+        tot_recs += nrecs
+        tot_bytes += nin
+        print("%s -> %s: %d records, %d -> %d bytes" % (src, dst, nrecs, nin, nout))
+        if frc != RC.NO_ERR:
+            print("    %s" % RC.GetErrorName(frc))
+            if rc == RC.NO_ERR:
+                rc = frc
+
+    print("Total: %d records, %d bytes in %.3f s, %s" %
+          (tot_recs, tot_bytes, elapsed, rateStr(tot_recs, tot_bytes, elapsed)))
+
+    return rc
+
+
+def benchmark(file_paths, workers=None):
+    """ Converts a set of ASCII data files to binary, then times loading
+        each file from both formats.
+
+        The binary files are left next to the ASCII files.
+    """
+    jobs = [(src, binaryName(src)) for src in file_paths]
+
+    tstart = time.time()
+    results = convertFiles(asciiToBinary, jobs, workers)
+    rc = reportResults(jobs, results, time.time() - tstart)
+    if rc not in (RC.NO_ERR, RC.INV_DATA):
+        return rc
+
+    print("")
+    print("%-32s %-6s %10s %8s  %s" % ("File", "Format", "Records", "Time",
+                                       "Rate"))
+    for src, dst in jobs:
+        for fmt, path in (("ASCII", src), ("binary", dst)):
+            tstart = time.time()
+            if fmt == "ASCII":
+                lrc, cols = ParallelRead.readFiles([path], workers=1)
+                nrecs = len(cols["data"])
+            else:
+                lrc, recs = loadBinary(path)
+                nrecs = len(recs)
+            elapsed = time.time() - tstart
+            nbytes = os.path.getsize(path)
+            print("%-32s %-6s %10d %7.3fs  %s" %
+                  (os.path.basename(path), fmt, nrecs, elapsed,
+                   rateStr(nrecs, nbytes, elapsed)))
+
+    return rc
+
+
+def usage():
+    print("Usage: LogConvert [options] file_name [file_name ...]")
+    print("       Options:")
+    print("         -a  Convert binary files back to ASCII")
+    print("         -o  Output directory (default is next to the input)")
+    print("         -w  Number of worker processes (default is one per CPU)")
+    print("         -b  Benchmark ASCII and binary load times")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    to_ascii = False
+    out_dir = None
+    workers = None
+    do_bench = False
+
+    try:
+        clopts, clargs = getopt.getopt(sys.argv[1:], 'ao:w:b')
+    except getopt.GetoptError as err:
+        print(str(err))
+        usage()
+
+    for opt, arg in clopts:
+        if opt == "-a":
+            to_ascii = True
+        elif opt == "-o":
+            out_dir = arg
+        elif opt == "-w":
+            workers = int(arg)
+        elif opt == "-b":
+            do_bench = True
+
+    if len(clargs) == 0:
+        usage()
+
+    if do_bench:
+        rc = benchmark(clargs, workers)
+    else:
+        if to_ascii:
+            func, name = binaryToAscii, asciiName
+        else:
+            func, name = asciiToBinary, binaryName
+
+        jobs = []
+        for src in clargs:
+            dst = name(src)
+            if out_dir != None:
+                dst = os.path.join(out_dir, os.path.basename(dst))
+            jobs.append((src, dst))
+
+        tstart = time.time()
+        results = convertFiles(func, jobs, workers)
+        rc = reportResults(jobs, results, time.time() - tstart)
+
+    if rc != RC.NO_ERR:
+        print("Return code: %s" % RC.GetErrorName(rc))
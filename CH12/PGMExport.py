@@ -0,0 +1,317 @@
+#! /usr/bin/python
+#-------------------------------------------------------------------------------
+# PGMExport.py
+#-------------------------------------------------------------------------------
+# Exports a sequence of image frames as numbered PGM files, using a pool of
+# worker processes to convert and write the frames.
+#
+# Frames can come from any iterable of arrays (anything PGMWrite accepts), or
+# from a binary capture file holding raw frames one after another. With a
+# capture file the workers read their own frames from the file, so no pixel
+# data has to be passed between processes.
+#
+# Only a limited number of frames are queued for the workers at any one
+# time, so memory use stays bounded however long the sequence is. Output
+# files are named from the frame number, so the same input always produces
+# the same set of files.
+#-------------------------------------------------------------------------------
+# Example source code for the book "Real-World Instrumentation with Python"
+# by J. M. Hughes, published by O'Reilly Media, December 2010,
+# ISBN 978-0-596-80956-0.
+#-------------------------------------------------------------------------------
+from __future__ import print_function
+
+import  os
+import  sys
+import  time
+import  array
+import  getopt
+import  multiprocessing
+import  concurrent.futures
+
+import  RetCodes    as RC   # shared return code definitions
+import  PGMWrite
+from    PGMWrite import np
+
+NAME_PATTERN = "frame_%06d.pgm"     # default output file name pattern
+
+
+def frameName(out_dir, pattern, frame_num):
+    """ Returns the output file path for a frame.
+    """
+    return os.path.join(out_dir, pattern % frame_num)
+
+
+def writeFrame(frame, file_path, imgname, width, height, bitdepth):
+    """ Writes one frame as a PGM file.
+
+        Returns a return code.
+    """
+    if PGMWrite.PGMWrite(frame, imgname, file_path, width, height, bitdepth):
+        return RC.NO_ERR
+    return RC.WRITE_ERR
+
+
+def readCaptureFrame(capture_path, offset, width, height, bitdepth,
+                     byte_order="<"):
+    """ Reads one raw frame from a capture file.
+
+        16bpp values are stored in the capture file in the given byte
+        order ("<" little-endian, or ">" big-endian).
+
+        Returns the frame as bytes (8bpp) or as an array of 16 bit values,
+        or None if the file doesn't hold a whole frame at offset.
+    """
+    pix_size = (bitdepth + 7) // 8
+    fin = open(capture_path, "rb")
+    try:
+        fin.seek(offset)
+        data = fin.read(width * height * pix_size)
+    finally:
+        fin.close()
+
+    if len(data) < width * height * pix_size:
+        return None
+    if pix_size == 1:
+        return data
+
+    if np != None:
+        return np.frombuffer(data, dtype=byte_order + "u2")
+
+    frame = array.array('H')
+    if hasattr(frame, "frombytes"):
+        frame.frombytes(data)
+    else:
+        frame.fromstring(data)
+    if (byte_order == "<") != (sys.byteorder == "little"):
+        frame.byteswap()
+    return frame
+
+
+def writeCaptureFrame(capture_path, offset, file_path, imgname, width,
+                      height, bitdepth, byte_order="<"):
+    """ Reads one raw frame from a capture file and writes it as a PGM
+        file.
+
+        Returns a return code.
+    """
+    frame = readCaptureFrame(capture_path, offset, width, height, bitdepth,
+                             byte_order)
+    if frame is None:
+        return RC.NO_DATA
+    return writeFrame(frame, file_path, imgname, width, height, bitdepth)
+
+
+def jobResult(future):
+    """ Returns the return code of a finished job.
+
+        An exception raised by the job (an I/O error while writing a
+        frame, for example) is printed and returned as WRITE_ERR, so one
+        bad frame doesn't stop the rest.
+    """
+    try:
+        return future.result()
+    except Exception as e:
+        print("%s" % str(e))
+        return RC.WRITE_ERR
+
+
+def runJobs(func, jobs, workers=None, max_inflight=0):
+    """ Applies func to each argument tuple produced by the jobs iterable.
+
+        No more than max_inflight jobs (0 means two per worker) are
+        submitted to the pool at any one time, and jobs are only taken
+        from the iterable as earlier ones finish. If workers is 1 the jobs
+        are run in the calling process. A job that fails, by returning an
+        error code or raising an exception, is counted and the rest of the
+        jobs carry on.
+
+        Returns a 3-tuple consisting of the first error return code (or
+        NO_ERR), the number of jobs run, and the number that failed.
+    """
+    rc = RC.NO_ERR
+    count = 0
+    failed = 0
+
+    if workers == 1:
+        for job in jobs:
+            try:
+                jrc = func(*job)
+            except Exception as e:
+                print("%s" % str(e))
+                jrc = RC.WRITE_ERR
+            if jrc != RC.NO_ERR:
+                failed += 1
+                if rc == RC.NO_ERR:
+                    rc = jrc
+            count += 1
+        return rc, count, failed
+
+    if workers == None:
+        workers = multiprocessing.cpu_count()
+    if max_inflight <= 0:
+        max_inflight = 2 * workers
+
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+
+    pending = set()
+    try:
+        for job in jobs:
+            if len(pending) >= max_inflight:
+                done, pending = concurrent.futures.wait(pending,
+                                    return_when=concurrent.futures.FIRST_COMPLETED)
+                for f in done:
+                    jrc = jobResult(f)
+                    if jrc != RC.NO_ERR:
+                        failed += 1
+                        if rc == RC.NO_ERR:
+                            rc = jrc
+            pending.add(pool.submit(func, *job))
+            count += 1
+
+        for f in concurrent.futures.as_completed(pending):
+            jrc = jobResult(f)
+            if jrc != RC.NO_ERR:
+                failed += 1
+                if rc == RC.NO_ERR:
+                    rc = jrc
+    finally:
+        pool.shutdown()
+
+    return rc, count, failed
+
+
+def timeJobs(func, jobs, workers, max_inflight):
+    """ Runs a set of frame jobs with runJobs(), and times them.
+
+        Returns a 4-tuple consisting of a return code, the number of
+        frames exported, the number that failed, and the export rate in
+        frames per second.
+    """
+    tstart = time.time()
+    rc, count, failed = runJobs(func, jobs, workers, max_inflight)
+    elapsed = time.time() - tstart
+
+    nframes = count - failed
+    return rc, nframes, failed, nframes / max(elapsed, 1e-9)
+
+
+def exportFrames(frames, out_dir, width, height, bitdepth=8,
+                 pattern=NAME_PATTERN, workers=None, max_inflight=0,
+                 first_num=0):
+    """ Exports an iterable of frames as PGM files.
+
+        Frame n (counting from first_num) is written to the file named by
+        pattern % n in out_dir. Frames are taken from the iterable only as
+        fast as the workers can write them.
+
+        Returns a 4-tuple consisting of a return code, the number of
+        frames exported, the number of frames that could not be written,
+        and the export rate in frames per second.
+    """
+    def frameJobs():
+        for n, frame in enumerate(frames, first_num):
+            yield (frame, frameName(out_dir, pattern, n), "frame %d" % n,
+                   width, height, bitdepth)
+
+    return timeJobs(writeFrame, frameJobs(), workers, max_inflight)
+
+
+def exportCapture(capture_path, out_dir, width, height, bitdepth=8,
+                  pattern=NAME_PATTERN, workers=None, max_inflight=0,
+                  hdr_size=0, byte_order="<"):
+    """ Exports every whole frame in a raw capture file as PGM files.
+
+        The capture file holds hdr_size bytes of header (which is skipped)
+        followed by frames of width * height pixels, each one or two bytes
+        depending on bitdepth.
+
+        Returns a 4-tuple, as for exportFrames().
+    """
+    try:
+        fsize = os.path.getsize(capture_path)
+    except Exception as e:
+        print("%s" % str(e))
+        return RC.OPEN_ERR, 0, 0, 0.0
+
+    frame_size = width * height * ((bitdepth + 7) // 8)
+    nframes = (fsize - hdr_size) // frame_size
+
+    def captureJobs():
+        for n in range(0, nframes):
+            yield (capture_path, hdr_size + n * frame_size,
+                   frameName(out_dir, pattern, n), "frame %d" % n,
+                   width, height, bitdepth, byte_order)
+
+    return timeJobs(writeCaptureFrame, captureJobs(), workers, max_inflight)
+
+
+def usage():
+    print("Usage: PGMExport [options] capture_file")
+    print("       Options:")
+    print("         -W  Frame width in pixels (required)")
+    print("         -H  Frame height in pixels (required)")
+    print("         -d  Bits per pixel, 8 or 9-16 (default is 8)")
+    print("         -s  Capture file header size in bytes (default is 0)")
+    print("         -b  16bpp capture data is big-endian")
+    print("         -o  Output directory (default is the current directory)")
+    print("         -p  Output file name pattern (default is %s)" % NAME_PATTERN)
+    print("         -w  Number of worker processes (default is one per CPU)")
+    print("         -n  Maximum frames in flight (default is two per worker)")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    width = 0
+    height = 0
+    bitdepth = 8
+    hdr_size = 0
+    byte_order = "<"
+    out_dir = "."
+    pattern = NAME_PATTERN
+    workers = None
+    max_inflight = 0
+
+    try:
+        clopts, clargs = getopt.getopt(sys.argv[1:], 'W:H:d:s:bo:p:w:n:')
+    except getopt.GetoptError as err:
+        print(str(err))
+        usage()
+
+    for opt, arg in clopts:
+        if opt == "-W":
+            width = int(arg)
+        elif opt == "-H":
+            height = int(arg)
+        elif opt == "-d":
+            bitdepth = int(arg)
+        elif opt == "-s":
+            hdr_size = int(arg)
+        elif opt == "-b":
+            byte_order = ">"
+        elif opt == "-o":
+            out_dir = arg
+        elif opt == "-p":
+            pattern = arg
+        elif opt == "-w":
+            workers = int(arg)
+        elif opt == "-n":
+            max_inflight = int(arg)
+
+    if len(clargs) != 1 or width <= 0 or height <= 0:
+        usage()
+
+    tstart = time.time()
+    rc, nframes, failed, rate = exportCapture(clargs[0], out_dir, width,
+                                              height, bitdepth, pattern,
+                                              workers, max_inflight,
+                                              hdr_size, byte_order)
+    elapsed = time.time() - tstart
+
+    print("Exported %d frames in %.3f s, %.1f frames/s" %
+          (nframes, elapsed, rate))
+    if failed > 0:
+        print("%d frames could not be exported" % failed)
+
+    if rc != RC.NO_ERR:
+        print("Return code: %s" % RC.GetErrorName(rc))
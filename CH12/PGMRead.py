@@ -0,0 +1,282 @@
+#! /usr/bin/python
+#-------------------------------------------------------------------------------
+# PGMRead.py
+#-------------------------------------------------------------------------------
+# Memory-mapped reader for binary PGM (P5) and PPM (P6) images.
+#
+# The image file is mapped into memory rather than read, so opening an image
+# only touches the header. The pixels can be viewed as a NumPy array that
+# shares memory with the mapping, and a region of interest can be read on
+# its own, so only the pages holding the pixels that are actually used are
+# ever read from the disk.
+#
+# Both 8 bit (maxval up to 255) and 16 bit (maxval up to 65535) images are
+# supported. 16 bit pixels are stored big-endian, as the format requires.
+# Comment lines in the header, such as the image name written by PGMWrite,
+# are collected in the comments attribute.
+#
+# NumPy is optional. Without it, readROI() returns array.array objects.
+#-------------------------------------------------------------------------------
+# Example source code for the book "Real-World Instrumentation with Python"
+# by J. M. Hughes, published by O'Reilly Media, December 2010,
+# ISBN 978-0-596-80956-0.
+#-------------------------------------------------------------------------------
+from __future__ import print_function
+
+import  os
+import  sys
+import  mmap
+import  array
+
+try:
+    import  numpy as np
+except ImportError:
+    np = None
+
+import  RetCodes    as RC   # shared return code definitions
+
+# image types, and the number of values per pixel for each
+CHANNELS = {b"P5": 1, b"P6": 3}
+
+WHITESPACE = b" \t\r\n\v\f"
+MAX_HDR    = 4096           # largest header that will be searched
+
+
+def parseHeader(data):
+    """ Decodes the header at the start of a PGM or PPM image.
+
+        data is any bytes-like object holding at least the whole header.
+
+        Returns a 2-tuple consisting of a return code and a dictionary
+        with the image type ("P5" or "P6"), width, height, maxval, the
+        offset of the pixel data, and a list of the header comments.
+    """
+    hdr = {"magic": "", "width": 0, "height": 0, "maxval": 0,
+           "data_ofs": 0, "comments": []}
+
+    tokens = []
+    pos = 0
+    end = len(data)
+    while len(tokens) < 4:
+        # skip whitespace and comments
+        while pos < end:
+            ch = data[pos:pos+1]
+            if ch == b"#":
+                eol = data.find(b"\n", pos)
+                if eol < 0:
+                    eol = end
+                hdr["comments"].append(data[pos+1:eol].decode("ascii", "replace").strip())
+                pos = eol + 1
+            elif ch in WHITESPACE:
+                pos += 1
+            else:
+                break
+
+        start = pos
+        while pos < end and data[pos:pos+1] not in WHITESPACE and \
+              data[pos:pos+1] != b"#":
+            pos += 1
+        if pos == start:
+            return RC.INV_FORMAT, hdr
+
+        tokens.append(data[start:pos])
+
+    if tokens[0] not in CHANNELS:
+        print("Not a binary PGM or PPM image")
+        return RC.INV_FORMAT, hdr
+
+    try:
+        width, height, maxval = [int(tok) for tok in tokens[1:]]
+    except ValueError:
+        return RC.INV_FORMAT, hdr
+
+    if width <= 0 or height <= 0 or maxval <= 0 or maxval > 65535:
+        return RC.INV_FORMAT, hdr
+
+    hdr["magic"]    = tokens[0].decode("ascii")
+    hdr["width"]    = width
+    hdr["height"]   = height
+    hdr["maxval"]   = maxval
+    # a single whitespace character separates the header from the pixels
+    hdr["data_ofs"] = pos + 1
+
+    return RC.NO_ERR, hdr
+
+
+class PGMRead:
+    """ Read-only, memory-mapped access to a PGM or PPM image.
+
+        Each object is unique, and more than one object may be in use at
+        any one time.
+    """
+    def __init__(self):
+        self.file_ref = None
+        self.mm       = None
+        self.magic    = ""
+        self.width    = 0
+        self.height   = 0
+        self.maxval   = 0
+        self.channels = 1       # values per pixel, 3 for a PPM image
+        self.pix_size = 1       # bytes per value
+        self.data_ofs = 0
+        self.comments = []
+
+
+    def openImage(self, file_path):
+        """ Opens and maps an image file, and decodes its header.
+        """
+        try:
+            self.file_ref = open(file_path, "rb")
+            fsize = os.fstat(self.file_ref.fileno()).st_size
+            self.mm = mmap.mmap(self.file_ref.fileno(), fsize,
+                                access=mmap.ACCESS_READ)
+        except Exception as e:
+            print("%s" % str(e))
+            self.closeImage()
+            return RC.OPEN_ERR
+
+        rc, hdr = parseHeader(self.mm[0:min(fsize, MAX_HDR)])
+        if rc == RC.NO_ERR:
+            self.magic    = hdr["magic"]
+            self.width    = hdr["width"]
+            self.height   = hdr["height"]
+            self.maxval   = hdr["maxval"]
+            self.data_ofs = hdr["data_ofs"]
+            self.comments = hdr["comments"]
+            self.channels = CHANNELS[self.magic.encode("ascii")]
+            if self.maxval > 255:
+                self.pix_size = 2
+            else:
+                self.pix_size = 1
+
+            if fsize < self.data_ofs + self.rowBytes() * self.height:
+                print("%s: image data is truncated" % file_path)
+                rc = RC.INV_FORMAT
+
+        if rc != RC.NO_ERR:
+            self.closeImage()
+
+        return rc
+
+
+    def closeImage(self):
+        """ Unmaps and closes the image file.
+
+            The mapping is not closed explicitly, since NumPy views of it may
+            still be in use. It is released when the last view is discarded.
+        """
+        rc = RC.NO_ERR
+
+        if self.file_ref != None:
+            self.file_ref.close()
+        else:
+            rc = RC.NO_FILE
+
+        self.file_ref = None
+        self.mm       = None
+
+        return rc
+
+
+    def rowBytes(self):
+        """ Returns the size of one row of pixels in bytes.
+        """
+        return self.width * self.channels * self.pix_size
+
+
+    def getArray(self):
+        """ Returns the whole image as a read-only NumPy array.
+
+            The array has the shape (height, width), or (height, width, 3)
+            for a PPM image, and is a view of the mapped file, so no data is
+            copied. Pixels are only read from the disk when they're used.
+            Returns None if NumPy is not available or no image is open.
+        """
+        if np == None:
+            print("NumPy is not available")
+            return None
+        if self.mm == None:
+            return None
+
+        if self.pix_size == 2:
+            dtype = np.dtype(">u2")
+        else:
+            dtype = np.dtype("u1")
+
+        arr = np.frombuffer(self.mm, dtype=dtype,
+                            count=self.width * self.height * self.channels,
+                            offset=self.data_ofs)
+        if self.channels == 1:
+            return arr.reshape(self.height, self.width)
+        return arr.reshape(self.height, self.width, self.channels)
+
+
+    def readROI(self, x, y, roi_width, roi_height):
+        """ Reads a rectangular region of interest with its top left corner
+            at column x, row y.
+
+            With NumPy the result is a view of the mapped file, so only
+            the rows in the region are ever read. Without NumPy it is an
+            array.array holding the region's values row by row, in native
+            byte order.
+
+            Returns a 2-tuple consisting of a return code and the pixels,
+            or None if the region is not inside the image.
+        """
+        if self.mm == None:
+            return RC.NO_FILE, None
+
+        if x < 0 or y < 0 or roi_width <= 0 or roi_height <= 0 or \
+           x + roi_width > self.width or y + roi_height > self.height:
+            return RC.BAD_PARAM, None
+
+        if np != None:
+            return RC.NO_ERR, self.getArray()[y:y+roi_height, x:x+roi_width]
+
+        if self.pix_size == 2:
+            pixels = array.array('H')
+        else:
+            pixels = array.array('B')
+
+        row_bytes = self.rowBytes()
+        pix_bytes = self.channels * self.pix_size
+        for row in range(y, y + roi_height):
+            start = self.data_ofs + row * row_bytes + x * pix_bytes
+            rowdata = self.mm[start:start + roi_width * pix_bytes]
+            if hasattr(pixels, "frombytes"):
+                pixels.frombytes(rowdata)
+            else:
+                pixels.fromstring(rowdata)
+
+        if self.pix_size == 2 and sys.byteorder == "little":
+            pixels.byteswap()
+
+        return RC.NO_ERR, pixels
+
+
+if __name__ == "__main__":
+    import time
+    import PGMWrite
+
+    # an 8bpp and a 16bpp test image
+    datavals = [(x + y) % 256 for y in range(0, 256) for x in range(0, 512)]
+    PGMWrite.PGMWrite(datavals, "ramp8", "ramp8.pgm", 512, 256, bitdepth=8)
+    datavals = [x * 100 + y for y in range(0, 256) for x in range(0, 512)]
+    PGMWrite.PGMWrite(datavals, "ramp16", "ramp16.pgm", 512, 256, bitdepth=16)
+
+    for fname in ("ramp8.pgm", "ramp16.pgm"):
+        img = PGMRead()
+        tstart = time.time()
+        rc = img.openImage(fname)
+        topen = time.time() - tstart
+        if rc != RC.NO_ERR:
+            print("%s: %s" % (fname, RC.GetErrorName(rc)))
+            continue
+
+        print("%s: %s %dx%d maxval %d, comments %s, opened in %.6f s" %
+              (fname, img.magic, img.width, img.height, img.maxval,
+               str(img.comments), topen))
+
+        rc, roi = img.readROI(100, 10, 4, 2)
+        print("  ROI at 100,10: %s" % str(roi.tolist()))
+        img.closeImage()
@@ -2,121 +2,369 @@
 #-------------------------------------------------------------------------------
 # PGMWrite.py
 #-------------------------------------------------------------------------------
+# Writes 8bpp or 16bpp binary (P5) PGM images.
+#
+# The pixel data may be a NumPy array, an array.array, a bytes or bytearray
+# object (8bpp only), or a list of integer values. With NumPy available the
+# pixels are clamped and converted to the output format in a single
+# vectorized pass, and the header and pixel buffer are written directly to
+# the file. The PGM format requires 16bpp pixels to be stored big-endian
+# (most significant byte first), whatever the byte order of the machine.
+#
+# Images too large to hold in memory can be written with a PGMStream object,
+# which writes the header first and then takes the image a few rows (or one
+# tile) at a time, from a generator or from an acquisition callback. The
+# height may be left open, for line-scan images that grow until acquisition
+# stops, in which case it is filled in when the image is closed.
+#-------------------------------------------------------------------------------
 # Example source code for the book "Real-World Instrumentation with Python"
 # by J. M. Hughes, published by O'Reilly Media, December 2010,
 # ISBN 978-0-596-80956-0.
 #-------------------------------------------------------------------------------
+from __future__ import print_function
+
+import  os
+import  sys
+import  array
+
+try:
+    import  numpy as np
+except ImportError:
+    np = None
+
+
+def pgmHeader(imgname, width, height, maxval):
+    """ Returns the header of a binary PGM image as bytes.
+
+        imgname is written into the header as a comment.
+    """
+    hdr = "P5\n#%s\n%d\n%d\n%d\n" % (imgname, width, height, maxval)
+    return hdr.encode("ascii")
+
+
+def imageDepth(bitdepth):
+    """ Returns the maximum pixel value for a bit depth, or 0 if the bit
+        depth is not supported.
+    """
+    if bitdepth == 8:
+        return 255
+    elif bitdepth >= 9 and bitdepth <= 16:
+        return 65535
+    return 0
+
+
+def valueCount(imgsrc):
+    """ Returns the number of pixel values in image data.
+    """
+    if np != None and not isinstance(imgsrc, (bytes, bytearray)):
+        return np.size(imgsrc)
+    return len(imgsrc)
+
+
+def pixelBytes(imgsrc, img_size, bitdepth=8):
+    """ Converts image data to the pixel data of a binary PGM image.
+
+        The first img_size values of imgsrc are clamped to the range of
+        the bit depth (0 to 255 for 8bpp, 0 to 65535 for 16bpp) and
+        returned as a bytes-like object, with 16bpp values in big-endian
+        byte order.
+
+        Returns None if imgsrc doesn't hold enough values.
+    """
+    if bitdepth == 8:
+        maxval = 255
+        typecode = 'B'
+    else:
+        maxval = 65535
+        typecode = 'H'
+
+    if np != None and not isinstance(imgsrc, (bytes, bytearray)):
+        imgsrc = np.asarray(imgsrc).ravel()
+
+    if len(imgsrc) < img_size:
+        print("Input data has %d values, image needs %d" % (len(imgsrc), img_size))
+        return None
+
+    # 8bpp data that's already bytes needs no conversion
+    if bitdepth == 8 and isinstance(imgsrc, (bytes, bytearray)):
+        return memoryview(imgsrc)[:img_size]
+
+    if np != None:
+        if isinstance(imgsrc, (bytes, bytearray)):
+            pixels = np.frombuffer(imgsrc, dtype=np.uint8, count=img_size)
+        else:
+            pixels = imgsrc[:img_size]
+
+        outtype = np.dtype(">" + typecode)
+        if pixels.dtype.kind in 'ub' and pixels.dtype.itemsize <= outtype.itemsize:
+            # already in range, only the size or byte order may change
+            return pixels.astype(outtype, copy=False)
+        return np.clip(pixels, 0, maxval).astype(outtype)
+
+    if isinstance(imgsrc, (bytes, bytearray)):
+        pixels = array.array(typecode, bytearray(imgsrc[:img_size]))
+    elif isinstance(imgsrc, array.array) and imgsrc.typecode in ('B', typecode):
+        pixels = array.array(typecode, imgsrc[:img_size])
+    else:
+        pixels = array.array(typecode, [min(max(int(v), 0), maxval)
+                                        for v in imgsrc[:img_size]])
+    if typecode == 'H' and sys.byteorder == "little":
+        pixels.byteswap()
+    return pixels
 
-import struct
 
 def PGMWrite(imgsrc, imgname, filename, width, height, bitdepth=8):
     """ Generates an 8bpp or 16bpp PGM image from aribitary data.
 
         Parameters:
 
-        imgsrc:     source of image data (a list of integer values)
+        imgsrc:     source of image data (a NumPy array, array.array,
+                    bytes, or a list of integer values)
         imgname:    image name string written into the image file header
         filename:   output file name for image data
         width:      width of image
         height:     height of image
+        bitdepth:   8 for an 8bpp image, 9 to 16 for a 16bpp image
+
+        Returns True if the image was written.
     """
+    # verify pixel bit depth
+    img_depth = imageDepth(bitdepth)
+    if img_depth == 0:
+        print("Invalid pixel depth")
+        return False
 
-    # verify source data type (must be a list)
-    if type(imgsrc) != list:
-        print "Input data must be a list of integer values"
-        return
+    pix_data = pixelBytes(imgsrc, width * height, bitdepth)
+    if pix_data is None:
+        return False
 
-    # verify pixel bit depth
-    sizemult = 0
-    if bitdepth == 8:
-        sizemult  = 1
-        img_depth = 255
-    elif bitdepth >= 9:
-        sizemult  = 2
-        img_depth = 65535
-    else:
-        print "Invalid pixel depth"
-        return
-
-    # generate image parameters
-    img_height = height
-    img_width  = width
-    img_size   = img_height * img_width
-    data_size  = img_size * sizemult
-
-    # initalize the image output array
-    pixels = []
-
-    # generate the image array from input data
-    i = 0   # input index
-    # load data into the image array
-    for y in range(0, img_height):
-        for x in range(0, img_width):
-            # fetch next input value from source if mod result is zero
-            inval = imgsrc[i]
-
-            if (bitdepth == 8) and (inval > 255):
-                pixval = 255
-            elif inval > 65535:
-                pixval = 65535
-            else:
-                pixval = inval
-
-            i += 1
-            pixels.append(pixval)
+    # now write it all out to the file
+    fimg = open(filename, "wb")
+    try:
+        fimg.write(pgmHeader(imgname, width, height, img_depth))
+        fimg.write(pix_data)
+    finally:
+        fimg.close()
 
-    if bitdepth == 8:
-        pix_data = "".join(map(chr,pixels))
-    else:
-        pix_data = pixels
-
-    # load the header data variables and get string lengths
-    img_type_str    = "P5\n"
-    img_name_str    = "#%s\n" % imgname     # a comment in image header
-    img_width_str   = "%d\n"  % img_height
-    img_height_str  = "%d\n"  % img_width
-    img_depth_str   = "%d\n"  % img_depth
-
-    img_name_len    = len(img_name_str)
-    img_width_len   = len(img_width_str)
-    img_height_len  = len(img_height_str)
-    img_depth_len   = len(img_depth_str)
-
-    # create the image header structure
-    hdrvals  = (img_type_str, img_name_str, img_width_str, img_height_str, img_depth_str)
-
-    hdrobj = struct.Struct('3s %ds %ds %ds %ds'% (img_name_len,
-                                                  img_width_len,
-                                                  img_height_len,
-                                                  img_depth_len))
-    # create the pixel data
-    if sizemult == 1:
-        pixobj = struct.Struct('%dc'% (img_size))
-    else:
-        pixobj = struct.Struct('%dH'% (img_size))
+    return True
 
-    # pack the data into the structures
-    img_hdr_data = hdrobj.pack(*hdrvals)
-    img_pix_data = pixobj.pack(*pix_data)
-    img_data = img_hdr_data + img_pix_data
 
-    # now write it all out to the file
-    fimg = open(filename,"wb")
-    fimg.write(img_data)
-    fimg.close()
+HEIGHT_DIGITS = 10      # room left for the height when it isn't known yet
+
+
+class PGMStream:
+    """ Writes a PGM image incrementally, so that only the rows (or tile)
+        being written need to be in memory.
+
+        Rows are normally written in order with writeRows(), which can be
+        passed directly to an acquisition routine as its callback, or from
+        an iterable with writeFrom(). If the height is given when the image
+        is opened, tiles can also be written anywhere in the image with
+        writeTile(). Any part of the image that isn't written is black.
+
+        Each object is unique, and more than one object may be in use at
+        any one time.
+    """
+    def __init__(self):
+        self.file_ref  = None
+        self.width     = 0
+        self.height    = 0
+        self.bitdepth  = 8
+        self.pix_size  = 1      # bytes per pixel
+        self.hdr_size  = 0
+        self.hgt_ofs   = 0      # file offset of the height field
+        self.next_row  = 0      # row written by the next writeRows()
+        self.max_row   = 0      # number of rows in the file so far
+
+
+    def openImage(self, filename, width, height=0, bitdepth=8, imgname=""):
+        """ Creates the image file and writes its header.
+
+            If height is 0 the image grows as rows are written, and the
+            height is written into the header by closeImage().
+
+            Returns True if the file was created.
+        """
+        img_depth = imageDepth(bitdepth)
+        if img_depth == 0:
+            print("Invalid pixel depth")
+            return False
+
+        if height > 0:
+            hgt_str = "%d" % height
+        else:
+            hgt_str = " " * HEIGHT_DIGITS
+
+        hdr_start = "P5\n#%s\n%d\n" % (imgname, width)
+        hdr = "%s%s\n%d\n" % (hdr_start, hgt_str, img_depth)
+
+        try:
+            self.file_ref = open(filename, "wb")
+            self.file_ref.write(hdr.encode("ascii"))
+            if height > 0:
+                # size the file now, so tiles can be written in any order
+                self.file_ref.truncate(len(hdr) + width * height *
+                                       ((bitdepth + 7) // 8))
+        except Exception as e:
+            print("%s" % str(e))
+            self.file_ref = None
+            return False
+
+        self.width    = width
+        self.height   = height
+        self.bitdepth = bitdepth
+        self.pix_size = (bitdepth + 7) // 8
+        self.hdr_size = len(hdr)
+        self.hgt_ofs  = len(hdr_start)
+        self.next_row = 0
+        self.max_row  = 0
+
+        return True
+
+
+    def writeRows(self, rows, row=None):
+        """ Writes one or more complete rows of pixels.
+
+            rows may be anything PGMWrite() accepts, and must hold a whole
+            number of rows. If row is None the rows follow on from the
+            ones written by the previous call, otherwise they start at
+            that row.
+
+            Returns True if the rows were written.
+        """
+        if self.file_ref == None:
+            return False
+
+        count = valueCount(rows)
+        if count == 0 or count % self.width != 0:
+            print("Row data must hold a whole number of %d pixel rows" % self.width)
+            return False
+
+        if row == None:
+            row = self.next_row
+        nrows = count // self.width
+        if self.height > 0 and row + nrows > self.height:
+            print("Rows %d to %d are outside the image" % (row, row + nrows - 1))
+            return False
+
+        pix_data = pixelBytes(rows, count, self.bitdepth)
+        if pix_data is None:
+            return False
+
+        try:
+            self.file_ref.seek(self.hdr_size + row * self.width * self.pix_size)
+            self.file_ref.write(pix_data)
+        except Exception as e:
+            print("%s" % str(e))
+            return False
+
+        self.next_row = row + nrows
+        self.max_row  = max(self.max_row, self.next_row)
+
+        return True
+
+
+    def writeFrom(self, source):
+        """ Writes the rows from an iterable (such as a generator) that
+            produces one or more rows at a time.
+
+            Returns True if all of the rows were written.
+        """
+        for rows in source:
+            if not self.writeRows(rows):
+                return False
+        return True
+
+
+    def writeTile(self, x, y, tile, tile_width, tile_height):
+        """ Writes a rectangular tile of pixels with its top left corner at
+            column x, row y. The image height must have been given when it
+            was opened.
+
+            Returns True if the tile was written.
+        """
+        if self.file_ref == None:
+            return False
+
+        if self.height == 0 or x < 0 or y < 0 or \
+           x + tile_width > self.width or y + tile_height > self.height:
+            print("Tile at %d,%d is outside the image" % (x, y))
+            return False
+
+        pix_data = pixelBytes(tile, tile_width * tile_height, self.bitdepth)
+        if pix_data is None:
+            return False
+
+        try:
+            for i in range(0, tile_height):
+                self.file_ref.seek(self.hdr_size +
+                                   ((y + i) * self.width + x) * self.pix_size)
+                self.file_ref.write(pix_data[i*tile_width:(i+1)*tile_width])
+        except Exception as e:
+            print("%s" % str(e))
+            return False
+
+        self.max_row = max(self.max_row, y + tile_height)
+
+        return True
+
+
+    def closeImage(self):
+        """ Closes the image file, first filling in the height if it was not
+            known when the image was opened.
+
+            Returns True if the image was closed without error.
+        """
+        if self.file_ref == None:
+            return False
+
+        rc = True
+        try:
+            if self.height == 0:
+                self.file_ref.seek(self.hgt_ofs)
+                self.file_ref.write(("%*d" % (HEIGHT_DIGITS, self.max_row)).encode("ascii"))
+            self.file_ref.close()
+        except Exception as e:
+            print("%s" % str(e))
+            rc = False
+
+        self.file_ref = None
+
+        return rc
 
 
 if __name__ == "__main__":
+    import time
+
     # generate 8bpp image
     datavals = []
     for i in range(0, 65536):
-        datavals.append(i/256)
+        datavals.append(i // 256)
 
     PGMWrite(datavals, "incshade8", "incshade8.pgm", 256, 256, bitdepth=8)
 
     # generate 16bpp image
     datavals = []
     for i in range(0, 65536):
-        datavals.append(i/256)
+        datavals.append(i)
 
     PGMWrite(datavals, "incshade16", "incshade16.pgm", 256, 256, bitdepth=16)
+
+    if np != None:
+        # a 4k x 4k 16bpp sensor frame
+        frame = np.random.randint(0, 70000, size=(4096, 4096))
+        tstart = time.time()
+        PGMWrite(frame, "frame16", "frame16.pgm", 4096, 4096, bitdepth=16)
+        print("4096x4096 16bpp frame written in %.1f ms" %
+              ((time.time() - tstart) * 1000.0))
+
+    # a tall line-scan image, written one row at a time as it's acquired
+    def lineScan(nlines):
+        for i in range(0, nlines):
+            yield array.array('B', [(i + x) % 256 for x in range(0, 1024)])
+
+    img = PGMStream()
+    img.openImage("linescan.pgm", 1024, bitdepth=8, imgname="linescan")
+    img.writeFrom(lineScan(20000))
+    img.closeImage()
+    print("linescan.pgm: %d bytes" % os.path.getsize("linescan.pgm"))
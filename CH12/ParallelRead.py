@@ -0,0 +1,354 @@
+#! /usr/bin/python
+#-------------------------------------------------------------------------------
+# ParallelRead.py
+#-------------------------------------------------------------------------------
+# Reads a set of ASCII data files (as written by FileUtils.ASCIIDataWrite)
+# using a pool of worker processes.
+#
+# Each file is split into byte-range chunks that start and end on record
+# boundaries, and the chunks are parsed in parallel. The results can be
+# returned either as one set of columns with the records from all of the
+# files merged into time order, or as a set of summary values per file.
+#-------------------------------------------------------------------------------
+# Example source code for the book "Real-World Instrumentation with Python"
+# by J. M. Hughes, published by O'Reilly Media, December 2010,
+# ISBN 978-0-596-80956-0.
+#-------------------------------------------------------------------------------
+from __future__ import print_function
+
+import  os
+import  sys
+import  time
+import  array
+import  heapq
+import  getopt
+import  concurrent.futures
+
+import  RetCodes    as RC   # shared return code definitions
+
+CHUNK_SIZE = 4 * 1024 * 1024    # default chunk size in bytes
+
+# column names used in the results of readFiles()
+COLUMNS = ("file", "seq", "date", "time", "data")
+
+
+def splitChunks(file_path, chunk_size=CHUNK_SIZE):
+    """ Splits a file into byte ranges that start and end on record
+        boundaries.
+
+        Returns a list of (start, end) offset tuples covering the whole
+        file. Each boundary is moved forward to the start of the next
+        record, so no record is split between two chunks.
+    """
+    chunks = []
+    fsize = os.path.getsize(file_path)
+
+    fin = open(file_path, "rb")
+    try:
+        start = 0
+        while start < fsize:
+            end = start + chunk_size
+            if end >= fsize:
+                end = fsize
+            else:
+                fin.seek(end - 1)
+                fin.readline()      # skip to the end of this record
+                end = fin.tell()
+            chunks.append((start, end))
+            start = end
+    finally:
+        fin.close()
+
+    return chunks
+
+
+def parseChunk(file_idx, file_path, start, end):
+    """ Parses the records in one chunk of a data file.
+
+        Returns a 2-tuple consisting of a count of invalid records and a
+        dictionary of columns. Fields that are not present in a record
+        (for example the sequence number in a 3-field record) are set
+        to -1 for the numeric columns and "" for the time column.
+
+        Blank lines are skipped, and so is a partial record at the end of
+        a file (no line terminator).
+    """
+    seq  = array.array('l')
+    date = array.array('l')
+    tms  = []
+    data = array.array('d')
+    bad  = 0
+
+    fin = open(file_path, "rb")
+    try:
+        fin.seek(start)
+        buf = fin.read(end - start)
+    finally:
+        fin.close()
+
+    lines = buf.split(b"\n")
+    # the last element is either empty or a partial record
+    lines.pop()
+
+    for line in lines:
+        flds = line.split()
+        nflds = len(flds)
+        if nflds == 0:
+            # blank line, not a record
+            continue
+        try:
+            if nflds == 4:
+                seq.append(int(flds[0]))
+                date.append(int(flds[1]))
+                tms.append(flds[2].decode("ascii"))
+                data.append(float(flds[3]))
+            elif nflds == 3:
+                seq.append(-1)
+                date.append(int(flds[0]))
+                tms.append(flds[1].decode("ascii"))
+                data.append(float(flds[2]))
+            elif nflds == 2:
+                seq.append(int(flds[0]))
+                date.append(-1)
+                tms.append("")
+                data.append(float(flds[1]))
+            elif nflds == 1:
+                seq.append(-1)
+                date.append(-1)
+                tms.append("")
+                data.append(float(flds[0]))
+            else:
+                bad += 1
+        except ValueError:
+            # a failed conversion may leave the columns uneven
+            bad += 1
+            nrec = len(data)
+            del seq[nrec:], date[nrec:], tms[nrec:]
+
+    cols = {"file": array.array('l', [file_idx]) * len(data),
+            "seq":  seq,
+            "date": date,
+            "time": tms,
+            "data": data}
+
+    return bad, cols
+
+
+def aggregateChunk(file_idx, file_path, start, end):
+    """ Computes summary values for the records in one chunk.
+
+        Returns a 2-tuple consisting of a count of invalid records and a
+        dictionary with the record count, the sum, minimum and maximum
+        of the data values, and the first and last timestamps (as
+        (date, time) tuples, or None if the records have no timestamp).
+    """
+    bad, cols = parseChunk(file_idx, file_path, start, end)
+    data = cols["data"]
+
+    agg = {"count": len(data), "sum": 0.0, "min": None, "max": None,
+           "first": None, "last": None}
+
+    if len(data) > 0:
+        agg["sum"] = sum(data)
+        agg["min"] = min(data)
+        agg["max"] = max(data)
+        if cols["date"][0] != -1:
+            agg["first"] = (cols["date"][0], cols["time"][0])
+        if cols["date"][-1] != -1:
+            agg["last"] = (cols["date"][-1], cols["time"][-1])
+
+    return bad, agg
+
+
+def runChunks(func, file_paths, workers=None, chunk_size=CHUNK_SIZE):
+    """ Applies func to every chunk of every file.
+
+        Returns a 3-tuple consisting of a return code, the total number
+        of invalid records, and a list (one entry per file) of lists of
+        chunk results in file order.
+
+        If workers is 1 the chunks are processed in the calling process,
+        otherwise a ProcessPoolExecutor with the given number of worker
+        processes is used (None uses one per CPU).
+    """
+    rc = RC.NO_ERR
+    bad = 0
+    results = [[] for f in file_paths]
+
+    jobs = []
+    for file_idx, file_path in enumerate(file_paths):
+        try:
+            for start, end in splitChunks(file_path, chunk_size):
+                jobs.append((file_idx, file_path, start, end))
+        except Exception as e:
+            print("%s" % str(e))
+            return RC.OPEN_ERR, bad, results
+
+    try:
+        if workers == 1:
+            done = [func(*job) for job in jobs]
+        else:
+            pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+            try:
+                futures = [pool.submit(func, *job) for job in jobs]
+                done = [f.result() for f in futures]
+            finally:
+                pool.shutdown()
+    except Exception as e:
+        print("%s" % str(e))
+        return RC.READ_ERR, bad, results
+
+    for job, (chunk_bad, result) in zip(jobs, done):
+        bad += chunk_bad
+        results[job[0]].append(result)
+
+    if bad > 0:
+        rc = RC.INV_DATA
+
+    return rc, bad, results
+
+
+def readFiles(file_paths, workers=None, chunk_size=CHUNK_SIZE):
+    """ Reads a set of data files and merges them into time order.
+
+        Returns a 2-tuple consisting of a return code and a dictionary
+        of columns (see COLUMNS). The "file" column holds the index of
+        the source file in file_paths for each record.
+
+        The records in each file are assumed to already be in time
+        order, as they are when written by ASCIIDataWrite. Records from
+        different files are merged by date and time. Records without a
+        timestamp sort before those with one, and records with equal
+        timestamps keep the order of file_paths.
+
+        Invalid records are skipped and reported with an INV_DATA
+        return code, but the valid records are still returned.
+    """
+    rc, bad, results = runChunks(parseChunk, file_paths, workers, chunk_size)
+
+    # join the chunks for each file back together
+    per_file = []
+    for chunks in results:
+        cols = {"file": array.array('l'), "seq": array.array('l'),
+                "date": array.array('l'), "time": [],
+                "data": array.array('d')}
+        for chunk in chunks:
+            for name in COLUMNS:
+                cols[name].extend(chunk[name])
+        per_file.append(cols)
+
+    def recKey(file_idx, i):
+        cols = per_file[file_idx]
+        return (cols["date"][i], cols["time"][i], file_idx, i)
+
+    def keyed(file_idx):
+        return (recKey(file_idx, i)
+                for i in range(len(per_file[file_idx]["data"])))
+
+    merged = {"file": array.array('l'), "seq": array.array('l'),
+              "date": array.array('l'), "time": [],
+              "data": array.array('d')}
+
+    # Files from one long run usually follow one another in time, in which
+    # case they can simply be joined end to end. Otherwise merge them one
+    # record at a time.
+    order = [n for n in range(len(per_file)) if len(per_file[n]["data"]) > 0]
+    order.sort(key=lambda n: recKey(n, 0))
+
+    disjoint = True
+    for a, b in zip(order[:-1], order[1:]):
+        if recKey(a, len(per_file[a]["data"]) - 1) > recKey(b, 0):
+            disjoint = False
+            break
+
+    if disjoint:
+        for file_idx in order:
+            for name in COLUMNS:
+                merged[name].extend(per_file[file_idx][name])
+    else:
+        for d, t, file_idx, i in heapq.merge(*[keyed(n) for n in order]):
+            cols = per_file[file_idx]
+            for name in COLUMNS:
+                merged[name].append(cols[name][i])
+
+    return rc, merged
+
+
+def aggregateFiles(file_paths, workers=None, chunk_size=CHUNK_SIZE):
+    """ Computes summary values for each of a set of data files.
+
+        Returns a 2-tuple consisting of a return code and a list with
+        one dictionary per file, containing the record count, the sum,
+        mean, minimum and maximum of the data values, and the first and
+        last timestamps.
+    """
+    rc, bad, results = runChunks(aggregateChunk, file_paths, workers,
+                                 chunk_size)
+
+    aggs = []
+    for chunks in results:
+        agg = {"count": 0, "sum": 0.0, "mean": None, "min": None,
+               "max": None, "first": None, "last": None}
+        for chunk in chunks:
+            if chunk["count"] == 0:
+                continue
+            agg["count"] += chunk["count"]
+            agg["sum"] += chunk["sum"]
+            if agg["min"] == None or chunk["min"] < agg["min"]:
+                agg["min"] = chunk["min"]
+            if agg["max"] == None or chunk["max"] > agg["max"]:
+                agg["max"] = chunk["max"]
+            if agg["first"] == None:
+                agg["first"] = chunk["first"]
+            if chunk["last"] != None:
+                agg["last"] = chunk["last"]
+        if agg["count"] > 0:
+            agg["mean"] = agg["sum"] / agg["count"]
+        aggs.append(agg)
+
+    return rc, aggs
+
+
+def usage():
+    print("Usage: ParallelRead [options] file_name [file_name ...]")
+    print("       Options:")
+    print("         -w  Number of worker processes (default is one per CPU)")
+    print("         -c  Chunk size in bytes (default is %d)" % CHUNK_SIZE)
+    print("         -a  Print per-file summary values instead of loading")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    workers = None
+    chunk_size = CHUNK_SIZE
+    do_agg = False
+
+    try:
+        clopts, clargs = getopt.getopt(sys.argv[1:], 'w:c:a')
+    except getopt.GetoptError as err:
+        print(str(err))
+        usage()
+
+    for opt, arg in clopts:
+        if opt == "-w":
+            workers = int(arg)
+        elif opt == "-c":
+            chunk_size = int(arg)
+        elif opt == "-a":
+            do_agg = True
+
+    if len(clargs) == 0:
+        usage()
+
+    tstart = time.time()
+    if do_agg:
+        rc, aggs = aggregateFiles(clargs, workers, chunk_size)
+        for file_path, agg in zip(clargs, aggs):
+            print("%s: %s" % (file_path, str(agg)))
+    else:
+        rc, cols = readFiles(clargs, workers, chunk_size)
+        print("Records read: %d" % len(cols["data"]))
+    print("Elapsed time: %.3f s" % (time.time() - tstart))
+
+    if rc != RC.NO_ERR:
+        print("Return code: %s" % RC.GetErrorName(rc))
@@ -0,0 +1,235 @@
+#! /usr/bin/python
+#-------------------------------------------------------------------------------
+# RecordFile.py
+#-------------------------------------------------------------------------------
+# Bulk binary record file I/O using ctypes structure arrays.
+#
+# The ctypes_struct_file examples read and write one DataRecord structure at
+# a time. The functions in this module read and write whole arrays of
+# DataRecord structures (DataRecord * N) with a single call to readinto() or
+# write(), and can present an array as a NumPy structured array that shares
+# the same memory, so no data is copied.
+#
+# Large files can be processed in fixed-size chunks of records using
+# iterChunks(), so the whole file never has to be held in memory.
+#
+# NumPy is optional. Everything except toNumPy() works without it.
+#-------------------------------------------------------------------------------
+# Example source code for the book "Real-World Instrumentation with Python"
+# by J. M. Hughes, published by O'Reilly Media, December 2010,
+# ISBN 978-0-596-80956-0.
+#-------------------------------------------------------------------------------
+from __future__ import print_function
+
+import  os
+import  ctypes
+
+try:
+    import  numpy as np
+except ImportError:
+    np = None
+
+import  RetCodes    as RC   # shared return code definitions
+
+CHUNK_RECS = 65536          # default number of records per chunk
+
+
+class DataRecord(ctypes.Structure):
+     _fields_ = [ ('seq_num', ctypes.c_short),
+                  ('chan', ctypes.c_short),
+                  ('mode', ctypes.c_short),
+                  ('data_val', ctypes.c_double),
+                  ('err_msg', ctypes.c_char * 3) ]
+
+REC_SIZE = ctypes.sizeof(DataRecord)
+
+# NumPy equivalent of DataRecord, including the padding the C compiler
+# inserts, so a NumPy array can share memory with a ctypes array.
+if np != None:
+    RECORD_DTYPE = np.dtype({
+        'names':    ['seq_num', 'chan', 'mode', 'data_val', 'err_msg'],
+        'formats':  ['=i2', '=i2', '=i2', '=f8', 'S3'],
+        'offsets':  [DataRecord.seq_num.offset, DataRecord.chan.offset,
+                     DataRecord.mode.offset, DataRecord.data_val.offset,
+                     DataRecord.err_msg.offset],
+        'itemsize': REC_SIZE})
+else:
+    RECORD_DTYPE = None
+
+
+def newRecords(count):
+    """ Returns a new zero-filled array of count DataRecord structures.
+    """
+    return (DataRecord * count)()
+
+
+def writeRecords(fout, recs):
+    """ Writes an array of records to an open binary file.
+
+        recs may be a ctypes DataRecord array, a NumPy array with the
+        RECORD_DTYPE layout, or any other object that supports the buffer
+        protocol. The whole array is written with one call to write().
+
+        Returns a return code.
+    """
+    rc = RC.NO_ERR
+
+    try:
+        fout.write(memoryview(recs))
+    except Exception as e:
+        rc = RC.WRITE_ERR
+        print("%s" % str(e))
+
+    return rc
+
+
+def readRecords(fin, count):
+    """ Reads up to count records from an open binary file.
+
+        The records are read directly into a new DataRecord array with one
+        call to readinto(). If fewer than count complete records are left in
+        the file, the array returned only holds the records actually read.
+        A partial record at the end of the file is ignored.
+
+        Returns a 2-tuple consisting of a return code and the record array.
+        At the end of the file the array is empty and the return code is
+        NO_DATA.
+    """
+    rc = RC.NO_ERR
+    recs = newRecords(count)
+
+    try:
+        nbytes = fin.readinto(recs)
+    except Exception as e:
+        print("%s" % str(e))
+        return RC.READ_ERR, newRecords(0)
+
+    if nbytes == None:
+        nbytes = 0
+
+    nrecs = nbytes // REC_SIZE
+    if nrecs < count:
+        # a view of just the records that were read, sharing the memory
+        recs = (DataRecord * nrecs).from_buffer(recs)
+    if nrecs == 0:
+        rc = RC.NO_DATA
+
+    return rc, recs
+
+
+def iterChunks(fin, chunk_recs=CHUNK_RECS):
+    """ Generator that reads an open binary file chunk_recs records at a
+        time.
+
+        Each chunk is a new DataRecord array, so chunks may be kept after
+        the next one has been read. The last chunk may be shorter than
+        chunk_recs.
+    """
+    while True:
+        rc, recs = readRecords(fin, chunk_recs)
+        if rc != RC.NO_ERR:
+            break
+        yield recs
+
+
+def readFile(file_path):
+    """ Reads a whole binary record file with one call to readinto().
+
+        Returns a 2-tuple consisting of a return code and the record array.
+    """
+    try:
+        fin = open(file_path, "rb")
+    except Exception as e:
+        print("%s" % str(e))
+        return RC.OPEN_ERR, newRecords(0)
+
+    try:
+        count = os.fstat(fin.fileno()).st_size // REC_SIZE
+        rc, recs = readRecords(fin, count)
+    finally:
+        fin.close()
+
+    return rc, recs
+
+
+def writeFile(file_path, recs, append=False):
+    """ Writes an array of records to a binary record file.
+
+        If append is False any existing file is replaced.
+
+        Returns a return code.
+    """
+    if append:
+        fmode = "ab"
+    else:
+        fmode = "wb"
+
+    try:
+        fout = open(file_path, fmode)
+    except Exception as e:
+        print("%s" % str(e))
+        return RC.OPEN_ERR
+
+    try:
+        rc = writeRecords(fout, recs)
+    finally:
+        fout.close()
+
+    return rc
+
+
+def toNumPy(recs):
+    """ Returns a NumPy structured array view of a DataRecord array.
+
+        The NumPy array shares memory with recs, so no data is copied and
+        changes made through either one are seen by the other. Returns None
+        if NumPy is not available.
+    """
+    if np == None:
+        print("NumPy is not available")
+        return None
+
+    return np.frombuffer(recs, dtype=RECORD_DTYPE)
+
+
+if __name__ == "__main__":
+    import time
+
+    nrecs = 1000000
+
+    # build an array of records, filling it through a NumPy view if we can
+    recs = newRecords(nrecs)
+    if np != None:
+        view = toNumPy(recs)
+        view['seq_num'] = np.arange(nrecs) % 32768
+        view['chan'] = np.arange(nrecs) % 8
+        view['data_val'] = np.arange(nrecs) / 10.0
+        view['err_msg'] = b'030'
+    else:
+        for i in range(0, nrecs):
+            recs[i].seq_num = i % 32768
+            recs[i].chan = i % 8
+            recs[i].data_val = i / 10.0
+            recs[i].err_msg = b'030'
+
+    tstart = time.time()
+    writeFile("bindata.dat", recs)
+    print("Wrote %d records in %.3f s" % (nrecs, time.time() - tstart))
+
+    tstart = time.time()
+    rc, recs2 = readFile("bindata.dat")
+    print("Read %d records in %.3f s" % (len(recs2), time.time() - tstart))
+
+    print("Record 10:")
+    print("seq_num : %d" % recs2[10].seq_num)
+    print("chan    : %d" % recs2[10].chan)
+    print("mode    : %d" % recs2[10].mode)
+    print("data_val: %f" % recs2[10].data_val)
+    print("err_msg : %s" % recs2[10].err_msg.decode("ascii"))
+
+    fin = open("bindata.dat", "rb")
+    nchunks = 0
+    for chunk in iterChunks(fin):
+        nchunks += 1
+    fin.close()
+    print("Read %d chunks of up to %d records" % (nchunks, CHUNK_RECS))
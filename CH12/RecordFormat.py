@@ -0,0 +1,445 @@
+#! /usr/bin/python
+#-------------------------------------------------------------------------------
+# RecordFormat.py
+#-------------------------------------------------------------------------------
+# Binary record files with a self-describing header.
+#
+# The DataRecord structure (and the equivalent 'hhhd3s' struct format used in
+# pack_struct_file.py) uses the native byte order and alignment of the
+# machine that wrote it. The C compiler pads it out to 24 bytes, and nothing
+# in the file says what the layout is. This module defines a packed layout
+# with an explicit little-endian byte order (17 bytes per record), and a
+# small file header that records the layout so a file can be read correctly
+# on any machine.
+#
+# Header format (all values little-endian):
+#
+#   magic       4 bytes     "DREC"
+#   version     ushort      header format version (FORMAT_VERSION)
+#   hdr_size    ushort      total header size in bytes, including padding
+#   rec_size    ushort      size of one record in bytes
+#   nfields     ushort      number of fields in a record
+#   fmt_len     ushort      length of the struct format string
+#   names_len   ushort      length of the field names string
+#   format      fmt_len bytes, struct format string, e.g. "<hhhd3s"
+#   names       names_len bytes, comma-separated field names
+#   padding     zero bytes to make hdr_size a multiple of 8
+#
+# Files in the legacy layout (native padded DataRecord structures, as written
+# by ctypes_struct_file2.py) have no header. Both layouts can be written and
+# read with the BinDataWrite and BinDataRead classes.
+#-------------------------------------------------------------------------------
+# Example source code for the book "Real-World Instrumentation with Python"
+# by J. M. Hughes, published by O'Reilly Media, December 2010,
+# ISBN 978-0-596-80956-0.
+#-------------------------------------------------------------------------------
+from __future__ import print_function
+
+import  os
+import  struct
+import  ctypes
+
+import  RetCodes    as RC   # shared return code definitions
+import  RecordCodec
+from    RecordFile import DataRecord
+
+MAGIC          = b"DREC"
+FORMAT_VERSION = 1
+
+# record layouts
+LEGACY = 0                  # native byte order and alignment, no header
+PACKED = 1                  # little-endian, no padding, with header
+
+# The struct module doesn't add the padding the C compiler puts at the end of
+# a structure, so add it explicitly to make LEGACY records the same size as
+# a DataRecord.
+PACKED_CODEC = RecordCodec.getCodec(RecordCodec.DATA_RECORD_SCHEMA, "<")
+LEGACY_CODEC = RecordCodec.getCodec(RecordCodec.DATA_RECORD_SCHEMA, "@",
+                   ctypes.sizeof(DataRecord) - struct.calcsize("@hhhd3s"))
+
+FIELD_NAMES = PACKED_CODEC.names
+LEGACY_FMT  = LEGACY_CODEC.format
+PACKED_FMT  = PACKED_CODEC.format
+
+HDR_FIXED = struct.Struct("<4sHHHHHH")
+
+
+def makeHeader(rec_fmt, names=FIELD_NAMES):
+    """ Returns the file header bytes for a record format.
+    """
+    fmt_bytes   = rec_fmt.encode("ascii")
+    names_bytes = ",".join(names).encode("ascii")
+
+    hdr_size = HDR_FIXED.size + len(fmt_bytes) + len(names_bytes)
+    hdr_size = (hdr_size + 7) & ~7
+
+    hdr = HDR_FIXED.pack(MAGIC, FORMAT_VERSION, hdr_size,
+                         struct.calcsize(rec_fmt), len(names),
+                         len(fmt_bytes), len(names_bytes))
+    hdr += fmt_bytes + names_bytes
+
+    return hdr + b"\0" * (hdr_size - len(hdr))
+
+
+def parseHeader(hdr):
+    """ Decodes a file header.
+
+        hdr must hold at least the whole header. Returns a 4-tuple
+        consisting of a return code, the header size, the struct format
+        string, and a tuple of the field names. The return code is
+        INV_FORMAT if the header is not self-consistent: the header size
+        too small to hold the format and names, or the record size not
+        matching the format.
+    """
+    if len(hdr) < HDR_FIXED.size:
+        return RC.INV_FORMAT, 0, "", ()
+
+    magic, version, hdr_size, rec_size, nfields, fmt_len, names_len = \
+        HDR_FIXED.unpack_from(hdr)
+
+    if magic != MAGIC:
+        return RC.INV_FORMAT, 0, "", ()
+    if version > FORMAT_VERSION:
+        print("Unsupported record file version %d" % version)
+        return RC.INV_FORMAT, 0, "", ()
+    # the header must hold the format and names, and the data follows it
+    if HDR_FIXED.size + fmt_len + names_len > hdr_size or len(hdr) < hdr_size:
+        return RC.INV_FORMAT, 0, "", ()
+
+    pos = HDR_FIXED.size
+    try:
+        rec_fmt = hdr[pos:pos+fmt_len].decode("ascii")
+        pos += fmt_len
+        names = tuple(hdr[pos:pos+names_len].decode("ascii").split(","))
+        fmt_size = struct.calcsize(rec_fmt)
+    except (UnicodeError, struct.error):
+        return RC.INV_FORMAT, 0, "", ()
+
+    if fmt_size != rec_size or rec_size == 0 or len(names) != nfields:
+        return RC.INV_FORMAT, 0, "", ()
+
+    return RC.NO_ERR, hdr_size, rec_fmt, names
+
+
+class BinDataWrite:
+    """ Writes binary data records in either the packed or legacy layout.
+
+        Each object is unique, and more than one object may be in use at
+        any one time.
+    """
+    def __init__(self):
+        self.file_ref = None
+        self.layout   = PACKED
+        self.codec    = None
+        self.out_buf  = bytearray(0)    # this writer's packing buffer
+
+
+    def openOutput(self, path, file_name, layout=PACKED, reset_file=False,
+                   codec=None):
+        """ Opens a file for binary record output.
+
+            A new file in the PACKED layout starts with a header. LEGACY
+            files have no header, so they can be read by the ctypes
+            examples in this chapter.
+
+            Records other than DataRecords can be written by passing a
+            RecordCodec for them in codec. The file is then always in the
+            PACKED layout, since the header is needed to describe them.
+
+            If reset_file is False and the file already exists, records are
+            appended to it. In that case the layout and record format of the
+            existing file are used, whatever the parameters say.
+        """
+        rc = RC.NO_ERR
+
+        if len(file_name) == 0:
+            return RC.NO_NAME
+
+        file_path = os.path.join(path, file_name)
+
+        if codec != None:
+            layout = PACKED
+
+        if not reset_file and os.path.exists(file_path) and \
+           os.path.getsize(file_path) > 0:
+            rc, codec, hdr_size = detectFormat(file_path)
+            if rc != RC.NO_ERR:
+                return rc
+            if hdr_size == 0:
+                layout = LEGACY
+            else:
+                layout = PACKED
+            fmode = "ab"
+        else:
+            fmode = "wb"
+
+        if codec == None:
+            if layout == LEGACY:
+                codec = LEGACY_CODEC
+            else:
+                codec = PACKED_CODEC
+
+        try:
+            self.file_ref = open(file_path, fmode)
+            if fmode == "wb" and layout == PACKED:
+                self.file_ref.write(makeHeader(codec.format, codec.names))
+        except Exception as e:
+            rc = RC.OPEN_ERR
+            print("%s" % str(e))
+        else:
+            self.layout = layout
+            self.codec  = codec
+
+        return rc
+
+
+    def closeOutput(self):
+        """ Close an already opened output file.
+        """
+        rc = RC.NO_ERR
+
+        if self.file_ref != None:
+            try:
+                self.file_ref.close()
+            except Exception as e:
+                rc = RC.INV_FILE
+                print("%s" % str(e))
+            self.file_ref = None
+        else:
+            rc = RC.NO_FILE
+
+        return rc
+
+
+    def writeRecord(self, seq_num, chan, mode, data_val, err_msg):
+        """ Writes a single record.
+        """
+        return self.writeRecords([(seq_num, chan, mode, data_val, err_msg)])
+
+
+    def writeRecords(self, recs):
+        """ Writes a sequence of records, each a tuple of field values in
+            FIELD_NAMES order, with a single write.
+
+            The records are packed into this writer's own reusable buffer,
+            so no memory is allocated per record, and writers that share a
+            codec don't share a buffer. The err_msg field may be given as
+            bytes or as a string.
+        """
+        rc = RC.NO_ERR
+
+        if self.file_ref == None:
+            return RC.NO_FILE
+
+        if not isinstance(recs, (list, tuple)):
+            recs = list(recs)
+
+        try:
+            outdata = self.codec.packBatch(recs, self.out_buf)
+        except struct.error:
+            # most likely strings rather than bytes for the err_msg (or
+            # other "s") fields, so convert them and try again
+            try:
+                outdata = self.codec.packBatch([tuple([toBytes(v)
+                                                       if isinstance(v, str)
+                                                       else v for v in rec])
+                                                for rec in recs],
+                                               self.out_buf)
+            except Exception as e:
+                print("%s" % str(e))
+                return RC.INV_DATA
+
+        try:
+            self.file_ref.write(outdata)
+        except Exception as e:
+            rc = RC.WRITE_ERR
+            print("%s" % str(e))
+
+        return rc
+
+
+class BinDataRead:
+    """ Reads binary data records in either the packed or legacy layout.
+
+        The layout is detected when the file is opened. Each object is
+        unique, and more than one object may be in use at any one time.
+    """
+    def __init__(self):
+        self.file_ref = None
+        self.layout   = PACKED
+        self.codec    = None
+
+
+    def openInput(self, path, file_name):
+        """ Opens a binary record file for input.
+
+            A file that starts with a header is read using the format it
+            describes. Any other file is assumed to be in the LEGACY layout.
+        """
+        if path == None:
+            path = './'
+
+        file_path = os.path.join(path, file_name)
+
+        rc, codec, hdr_size = detectFormat(file_path)
+        if rc != RC.NO_ERR:
+            return rc
+
+        try:
+            self.file_ref = open(file_path, "rb")
+            self.file_ref.seek(hdr_size)
+        except Exception as e:
+            print("%s" % str(e))
+            self.file_ref = None
+            return RC.OPEN_ERR
+
+        self.codec = codec
+        if hdr_size == 0:
+            self.layout = LEGACY
+        else:
+            self.layout = PACKED
+
+        return rc
+
+
+    def closeInput(self):
+        """ Close an already opened input file.
+        """
+        rc = RC.NO_ERR
+
+        if self.file_ref != None:
+            self.file_ref.close()
+            self.file_ref = None
+        else:
+            rc = RC.NO_FILE
+
+        return rc
+
+
+    def readRecord(self):
+        """ Reads the next record.
+
+            Returns a 2-tuple consisting of a return code and a tuple of
+            field values. At the end of the file the return code is NO_DATA
+            and the field values are None.
+        """
+        rc, recs = self.readRecords(1)
+        if rc != RC.NO_ERR:
+            return rc, None
+        return rc, recs[0]
+
+
+    def readRecords(self, count):
+        """ Reads up to count records with a single read.
+
+            Returns a 2-tuple consisting of a return code and a list of
+            field value tuples. A partial record at the end of the file is
+            ignored.
+        """
+        if self.file_ref == None:
+            return RC.NO_FILE, []
+
+        try:
+            indata = self.file_ref.read(count * self.codec.size)
+        except Exception as e:
+            print("%s" % str(e))
+            return RC.READ_ERR, []
+
+        recs = self.codec.unpackBatch(indata)
+        if len(recs) == 0:
+            return RC.NO_DATA, []
+
+        return RC.NO_ERR, recs
+
+
+    def readArray(self, count):
+        """ Reads up to count records with a single read, and returns them
+            as a NumPy structured array with one field per record field.
+
+            Returns a 2-tuple consisting of a return code and the array, or
+            None if NumPy is not available. At the end of the file the
+            array is empty and the return code is NO_DATA.
+        """
+        if self.file_ref == None:
+            return RC.NO_FILE, None
+        if RecordCodec.np == None:
+            print("NumPy is not available")
+            return RC.NO_INIT_POSSIBLE, None
+
+        try:
+            indata = self.file_ref.read(count * self.codec.size)
+        except Exception as e:
+            print("%s" % str(e))
+            return RC.READ_ERR, None
+
+        recs = self.codec.toArray(indata)
+        if len(recs) == 0:
+            return RC.NO_DATA, recs
+
+        return RC.NO_ERR, recs
+
+
+# Module functions
+
+def toBytes(err_msg):
+    """ Returns the err_msg field value as bytes.
+    """
+    if isinstance(err_msg, bytes):
+        return err_msg
+    return err_msg.encode("ascii")
+
+
+def detectFormat(file_path):
+    """ Determines the record format of a binary record file.
+
+        Returns a 3-tuple consisting of a return code, the RecordCodec for
+        the records and the header size (zero for a LEGACY file).
+    """
+    try:
+        fin = open(file_path, "rb")
+    except Exception as e:
+        print("%s" % str(e))
+        return RC.OPEN_ERR, None, 0
+
+    try:
+        hdr = fin.read(HDR_FIXED.size)
+        if hdr[0:len(MAGIC)] != MAGIC:
+            return RC.NO_ERR, LEGACY_CODEC, 0
+        if len(hdr) < HDR_FIXED.size:
+            return RC.INV_FORMAT, None, 0
+        hdr_size = HDR_FIXED.unpack_from(hdr)[2]
+        if hdr_size > HDR_FIXED.size:
+            hdr += fin.read(hdr_size - len(hdr))
+    finally:
+        fin.close()
+
+    rc, hdr_size, rec_fmt, names = parseHeader(hdr)
+    if rc != RC.NO_ERR:
+        return rc, None, 0
+
+    try:
+        codec = RecordCodec.codecFromFormat(rec_fmt, names)
+    except Exception as e:
+        print("%s" % str(e))
+        return RC.INV_FORMAT, None, 0
+
+    return rc, codec, hdr_size
+
+
+if __name__ == "__main__":
+    nrecs = 1000
+    recs = [(i, i % 8, 0, 2.0 + i / 10.0, b'030') for i in range(0, nrecs)]
+
+    for layout, fname in ((LEGACY, "legacy.dat"), (PACKED, "packed.dat")):
+        fout = BinDataWrite()
+        fout.openOutput("./", fname, layout=layout, reset_file=True)
+        fout.writeRecords(recs)
+        fout.closeOutput()
+
+        fin = BinDataRead()
+        fin.openInput("./", fname)
+        rc, inrecs = fin.readRecords(nrecs)
+        fin.closeInput()
+
+        print("%-10s %6d bytes, %d records read, match: %s" %
+              (fname, os.path.getsize(fname), len(inrecs), inrecs == recs))
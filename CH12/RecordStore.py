@@ -0,0 +1,274 @@
+#! /usr/bin/python
+#-------------------------------------------------------------------------------
+# RecordStore.py
+#-------------------------------------------------------------------------------
+# Memory-mapped random access to a binary DataRecord file.
+#
+# A RecordStore maps a file of DataRecord structures (see RecordFile.py) into
+# memory rather than reading it. Record i is found by simple arithmetic, so
+# any record can be fetched in constant time, and only the pages that are
+# actually touched are ever read from the disk. The mapping is read-only and
+# shared, so any number of processes can open the same capture file and they
+# will all use the same copy of it in the operating system's page cache.
+#
+# With NumPy available the whole file, or the records for one channel, can
+# be viewed as a structured array without copying any data.
+#-------------------------------------------------------------------------------
+# Example source code for the book "Real-World Instrumentation with Python"
+# by J. M. Hughes, published by O'Reilly Media, December 2010,
+# ISBN 978-0-596-80956-0.
+#-------------------------------------------------------------------------------
+from __future__ import print_function
+
+import  os
+import  mmap
+import  struct
+
+import  RetCodes    as RC   # shared return code definitions
+import  RecordFile
+from    RecordFile import DataRecord, REC_SIZE, RECORD_DTYPE, np
+
+# used to fetch just the seq_num or chan field of a record
+SHORT_FMT = struct.Struct("h")
+SEQ_OFS   = DataRecord.seq_num.offset
+CHAN_OFS  = DataRecord.chan.offset
+
+
+class RecordStore:
+    """ Read-only, memory-mapped access to a binary DataRecord file.
+
+        More than one RecordStore may be open at any one time, in one
+        process or many.
+    """
+    def __init__(self):
+        self.file_ref = None
+        self.mm       = None
+        self.count    = 0
+        self.chan_idx = {}      # cached record indices for each channel
+
+
+    def openStore(self, file_path):
+        """ Opens and maps a binary record file.
+
+            A partial record at the end of the file is ignored.
+        """
+        rc = RC.NO_ERR
+
+        try:
+            self.file_ref = open(file_path, "rb")
+        except Exception as e:
+            print("%s" % str(e))
+            return RC.OPEN_ERR
+
+        rc = self.refresh()
+        if rc != RC.NO_ERR:
+            self.closeStore()
+
+        return rc
+
+
+    def refresh(self):
+        """ Maps the file again if it has grown since it was mapped.
+
+            This allows a store to be used while another process is still
+            appending records to the file. Record arrays obtained from
+            getArray() or channelView() before the refresh continue to use
+            the old mapping.
+        """
+        rc = RC.NO_ERR
+
+        if self.file_ref == None:
+            return RC.NO_FILE
+
+        fsize = os.fstat(self.file_ref.fileno()).st_size
+        count = fsize // REC_SIZE
+
+        if count != self.count or self.mm == None:
+            if count == 0:
+                # an empty file cannot be mapped
+                self.mm = None
+            else:
+                try:
+                    self.mm = mmap.mmap(self.file_ref.fileno(),
+                                        count * REC_SIZE,
+                                        access=mmap.ACCESS_READ)
+                except Exception as e:
+                    print("%s" % str(e))
+                    rc = RC.READ_ERR
+                    count = 0
+            self.count = count
+            self.chan_idx = {}
+
+        return rc
+
+
+    def closeStore(self):
+        """ Unmaps and closes the file.
+
+            The mapping is not closed explicitly, since NumPy views of it may
+            still be in use. It is released when the last view is discarded.
+        """
+        rc = RC.NO_ERR
+
+        if self.file_ref != None:
+            self.file_ref.close()
+        else:
+            rc = RC.NO_FILE
+
+        self.file_ref = None
+        self.mm       = None
+        self.count    = 0
+        self.chan_idx = {}
+
+        return rc
+
+
+    def getCount(self):
+        """ Returns the number of complete records in the store.
+        """
+        return self.count
+
+
+    def getRecord(self, idx):
+        """ Returns record idx as a DataRecord structure.
+
+            Negative indices count back from the last record. Only the
+            record itself is copied out of the mapping.
+
+            Returns a 2-tuple consisting of a return code and the record, or
+            None if idx is out of range.
+        """
+        if idx < 0:
+            idx += self.count
+        if idx < 0 or idx >= self.count:
+            return RC.BAD_PARAM, None
+
+        ofs = idx * REC_SIZE
+        return RC.NO_ERR, DataRecord.from_buffer_copy(self.mm[ofs:ofs+REC_SIZE])
+
+
+    def getSeqNum(self, idx):
+        """ Returns the seq_num field of record idx without fetching the
+            rest of the record.
+        """
+        return SHORT_FMT.unpack_from(self.mm, idx * REC_SIZE + SEQ_OFS)[0]
+
+
+    def findSeq(self, seq_num):
+        """ Finds the first record with a given sequence number.
+
+            Uses a binary search, so the records must be in increasing
+            sequence number order. Only about log2(n) records are touched.
+
+            Returns the record index, or -1 if there is no such record.
+        """
+        lo = 0
+        hi = self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.getSeqNum(mid) < seq_num:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        if lo < self.count and self.getSeqNum(lo) == seq_num:
+            return lo
+        return -1
+
+
+    def getArray(self):
+        """ Returns the whole store as a read-only NumPy structured array.
+
+            No data is copied, the array is a view of the mapped file.
+            Returns None if NumPy is not available or the store is empty.
+        """
+        if np == None:
+            print("NumPy is not available")
+            return None
+        if self.mm == None:
+            return None
+
+        return np.frombuffer(self.mm, dtype=RECORD_DTYPE, count=self.count)
+
+
+    def channelIndex(self, chan):
+        """ Returns the indices of the records for one channel.
+
+            The result is a NumPy integer array if NumPy is available,
+            otherwise a list. It is cached, so only the first call for
+            each channel scans the file.
+        """
+        if chan not in self.chan_idx:
+            if np != None and self.mm != None:
+                arr = self.getArray()
+                self.chan_idx[chan] = np.flatnonzero(arr['chan'] == chan)
+            else:
+                idx = []
+                for i in range(0, self.count):
+                    if SHORT_FMT.unpack_from(self.mm, i * REC_SIZE + CHAN_OFS)[0] == chan:
+                        idx.append(i)
+                self.chan_idx[chan] = idx
+
+        return self.chan_idx[chan]
+
+
+    def channelView(self, chan):
+        """ Returns the records for one channel as a NumPy array.
+
+            Capture files usually cycle through the channels in a fixed
+            order. When that's the case the records for a channel are
+            evenly spaced, and the result is a strided view of the mapped
+            file with no data copied. Otherwise the records are gathered
+            into a new array.
+
+            Returns None if NumPy is not available.
+        """
+        arr = self.getArray()
+        if arr is None:
+            return None
+
+        idx = self.channelIndex(chan)
+        if len(idx) == 0:
+            return arr[0:0]
+        if len(idx) == 1:
+            return arr[idx[0]:idx[0]+1]
+
+        stride = idx[1] - idx[0]
+        if np.all(np.diff(idx) == stride):
+            return arr[idx[0]:idx[-1]+1:stride]
+
+        return arr[idx]
+
+
+if __name__ == "__main__":
+    import time
+
+    # create a test file with 8 interleaved channels (seq_num is a short,
+    # so keep it below 32768)
+    nrecs = 200000
+    recs = RecordFile.newRecords(nrecs)
+    for i in range(0, nrecs):
+        recs[i].seq_num = i // 8
+        recs[i].chan = i % 8
+        recs[i].data_val = i / 10.0
+    RecordFile.writeFile("bindata.dat", recs)
+
+    store = RecordStore()
+    tstart = time.time()
+    store.openStore("bindata.dat")
+    print("Opened %d records in %.6f s" % (store.getCount(), time.time() - tstart))
+
+    rc, rec = store.getRecord(123457)
+    print("Record 123457: seq_num %d, chan %d, data_val %f" %
+          (rec.seq_num, rec.chan, rec.data_val))
+
+    tstart = time.time()
+    idx = store.findSeq(20000)
+    print("seq_num 20000 is record %d (%.6f s)" % (idx, time.time() - tstart))
+
+    chan3 = store.channelView(3)
+    if chan3 is not None:
+        print("Channel 3: %d records, shares memory: %s" %
+              (len(chan3), str(np.shares_memory(chan3, store.getArray()))))
+
+    store.closeStore()
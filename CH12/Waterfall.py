@@ -0,0 +1,280 @@
+#! /usr/bin/python
+#-------------------------------------------------------------------------------
+# Waterfall.py
+#-------------------------------------------------------------------------------
+# Generates waterfall (spectrogram) and heat map images from channel logs.
+#
+# The data values are read from an ASCII data file (as written by
+# FileUtils.ASCIIDataWrite) or a binary record file (see RecordFormat.py) a
+# block at a time, and turned into image rows in one of two ways:
+#
+#   fft     Each row is the magnitude spectrum of one window of samples
+#           (Hann windowed), so time runs down the image and frequency
+#           across it.
+#   min, max, mean
+#           Each pixel is the minimum, maximum or mean of one window of
+#           samples, and each row holds width consecutive windows, so the
+#           whole log is laid out as a raster, like lines of text.
+#
+# The values are mapped to 8 or 16 bit intensities, on a linear or dB scale,
+# and the rows are written through a PGMStream as they're produced. Only one
+# block of samples and one block of rows are held in memory at any time, so
+# logs of any length are rendered in a single pass.
+#
+# NumPy is required.
+#-------------------------------------------------------------------------------
+# Example source code for the book "Real-World Instrumentation with Python"
+# by J. M. Hughes, published by O'Reilly Media, December 2010,
+# ISBN 978-0-596-80956-0.
+#-------------------------------------------------------------------------------
+from __future__ import print_function
+
+import  os
+import  sys
+import  time
+import  getopt
+
+import  RetCodes    as RC   # shared return code definitions
+import  ParallelRead
+import  RecordFormat
+import  PGMWrite
+from    PGMWrite import np
+
+MODES      = ("fft", "min", "max", "mean")
+BLOCK_RECS = 65536          # records read from a binary log at a time
+BLOCK_ROWS = 256            # image rows computed at a time
+
+
+def asciiBlocks(file_path, chunk_size=ParallelRead.CHUNK_SIZE):
+    """ Generator that reads the data values from an ASCII data file,
+        returning them a block at a time as NumPy arrays.
+    """
+    for start, end in ParallelRead.splitChunks(file_path, chunk_size):
+        bad, cols = ParallelRead.parseChunk(0, file_path, start, end)
+        yield np.frombuffer(cols["data"], dtype=np.float64)
+
+
+def binaryBlocks(file_path, chan=None, block_recs=BLOCK_RECS):
+    """ Generator that reads the data values from a binary record file,
+        returning them a block at a time as NumPy arrays.
+
+        If chan is not None only the records for that channel are used.
+        Records with no chan field, such as the LogConvert records for
+        an ASCII data file, hold a single channel, so chan is ignored
+        for them (as it is for an ASCII data file).
+    """
+    fin = RecordFormat.BinDataRead()
+    rc = fin.openInput(os.path.dirname(file_path), os.path.basename(file_path))
+    if rc != RC.NO_ERR:
+        return
+
+    if chan != None and "chan" not in fin.codec.names:
+        print("%s has no chan field, using all the records" % file_path)
+        chan = None
+
+    try:
+        while True:
+            rc, recs = fin.readArray(block_recs)
+            if rc != RC.NO_ERR:
+                break
+            if chan != None:
+                recs = recs[recs["chan"] == chan]
+            yield recs["data_val"].astype(np.float64)
+    finally:
+        fin.closeInput()
+
+
+def logBlocks(file_path, chan=None, binary=None):
+    """ Returns a generator for the data values in a log file.
+
+        If binary is None a file with a RecordFormat header is read as a
+        binary record file, and anything else as an ASCII data file.
+    """
+    if binary == None:
+        rc, codec, hdr_size = RecordFormat.detectFormat(file_path)
+        binary = (rc == RC.NO_ERR and hdr_size > 0)
+
+    if binary:
+        return binaryBlocks(file_path, chan)
+    return asciiBlocks(file_path)
+
+
+def computeRows(samples, mode, window, width, hop):
+    """ Computes image rows from a block of samples.
+
+        samples must hold a whole number of rows. Returns a 2-D array of
+        row values.
+    """
+    if mode == "fft":
+        frames = np.lib.stride_tricks.sliding_window_view(samples, window)[::hop]
+        return np.abs(np.fft.rfft(frames * np.hanning(window), axis=1))
+
+    windows = samples.reshape(-1, width, window)
+    if mode == "min":
+        return windows.min(axis=2)
+    elif mode == "max":
+        return windows.max(axis=2)
+    return windows.mean(axis=2)
+
+
+def scaleRows(rows, maxval, vmin, vmax, log_scale):
+    """ Maps row values from the range vmin to vmax onto pixel values from
+        0 to maxval. With log_scale the values are converted to dB first,
+        and vmin and vmax are in dB.
+    """
+    if log_scale:
+        rows = 20.0 * np.log10(np.abs(rows) + 1e-12)
+
+    span = vmax - vmin
+    if span <= 0:
+        span = 1.0
+    pixels = (rows - vmin) * (maxval / span)
+    np.clip(pixels, 0, maxval, out=pixels)
+    if maxval > 255:
+        return pixels.astype(np.uint16)
+    return pixels.astype(np.uint8)
+
+
+def makeWaterfall(blocks, out_path, mode="fft", window=256, width=512,
+                  bitdepth=8, log_scale=False, vmin=None, vmax=None,
+                  hop=0, block_rows=BLOCK_ROWS, imgname="waterfall"):
+    """ Renders a waterfall image from blocks of samples.
+
+        blocks is an iterable of sample arrays, such as the generator
+        returned by logBlocks(). In fft mode each row is the spectrum of
+        window samples, and successive windows start hop samples apart
+        (0 means no overlap), so the image is window // 2 + 1 pixels wide.
+        Otherwise each pixel covers window samples and the image is width
+        pixels wide.
+
+        If vmin or vmax is None it is set from the first block of rows,
+        and then kept for the rest of the image. Samples left over at the
+        end that don't make up a whole row are not used.
+
+        Returns a 2-tuple consisting of a return code and the number of
+        rows in the image.
+    """
+    if np == None:
+        print("NumPy is required")
+        return RC.NO_INIT_POSSIBLE, 0
+    if mode not in MODES or window <= 0 or width <= 0:
+        return RC.BAD_PARAM, 0
+
+    if hop <= 0 or mode != "fft":
+        hop = window
+    if mode == "fft":
+        img_width = window // 2 + 1
+        row_samples = hop
+        extra = window - hop        # samples shared with the next row
+    else:
+        img_width = width
+        row_samples = window * width
+        extra = 0
+
+    maxval = PGMWrite.imageDepth(bitdepth)
+    img = PGMWrite.PGMStream()
+    if maxval == 0 or not img.openImage(out_path, img_width, 0, bitdepth, imgname):
+        return RC.OPEN_ERR, 0
+
+    rc = RC.NO_ERR
+    nrows = 0
+    pending = np.zeros(0, dtype=np.float64)
+    try:
+        for block in blocks:
+            pending = np.concatenate((pending, block))
+            while len(pending) >= row_samples + extra:
+                count = min((len(pending) - extra) // row_samples, block_rows)
+                used = count * row_samples
+                rows = computeRows(pending[:used + extra], mode, window, width, hop)
+
+                if vmin == None or vmax == None:
+                    if log_scale:
+                        vals = 20.0 * np.log10(np.abs(rows) + 1e-12)
+                    else:
+                        vals = rows
+                    if vmin == None:
+                        vmin = float(vals.min())
+                    if vmax == None:
+                        vmax = float(vals.max())
+
+                if not img.writeRows(scaleRows(rows, maxval, vmin, vmax, log_scale)):
+                    rc = RC.WRITE_ERR
+                    break
+                nrows += count
+                pending = pending[used:]
+            if rc != RC.NO_ERR:
+                break
+    finally:
+        img.closeImage()
+
+    return rc, nrows
+
+
+def usage():
+    print("Usage: Waterfall [options] log_file")
+    print("       Options:")
+    print("         -m  Mode: fft, min, max or mean (default is fft)")
+    print("         -n  Samples per window (default is 256)")
+    print("         -s  FFT hop size in samples (default is the window size)")
+    print("         -W  Image width for min, max and mean (default is 512)")
+    print("         -d  Bits per pixel, 8 or 16 (default is 8)")
+    print("         -l  Use a dB scale")
+    print("         -r  Value range as min,max (default is from the first rows)")
+    print("         -c  Channel to use from a binary record file")
+    print("         -b  Read the log as a binary record file")
+    print("         -o  Output file name (default is waterfall.pgm)")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    mode = "fft"
+    window = 256
+    hop = 0
+    width = 512
+    bitdepth = 8
+    log_scale = False
+    vmin = None
+    vmax = None
+    chan = None
+    binary = None
+    out_path = "waterfall.pgm"
+
+    try:
+        clopts, clargs = getopt.getopt(sys.argv[1:], 'm:n:s:W:d:lr:c:bo:')
+    except getopt.GetoptError as err:
+        print(str(err))
+        usage()
+
+    for opt, arg in clopts:
+        if opt == "-m":
+            mode = arg
+        elif opt == "-n":
+            window = int(arg)
+        elif opt == "-s":
+            hop = int(arg)
+        elif opt == "-W":
+            width = int(arg)
+        elif opt == "-d":
+            bitdepth = int(arg)
+        elif opt == "-l":
+            log_scale = True
+        elif opt == "-r":
+            vmin, vmax = [float(v) for v in arg.split(",")]
+        elif opt == "-c":
+            chan = int(arg)
+        elif opt == "-b":
+            binary = True
+        elif opt == "-o":
+            out_path = arg
+
+    if len(clargs) != 1 or mode not in MODES:
+        usage()
+
+    tstart = time.time()
+    rc, nrows = makeWaterfall(logBlocks(clargs[0], chan, binary), out_path,
+                              mode, window, width, bitdepth, log_scale,
+                              vmin, vmax, hop, imgname=os.path.basename(clargs[0]))
+    print("%s: %d rows in %.3f s" % (out_path, nrows, time.time() - tstart))
+
+    if rc != RC.NO_ERR:
+        print("Return code: %s" % RC.GetErrorName(rc))